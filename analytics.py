@@ -0,0 +1,139 @@
+import os
+import re
+from ingest import detect_chiller_columns
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+ANALYTICS_CDD_BASE = float(os.environ.get('ANALYTICS_CDD_BASE', '18'))  # °C; cooling degree-days count the mean temperature above it
+ANALYTICS_ROLLING_HOURS = float(os.environ.get('ANALYTICS_ROLLING_HOURS', '24'))  # Window of the rolling efficiency
+ANALYTICS_MIN_COVERAGE = 0.9  # Days with less logged time than this fraction are left out of the energy fit
+WEATHER_METRICS = ('temp', 'humidity')
+PAIR_KEYWORDS = re.compile(r'\b(supply|chws|return|chwr|ret)\b', re.IGNORECASE)
+
+# (name, supply column, return column) per chiller. Columns pair up when they are equal apart
+# from the supply/return keyword ('Chiller 1 Water Supply T' and 'Chiller 1 Water Ret T' make
+# 'Chiller 1 Water T'), otherwise in detection order.
+def pair_temperature_columns(supply_cols, return_cols):
+    def name(col):
+        return ' '.join(PAIR_KEYWORDS.sub(' ', col).split())
+    returns = {name(col).lower(): col for col in return_cols}
+    pairs = [(name(col), col, returns[name(col).lower()]) for col in supply_cols if name(col).lower() in returns]
+    if not pairs and len(supply_cols) == len(return_cols):
+        pairs = [(name(supply), supply, ret) for supply, ret in zip(supply_cols, return_cols)]
+    return pairs
+
+# For every time in `times`, the position of the latest row of `table_times` at or before it
+# that is less than `tolerance` older, else -1. Both arrays are sorted datetime64[ns].
+def asof_positions(times, table_times, tolerance):
+    positions = np.searchsorted(table_times, times, side='right') - 1
+    valid = positions >= 0
+    valid[valid] = (times[valid] - table_times[positions[valid]]) < tolerance
+    return np.where(valid, positions, -1)
+
+# Sum of `values` over the trailing `window` of time at every row (NaNs count as 0), via
+# cumulative sums, so it costs the same for any window length
+def rolling_sum(times, values, window):
+    totals = np.concatenate([[0.0], np.cumsum(np.nan_to_num(values))])
+    starts = np.searchsorted(times, times - window, side='right')
+    return totals[np.arange(1, len(times) + 1)] - totals[starts]
+
+# Chiller data aligned with outdoor conditions, for relating power to the weather. Computed
+# once per (dataset version, weather version) in NumPy over the whole range:
+# - joined: every chiller row with total power, delta-T per chiller (return - supply) and
+#   their mean, the rolling kW per °C of delta-T (proportional to kW per ton at constant
+#   chilled-water flow) and the ambient temperature and humidity of its day
+# - daily: per-day mean power, logged energy, coverage, mean delta-T and efficiency,
+#   ambient conditions and cooling degree-days
+# - summary: correlations of daily power with temperature and humidity and the energy
+#   signature (kWh per day = base + slope * CDD)
+class Analytics:
+    def __init__(self, joined, daily, summary, pairs):
+        self.joined = joined
+        self.daily = daily
+        self.summary = summary
+        self.pairs = pairs  # Chiller names of the delta-T columns
+
+    @classmethod
+    def build(cls, chillers, weather):
+        power_cols, supply_cols, return_cols = detect_chiller_columns(chillers.columns)
+        pairs = pair_temperature_columns(supply_cols, return_cols)
+        times = chillers.index.to_numpy(dtype='datetime64[ns]')
+        step = np.median(np.diff(times)) if len(times) > 1 else np.timedelta64(1, 'h')
+        interval_hours = step / np.timedelta64(1, 'h')
+        data = {'power_kw': np.nansum(np.column_stack([chillers[col].to_numpy(dtype='float64') for col in power_cols]), axis=1)
+                if power_cols else np.full(len(times), np.nan)}
+        deltas = [chillers[ret].to_numpy(dtype='float64') - chillers[supply].to_numpy(dtype='float64') for _, supply, ret in pairs]
+        for (name, _, _), delta in zip(pairs, deltas):
+            data[f'delta_t:{name}'] = delta
+        data['delta_t'] = np.nanmean(np.column_stack(deltas), axis=1) if deltas else np.full(len(times), np.nan)
+        window = np.timedelta64(int(ANALYTICS_ROLLING_HOURS * 3600), 's')
+        delta_sum = rolling_sum(times, data['delta_t'], window)
+        data['efficiency'] = np.divide(rolling_sum(times, data['power_kw'], window), delta_sum,
+                                       out=np.full(len(times), np.nan), where=delta_sum > 0)
+
+        weather_times = weather.index.to_numpy(dtype='datetime64[ns]')
+        weather_step = np.median(np.diff(weather_times)) if len(weather_times) > 1 else np.timedelta64(1, 'D')
+        positions = asof_positions(times, weather_times, weather_step)
+        for metric in WEATHER_METRICS:
+            if metric in weather.columns and len(weather_times):
+                values = weather[metric].to_numpy(dtype='float64')
+                data[f'ambient_{metric}'] = np.where(positions >= 0, values[np.maximum(positions, 0)], np.nan)
+            else:
+                data[f'ambient_{metric}'] = np.full(len(times), np.nan)
+        joined = pd.DataFrame(data, index=chillers.index)
+        daily = cls._daily(joined, interval_hours)
+        return cls(joined, daily, cls._summary(daily), [name for name, _, _ in pairs])
+
+    # Per-day aggregates of the joined rows, summed with bincount over day codes
+    @staticmethod
+    def _daily(joined, interval_hours):
+        days = joined.index.to_numpy(dtype='datetime64[D]')
+        unique_days, codes = np.unique(days, return_inverse=True)
+
+        def mean(values):
+            present = ~np.isnan(values)
+            counts = np.bincount(codes, weights=present, minlength=len(unique_days))
+            sums = np.bincount(codes, weights=np.where(present, values, 0.0), minlength=len(unique_days))
+            return np.divide(sums, counts, out=np.full(len(unique_days), np.nan), where=counts > 0), sums, counts
+
+        power_mean, power_sum, power_count = mean(joined['power_kw'].to_numpy())
+        daily = {'power_kw': power_mean, 'energy_kwh': power_sum * interval_hours,
+                 'coverage': np.minimum(power_count * interval_hours / 24, 1.0)}
+        for col in joined.columns:
+            if col.startswith(('delta_t', 'efficiency', 'ambient_')):
+                daily[col] = mean(joined[col].to_numpy())[0]
+        daily['cdd'] = np.maximum(daily['ambient_temp'] - ANALYTICS_CDD_BASE, 0)
+        return pd.DataFrame(daily, index=pd.DatetimeIndex(unique_days, name='day'))
+
+    @staticmethod
+    def _summary(daily):
+        weathered = daily[daily['ambient_temp'].notna() & daily['power_kw'].notna()]
+        summary = {'days': len(daily), 'weather_days': len(weathered), 'cdd_base': ANALYTICS_CDD_BASE,
+                   'cdd_total': float(weathered['cdd'].sum())}
+        for metric in WEATHER_METRICS:
+            values = weathered[f'ambient_{metric}']
+            summary[f'r_{metric}'] = float(np.corrcoef(weathered['power_kw'], values)[0, 1]) \
+                if len(weathered) > 2 and values.std() > 0 and weathered['power_kw'].std() > 0 else None
+        fit = weathered[weathered['coverage'] >= ANALYTICS_MIN_COVERAGE]
+        if len(fit) > 2 and fit['cdd'].std() > 0:
+            slope, base = np.polyfit(fit['cdd'].to_numpy(), fit['energy_kwh'].to_numpy(), 1)
+            summary.update(kwh_per_cdd=float(slope), base_kwh=float(base))
+        else:
+            summary.update(kwh_per_cdd=None, base_kwh=None)
+        return summary
+
+# Analytics for a chiller dataset and a weather dataset (both columnar), or None when the
+# chiller data has no timestamp index or no power columns
+def build_analytics(dataset, weather):
+    if not isinstance(dataset.index(), pd.DatetimeIndex):
+        return None
+    power_cols, supply_cols, return_cols = detect_chiller_columns(dataset.columns)
+    if not power_cols:
+        return None
+    chillers = dataset.frame(list(dict.fromkeys(power_cols + supply_cols + return_cols)))
+    weather_frame = weather.frame([metric for metric in WEATHER_METRICS if metric in weather.columns]) \
+        if weather is not None else pd.DataFrame(index=pd.DatetimeIndex([]))
+    return Analytics.build(chillers, weather_frame)
@@ -0,0 +1,186 @@
+import json
+import os
+from columnar import ColumnarDataset, write_columnar
+from ingest import detect_chiller_columns
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+ANOMALY_WINDOW_HOURS = float(os.environ.get('ANOMALY_WINDOW_HOURS', '24'))  # Trailing window of the rolling statistics
+ANOMALY_MIN_PERIODS = 12  # Values a window needs before its statistics are trusted
+ANOMALY_BLOCK_SIZE = 1 << 20  # Window values sorted at a time
+ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', '4'))  # |value - mean| / std
+ANOMALY_MAD_THRESHOLD = float(os.environ.get('ANOMALY_MAD_THRESHOLD', '5'))  # 0.6745 * |value - median| / MAD
+ANOMALY_RATE_THRESHOLD = float(os.environ.get('ANOMALY_RATE_THRESHOLD', '6'))  # Robust score of the change per hour
+ANOMALY_RATE_LIMITS = {  # Changes per hour beyond these are flagged whatever their score; 0 turns the limit off
+    'power': float(os.environ.get('ANOMALY_POWER_RATE_LIMIT', '0')),  # kW per hour
+    'temperature': float(os.environ.get('ANOMALY_TEMP_RATE_LIMIT', '3')),  # °C per hour
+}
+ANOMALY_RULES = ('zscore', 'mad', 'rate')
+ANOMALY_DIR = 'anomalies'
+
+# Median of each row of a block whose non-NaN entries number count[i]; NaNs sort last
+def _block_median(block, count):
+    ordered = np.sort(block, axis=1)
+    lower = np.take_along_axis(ordered, np.maximum((count - 1) // 2, 0)[:, None], axis=1)[:, 0]
+    upper = np.take_along_axis(ordered, np.maximum(count // 2, 0)[:, None], axis=1)[:, 0]
+    return (lower + upper) / 2
+
+# Mean, standard deviation, median and MAD of the `window` rows before each row (NaN for the
+# first rows and windows with fewer than ANOMALY_MIN_PERIODS values). Medians are taken over
+# blocks of sliding windows at once, so the whole range is scored in a few NumPy calls.
+def _trailing_stats(values, window):
+    series = pd.Series(values)
+    rolling = series.rolling(window, min_periods=ANOMALY_MIN_PERIODS)
+    mean, std = rolling.mean().shift(1).to_numpy(), rolling.std().shift(1).to_numpy()
+    median, mad = np.full(len(values), np.nan), np.full(len(values), np.nan)
+    if len(values) > window:
+        windows = np.lib.stride_tricks.sliding_window_view(values[:-1], window)  # windows[i] precedes row i + window
+        step = max(ANOMALY_BLOCK_SIZE // window, 1)
+        for lo in range(0, len(windows), step):
+            block = windows[lo:lo + step]
+            count = window - np.isnan(block).sum(axis=1)
+            block_median = _block_median(block, count)
+            block_mad = _block_median(np.abs(block - block_median[:, None]), count)
+            trusted = count >= ANOMALY_MIN_PERIODS
+            median[window + lo:window + lo + len(block)] = np.where(trusted, block_median, np.nan)
+            mad[window + lo:window + lo + len(block)] = np.where(trusted, block_mad, np.nan)
+    return mean, std, median, mad
+
+# 0.6745 * (value - median) / MAD against the trailing window, NaN where the MAD is 0
+def _robust_score(values, median, mad):
+    return 0.6745 * (values - median) / np.where(mad > 0, mad, np.nan)
+
+# Flagged rows of one column: value, z-score, robust (MAD) score, change per hour and its
+# robust score, and the rules that fired, indexed by timestamp. Each row is compared with the
+# window before it, so a spike does not hide itself and new rows can be scored alone. The
+# change per hour is scored against recent changes, which catches steps hidden in a daily cycle.
+def _detect(series, kind, window):
+    values = series.to_numpy(dtype='float64')
+    hours = np.diff(series.index.to_numpy(dtype='datetime64[ns]')) / np.timedelta64(1, 'h')
+    rate = np.concatenate([[np.nan], np.diff(values) / np.where(hours > 0, hours, np.nan)])
+    mean, std, median, mad = _trailing_stats(values, window)
+    _, _, rate_median, rate_mad = _trailing_stats(rate, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (values - mean) / np.where(std > 0, std, np.nan)
+        robust = _robust_score(values, median, mad)
+        rate_score = _robust_score(rate, rate_median, rate_mad)
+    limit = ANOMALY_RATE_LIMITS[kind]
+    fired = {'zscore': np.abs(zscore) > ANOMALY_Z_THRESHOLD,
+             'mad': np.abs(robust) > ANOMALY_MAD_THRESHOLD,
+             'rate': (np.abs(rate_score) > ANOMALY_RATE_THRESHOLD) | ((np.abs(rate) > limit) if limit > 0 else False)}
+    flagged = fired['zscore'] | fired['mad'] | fired['rate']
+    rules = [','.join(rule for rule in ANOMALY_RULES if fired[rule][i]) for i in np.flatnonzero(flagged)]
+    return pd.DataFrame({'value': values[flagged], 'zscore': zscore[flagged], 'mad_score': robust[flagged],
+                         'rate_per_hour': rate[flagged], 'rate_score': rate_score[flagged], 'rules': rules},
+                        index=series.index[flagged])
+
+# Flagged rows of all columns in time order, with the column name as a field
+def _findings(frame, columns, window):
+    found = [_detect(frame[col], kind, window).assign(column=col) for col, kind in columns.items()]
+    found = [table for table in found if len(table)]
+    if not found:
+        return pd.DataFrame({'column': pd.Series(dtype=object), 'value': pd.Series(dtype='float64'),
+                             'zscore': pd.Series(dtype='float64'), 'mad_score': pd.Series(dtype='float64'),
+                             'rate_per_hour': pd.Series(dtype='float64'), 'rate_score': pd.Series(dtype='float64'),
+                             'rules': pd.Series(dtype=object)},
+                            index=pd.DatetimeIndex([], name='time'))
+    # Text columns stay object like the empty table's, whatever string dtype pandas infers
+    table = pd.concat(found)[['column', 'value', 'zscore', 'mad_score', 'rate_per_hour', 'rate_score', 'rules']].astype(
+        {'column': object, 'rules': object})
+    table.index.name = 'time'
+    return table.sort_index(kind='stable')
+
+# Anomalies (spikes, drift, sudden steps) in the detected power, supply and return columns,
+# found at ingest with rolling z-score, rolling median/MAD and rate-of-change checks over a
+# window of the rows covering ANOMALY_WINDOW_HOURS at the data's usual spacing. Scores only
+# look back one window, so an append re-scores the rows from the first changed timestamp
+# (with a window of context before it) and keeps the earlier findings.
+class Anomalies:
+    def __init__(self, findings, columns, window):
+        self.findings = findings  # DataFrame of flagged rows, see _findings
+        self.columns = columns  # Column -> kind ('power' or 'temperature')
+        self.window = window  # Rows per window
+        self._points = {}  # Column -> (times, values, rules, strength) arrays, split on first use
+
+    # Detected numeric power, supply and return columns of a frame -> kind
+    @staticmethod
+    def columns_of(frame):
+        power_cols, supply_cols, return_cols = detect_chiller_columns(frame.columns)
+        kinds = {**{col: 'temperature' for col in supply_cols + return_cols}, **{col: 'power' for col in power_cols}}
+        return {col: kind for col, kind in kinds.items() if pd.api.types.is_numeric_dtype(frame[col])}
+
+    @classmethod
+    def build(cls, frame):
+        columns = cls.columns_of(frame)
+        step = frame.index.dropna().to_series().diff().median()
+        hours = step / pd.Timedelta(hours=1) if pd.notna(step) and step > pd.Timedelta(0) else 1.0
+        window = max(int(round(ANOMALY_WINDOW_HOURS / hours)), ANOMALY_MIN_PERIODS)
+        return cls(_findings(frame, columns, window), columns, window)
+
+    # Anomalies for `frame` after rows from `changed_from` onwards were added or replaced; new
+    # rows that bring other columns (e.g. another chiller) have everything detected again
+    def update(self, frame, changed_from):
+        if self.columns_of(frame) != self.columns:
+            return Anomalies.build(frame)
+        changed_from = pd.Timestamp(changed_from)
+        # The change per hour of the first row of context needs the row before it as well
+        start = max(int(frame.index.searchsorted(changed_from, side='left')) - self.window - 1, 0)
+        recent = _findings(frame.iloc[start:], self.columns, self.window)
+        kept = self.findings[self.findings.index < changed_from]
+        return Anomalies(pd.concat([kept, recent[recent.index >= changed_from]]), self.columns, self.window)
+
+    # (times, values, rules) of one column's flagged rows in the x range (all of them for None),
+    # in time order; with a limit, only that many of the strongest are returned
+    def points(self, column, x_range=None, limit=None):
+        if column not in self._points:
+            table = self.findings[self.findings['column'] == column]
+            self._points[column] = (table.index.to_numpy(), table['value'].to_numpy(), table['rules'].to_numpy(dtype=object),
+                                    np.nan_to_num(table[['zscore', 'mad_score', 'rate_score']].abs().to_numpy()).max(axis=1, initial=0))
+        times, values, rules, strength = self._points[column]
+        lo, hi = 0, len(times)
+        if x_range is not None:
+            lo = int(np.searchsorted(times, np.datetime64(pd.Timestamp(x_range[0])), side='left'))
+            hi = int(np.searchsorted(times, np.datetime64(pd.Timestamp(x_range[1])), side='right'))
+        selected = np.arange(lo, hi)
+        if limit is not None and len(selected) > limit:
+            selected = lo + np.sort(np.argsort(-strength[lo:hi], kind='stable')[:limit])
+        return times[selected], values[selected], rules[selected]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        write_columnar(self.findings, os.path.join(directory, 'findings'))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'columns': self.columns, 'window': self.window}, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(ColumnarDataset(os.path.join(directory, 'findings')).frame(), meta['columns'], meta['window'])
+
+# Inserts the points (px, py) into a sorted (x, y) trace, replacing samples at the same x, so
+# flagged rows stay on a downsampled line
+def merge_points(x, y, px, py):
+    if not len(px):
+        return x, y
+    all_x, all_y = np.concatenate([px, x]), np.concatenate([py, y])
+    _, first = np.unique(all_x, return_index=True)  # Sorted by x; the flagged point wins a tie
+    return all_x[first], all_y[first]
+
+# Returns the persisted anomalies of a dataset version, detecting and saving them on first use.
+# With the previous version's anomalies, only rows from changed_from onward are scored.
+def load_or_build_anomalies(dataset, previous=None, changed_from=None):
+    if not isinstance(dataset.index(), pd.DatetimeIndex):
+        return None
+    directory = os.path.join(dataset.directory, ANOMALY_DIR)
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return Anomalies.load(directory)
+    if previous is not None and changed_from is not None:
+        anomalies = previous.update(dataset.frame(), changed_from)
+    else:
+        anomalies = Anomalies.build(dataset.frame())
+    anomalies.save(directory)
+    return anomalies
@@ -1,4 +1,4 @@
-from flask import Flask, redirect, session
+from flask import Flask, Response, redirect, session, request, jsonify
 from dash import Dash, html
 import dash_bootstrap_components as dbc
 import os
@@ -21,7 +21,13 @@ dashboard_app = Dash(__name__, server=server, url_base_pathname='/dashboard/',
 
 # Import and setup app configurations from separate modules
 from login_app import setup_login_app
-from dashboard_app import setup_dashboard_app
+from dashboard_app import (setup_dashboard_app, ingest_upload_stream, datasets, preload_heavy_modules, weather_dataset_key,
+                           cache, weather_store)
+from cache_backends import cache_stats
+from dataset_store import session_dataset_key
+from export import parse_export_args, export_frames, stream_csv, stream_parquet
+from rollups import load_or_build_rollups
+from metrics import registry, profiling_enabled, set_profiling, PROFILE_DIR
 
 # Configure login app
 setup_login_app(login_app)
@@ -43,6 +49,8 @@ def login():
 def dashboard():
     if not session.get('logged_in'):
         return redirect(LOGIN_PATH)
+    session_dataset_key()  # Assign the session its dataset key before any callback runs
+    preload_heavy_modules()  # pandas, plotly and requests load while the browser fetches the page assets
     return dashboard_app.index()
 
 # Route handler for dashboard sub-paths
@@ -50,8 +58,84 @@ def dashboard():
 def serve_dashboard(path):
     if not session.get('logged_in'):
         return redirect(LOGIN_PATH)
+    session_dataset_key()
+    preload_heavy_modules()
     return dashboard_app.index()
 
+# Route handler for streamed CSV uploads (body is the raw file, parsed in chunks on disk)
+@server.route('/upload', methods=['POST'])
+def upload():
+    if not session.get('logged_in'):
+        return jsonify(status='error', message='Please log in to upload data.'), 401
+    return jsonify(ingest_upload_stream(request.stream, request.args.get('filename', ''), request.args.get('mode', 'replace')))
+
+# Route handler for downloads of the session's dataset as CSV or Parquet, streamed in chunks.
+# Query parameters select columns, a time range (start, end), a rollup granularity and joined
+# weather columns (weather=1); see export.parse_export_args.
+@server.route('/export')
+def export():
+    if not session.get('logged_in'):
+        return redirect(LOGIN_PATH)
+    key = session_dataset_key()
+    dataset = datasets.open(key)
+    if dataset is None:
+        return jsonify(status='error', message='Upload a dataset to export it.'), 404
+    try:
+        options = parse_export_args(request.args, dataset)
+    except ValueError as e:
+        return jsonify(status='error', message=str(e)), 400
+    rollups = datasets.artifact(key, 'rollups', load_or_build_rollups) if options['granularity'] != 'raw' else None
+    weather = datasets.open(weather_dataset_key()) if options['weather'] else None
+    frames = export_frames(dataset, options, rollups, weather)
+    body = stream_parquet(frames) if options['format'] == 'parquet' else stream_csv(frames)
+    return Response(body, mimetype=options['mimetype'],
+                    headers={'Content-Disposition': f'attachment; filename="{options["filename"]}"'})
+
+# Route handler for dataset memory usage (held by this process vs on disk), for sizing workers
+@server.route('/dataset-stats')
+def dataset_stats():
+    if not session.get('logged_in'):
+        return redirect(LOGIN_PATH)
+    return jsonify(datasets.stats())
+
+# Route handler for the shared caches: rendered figures (entries, bytes, limits and this
+# process's hits, misses and evictions) and the weather day store
+@server.route('/cache-stats')
+def cache_stats_route():
+    if not session.get('logged_in'):
+        return redirect(LOGIN_PATH)
+    return jsonify(figures=cache_stats(cache), weather=weather_store.stats())
+
+# Route handler for Prometheus scrapes: callback, cache, upstream and job metrics of all worker
+# processes, plus this process's dataset memory and the size of the shared figure cache. Set
+# METRICS_TOKEN to require a bearer token.
+@server.route('/metrics')
+def metrics():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    stats, pid = datasets.stats(), str(os.getpid())
+    gauges = [('data_tool_dataset_bytes', 'Bytes of derived data and decoded columns this process holds (resident) and of the datasets on disk (disk)',
+               [({'pid': pid, 'state': 'resident'}, stats['resident_bytes']), ({'state': 'disk'}, stats['disk_bytes'])]),
+              ('data_tool_datasets', 'Dataset keys this process holds in memory (resident) and datasets on disk (disk)',
+               [({'pid': pid, 'state': 'resident'}, stats['resident_keys']), ({'state': 'disk'}, stats['disk_datasets'])]),
+              ('data_tool_dataset_memory_budget_bytes', 'DATASET_MEMORY_BUDGET_MB in bytes', [({'pid': pid}, stats['memory_budget_bytes'])])]
+    figures = cache_stats(cache)
+    if 'entries' in figures:  # Shared backends only; the file is the same for every process
+        gauges += [('data_tool_cache_entries', 'Entries in the shared figure cache', [({'cache': 'figure'}, figures['entries'])]),
+                   ('data_tool_cache_bytes', 'Bytes of values in the shared figure cache', [({'cache': 'figure'}, figures['bytes'])])]
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Route handler for the sampling profiler toggle (?enable=1 or 0); while on, the stacks of slow
+# callbacks are written to PROFILE_DIR as folded flame-graph data
+@server.route('/profiler')
+def profiler():
+    if not session.get('logged_in'):
+        return redirect(LOGIN_PATH)
+    if 'enable' in request.args:
+        set_profiling(request.args['enable'] == '1')
+    return jsonify(enabled=profiling_enabled(), directory=PROFILE_DIR)
+
 # Route handler for logout
 @server.route('/logout')
 def logout():
@@ -0,0 +1,62 @@
+/* Streams large CSV files to the /upload endpoint instead of base64-encoding them through dcc.Upload */
+(function () {
+    function setProps(id, props) {
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props(id, props);
+        }
+    }
+
+    function showProgress(value, label) {
+        setProps('stream-upload-progress', {
+            value: value,
+            label: label,
+            style: {display: 'flex', marginTop: '20px', height: '20px'}
+        });
+    }
+
+    function uploadFile(file) {
+        var xhr = new XMLHttpRequest();
+        var mode = document.querySelector('#upload-mode input:checked');
+        xhr.open('POST', '/upload?filename=' + encodeURIComponent(file.name) + '&mode=' + (mode ? mode.value : 'replace'));
+        xhr.setRequestHeader('Content-Type', 'text/csv');
+
+        xhr.upload.onprogress = function (event) {
+            if (event.lengthComputable) {
+                var percent = Math.round(event.loaded / event.total * 100);
+                showProgress(percent, percent < 100 ? percent + '%' : 'Uploaded');
+            }
+        };
+        xhr.onload = function () {
+            var result;
+            try {
+                result = JSON.parse(xhr.responseText);
+            } catch (e) {
+                result = {status: 'error', filename: file.name, message: 'Upload failed with status ' + xhr.status + '.'};
+            }
+            // A queued upload is parsed by a background job whose progress the dashboard polls
+            showProgress(result.status === 'queued' ? 0 : 100, result.status === 'queued' ? 'Queued' : 'Failed');
+            setProps('stream-upload-store', {data: result});
+        };
+        xhr.onerror = function () {
+            setProps('stream-upload-store', {data: {status: 'error', filename: file.name, message: 'Network error during upload.'}});
+        };
+
+        showProgress(0, '0%');
+        xhr.send(file);
+    }
+
+    document.addEventListener('click', function (event) {
+        if (!event.target.closest || !event.target.closest('#stream-upload-button')) {
+            return;
+        }
+        var input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.csv';
+        input.onchange = function () {
+            if (input.files.length) {
+                uploadFile(input.files[0]);
+            }
+        };
+        input.click();
+    });
+})();
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+
+# Constants
+START = '2023-07-20'  # First timestamp, like Test_file.csv
+WEATHER_CONDITIONS = ['Clear', 'Partially cloudy', 'Rain, Partially cloudy', 'Overcast']
+
+# Synthetic chiller log in the schema of Test_file.csv (Date, Time, 'Chiller N Power' columns,
+# then 'Chiller N Water Supply T' / 'Chiller N Water Ret T' pairs) with exactly `rows` rows.
+# `gaps` outages of gap_rows missing timestamps each are cut out at random positions.
+def chiller_frame(rows, chillers=2, gaps=0, gap_rows=24, freq='h', seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(START, periods=rows + gaps * gap_rows, freq=freq)
+    if gaps:
+        keep = np.ones(len(timestamps), dtype=bool)
+        for start in rng.choice(rows, size=gaps, replace=False):
+            keep[start:start + gap_rows] = False
+        timestamps = timestamps[keep][:rows]
+    hours = (timestamps.hour + timestamps.minute / 60).to_numpy()
+    daily = np.sin((hours - 9) / 24 * 2 * np.pi)  # Load peaks in the afternoon
+    data = {'Date': timestamps.strftime('%m/%d/%Y'), 'Time': timestamps.strftime('%H:%M:%S')}
+    powers = []
+    for n in range(1, chillers + 1):
+        power = 150 + 25 * daily + rng.normal(0, 4, len(timestamps)).cumsum() * 0.01 + rng.normal(0, 2, len(timestamps))
+        powers.append(power)
+        data[f'Chiller {n} Power'] = np.round(power, 2)
+    for n, power in enumerate(powers, 1):
+        supply = 39.7 + rng.normal(0, 0.05, len(timestamps))
+        data[f'Chiller {n} Water Supply T'] = np.round(supply, 3)
+        data[f'Chiller {n} Water Ret T'] = np.round(supply + 0.015 * power, 3)
+    return pd.DataFrame(data)
+
+def write_chiller_csv(path, rows, chillers=2, gaps=0, gap_rows=24, freq='h', seed=0):
+    chiller_frame(rows, chillers, gaps, gap_rows, freq, seed).to_csv(path, index=False)
+    return path
+
+# Day records shaped like the 'days' list of a Visual Crossing timeline response (include=days)
+def weather_days(start_date, end_date, seed=0):
+    start, end = (datetime.strptime(value, '%Y-%m-%d').date() for value in (start_date, end_date))
+    rng = np.random.default_rng(seed + start.toordinal())
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        season = np.cos((day.timetuple().tm_yday - 135) / 365 * 2 * np.pi)
+        temp = round(28 + 6 * season + rng.normal(0, 1.5), 1)
+        days.append({
+            'datetime': day.isoformat(),
+            'datetimeEpoch': int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()),
+            'tempmax': round(temp + 5 + rng.uniform(0, 2), 1), 'tempmin': round(temp - 5 - rng.uniform(0, 2), 1),
+            'temp': temp, 'feelslike': round(temp + 1.5, 1), 'dew': round(temp - 8 + rng.normal(0, 1), 1),
+            'humidity': round(float(np.clip(60 - 15 * season + rng.normal(0, 8), 10, 100)), 1),
+            'precip': round(float(max(rng.normal(0, 3), 0)), 1), 'precipprob': float(rng.choice([0, 3.2, 100])),
+            'windgust': round(float(rng.uniform(10, 40)), 1), 'windspeed': round(float(rng.uniform(5, 25)), 1),
+            'winddir': round(float(rng.uniform(0, 360)), 1), 'pressure': round(1008 + rng.normal(0, 3), 1),
+            'cloudcover': round(float(rng.uniform(0, 100)), 1), 'visibility': round(float(rng.uniform(3, 10)), 1),
+            'solarradiation': round(float(rng.uniform(150, 300)), 1), 'uvindex': int(rng.integers(5, 11)),
+            'conditions': WEATHER_CONDITIONS[int(rng.integers(len(WEATHER_CONDITIONS)))],
+            'icon': 'partly-cloudy-day', 'source': 'obs',
+        })
+    return days
+
+# Full timeline response body for a location and inclusive date range
+def weather_response(location, start_date, end_date, seed=0):
+    return {'queryCost': (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1,
+            'resolvedAddress': location, 'address': location, 'timezone': 'Asia/Kolkata', 'tzoffset': 5.5,
+            'days': weather_days(start_date, end_date, seed)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic chiller CSV in the schema of Test_file.csv.')
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--chillers', type=int, default=2)
+    parser.add_argument('--gaps', type=int, default=0, help='number of outages cut out of the timeline')
+    parser.add_argument('--gap-rows', type=int, default=24, help='missing timestamps per outage')
+    parser.add_argument('--freq', default='h', help='pandas frequency of the timestamps')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_chiller_csv(args.path, args.rows, args.chillers, args.gaps, args.gap_rows, args.freq, args.seed)
+    print(f'{args.path}: {os.path.getsize(args.path) / 1e6:.1f} MB', file=sys.stderr)
@@ -0,0 +1,313 @@
+import argparse
+import base64
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+import requests
+from requests.adapters import BaseAdapter
+
+# Constants
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+TIME_TOLERANCE = 0.25  # Allowed slowdown against the baseline before a case counts as a regression
+SIZE_TOLERANCE = 0.10  # Same for peak memory and payload size, which vary far less between runs
+TIME_FLOOR = 0.01  # Seconds of slowdown always put down to noise (matters for millisecond cases)
+REFERENCE_ROWS = 100_000  # Size of the fixed reference workload case timings are stored relative to
+REFERENCE_REPEATS = 3
+PEAK_FLOOR_MB = 0.5  # Same for peak memory, where small cases vary with what the allocator reuses
+WEATHER_MAX_DAYS = 36_500  # Weather cases cover one day per 24 chiller rows, up to a century
+JOB_TIMEOUT = 600
+
+# Cases: name -> function(bench) returning the response payload in bytes (or None). Each one
+# drives the same entry points the browser hits, so timings include Dash (de)serialization.
+CASES = {}
+
+def case(name):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+# Per-run state: a Flask test client logged in with its own dataset key, isolated data dirs
+# and the synthetic inputs of one size
+class Bench:
+    def __init__(self, work_dir, rows, chillers, gaps):
+        from app import server
+        import dashboard_app
+        self.app = dashboard_app
+        self.server = server
+        self.work_dir = work_dir
+        self.rows = rows
+        self.key = uuid.uuid4().hex
+        self.client = server.test_client()
+        with self.client.session_transaction() as session:
+            session['logged_in'] = True
+            session['dataset_id'] = self.key
+        import generate
+        self.csv_path = generate.write_chiller_csv(os.path.join(work_dir, f'chillers-{rows}.csv'), rows, chillers, gaps)
+        with open(self.csv_path, 'rb') as f:
+            self.contents = 'data:text/csv;base64,' + base64.b64encode(f.read()).decode()
+        frame = generate.chiller_frame(rows, chillers, gaps)
+        self.columns = [col for col in frame.columns if col not in ('Date', 'Time')]
+        self.start, self.end = (f"{frame['Date'].iloc[i]} {frame['Time'].iloc[i]}" for i in (0, -1))
+        weather_days = max(7, min(rows // 24, WEATHER_MAX_DAYS))
+        self.weather_start = date(2000, 1, 1).isoformat()
+        self.weather_end = (date(2000, 1, 1) + timedelta(days=weather_days - 1)).isoformat()
+
+    # Posts one callback like the Dash renderer does; returns (response JSON, response bytes)
+    def callback(self, outputs, inputs, state=(), changed=()):
+        ids = [output.split('.') for output in outputs]
+        body = {'output': '..' + '...'.join(outputs) + '..' if len(outputs) > 1 else outputs[0],
+                'outputs': [{'id': i, 'property': p} for i, p in ids] if len(outputs) > 1 else
+                           {'id': ids[0][0], 'property': ids[0][1]},
+                'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+                'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+                'changedPropIds': list(changed)}
+        response = self.client.post('/dashboard/_dash-update-component', json=body)
+        if response.status_code == 204:
+            return {}, 0
+        if response.status_code != 200:
+            raise RuntimeError(f'{outputs[0]} callback failed with status {response.status_code}: {response.data[:500]!r}')
+        return response.get_json()['response'], len(response.data)
+
+    def chiller_graphs(self, granularity='raw', relayout=None, triggered='chiller-granularity.value'):
+        from dashboard_app import CHILLER_GRAPHS
+        from ingest import detect_chiller_columns
+        power, supply, ret = detect_chiller_columns(self.columns)
+        outputs = [f'{graph_id}.figure' for graph_id, _, _, _ in CHILLER_GRAPHS] + \
+                  [f'{graph_id}-traces.data' for graph_id, _, _, _ in CHILLER_GRAPHS]
+        inputs = [(check_id, 'value', cols) for (_, _, _, check_id), cols in zip(CHILLER_GRAPHS, (power, supply, ret))] + \
+                 [(graph_id, 'relayoutData', relayout if i == 0 else None) for i, (graph_id, _, _, _) in enumerate(CHILLER_GRAPHS)] + \
+                 [('chiller-granularity', 'value', granularity)]
+        state = [(f'{graph_id}-traces', 'data', None) for graph_id, _, _, _ in CHILLER_GRAPHS]
+        self.app.cache.clear()  # Measure rendering, not the figure cache
+        return self.callback(outputs, inputs, state, [triggered])[1]
+
+    def wait_for_job(self, job_id):
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while True:
+            status = self.app.jobs.status(job_id)
+            if status and status['state'] in self.app.FINISHED_STATES:
+                if status['state'] != 'done':
+                    raise RuntimeError(f"job {job_id} ended as {status['state']}: {status.get('message')}")
+                return status
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'job {job_id} did not finish within {JOB_TIMEOUT} s')
+            time.sleep(0.02)
+
+    # Uploaded dataset and weather frame the graph cases read; stored once per run
+    def prepare(self):
+        upload(self)
+        import generate
+        import pandas as pd
+        df = pd.DataFrame(generate.weather_days(self.weather_start, self.weather_end))
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        site = self.app.WEATHER_SITES[0]
+        self.weather_handle = {'sites': [self.app.store_weather_frame(df.set_index('datetime'), site, f"{self.key}-weather-{site['id']}")]}
+
+# dcc.Upload of the synthetic CSV through the upload callback, waiting for the background job
+# to parse and store it, then the callback rendering its summary
+@case('upload')
+def upload(bench):
+    upload_inputs = [('upload-data', 'contents', [bench.contents]), ('reset-button', 'n_clicks', None),
+                     ('stream-upload-store', 'data', None), ('upload-job-result', 'data', None)]
+    upload_state = [('upload-data', 'filename', [os.path.basename(bench.csv_path)]), ('upload-mode', 'value', 'replace')]
+    outputs = ['upload-output.children', 'upload-job.data']
+    response, _ = bench.callback(outputs, upload_inputs, upload_state, ['upload-data.contents'])
+    job = response['upload-job']['data']
+    status = bench.wait_for_job(job['id'])
+    upload_inputs[-1] = ('upload-job-result', 'data', {**job, **status})
+    return bench.callback(outputs, upload_inputs, upload_state, ['upload-job-result.data'])[1]
+
+@case('prepare_data')
+def prepare_data(bench):
+    with bench.server.test_request_context():
+        from flask import session
+        session['dataset_id'] = bench.key
+        bench.app.prepare_data(bench.columns)
+    return None
+
+@case('chiller_graphs')
+def chiller_graphs(bench):
+    return bench.chiller_graphs()
+
+# Power graph zoomed into the middle tenth of the timeline
+@case('chiller_zoom')
+def chiller_zoom(bench):
+    import pandas as pd
+    start, end = pd.Timestamp(bench.start), pd.Timestamp(bench.end)
+    relayout = {'xaxis.range[0]': str(start + (end - start) * 0.45), 'xaxis.range[1]': str(start + (end - start) * 0.55)}
+    return bench.chiller_graphs(relayout=relayout, triggered='chiller-power-graph.relayoutData')
+
+@case('chiller_daily')
+def chiller_daily(bench):
+    return bench.chiller_graphs('daily')
+
+@case('weather_graph')
+def weather_graph(bench):
+    inputs = [('weather-data-store', 'data', bench.weather_handle), ('weather-metrics', 'value', ['temp', 'humidity', 'windspeed']),
+              ('weather-view', 'value', 'overlay')]
+    return bench.callback(['weather-graph.figure', 'weather-graph-traces.data'], inputs,
+                          [('weather-graph-traces', 'data', None)], ['weather-data-store.data'])[1]
+
+# The weather job from API responses to the stored frame: windowed client requests answered
+# with canned timeline responses, the day store, and the JSON-to-DataFrame conversion
+@case('weather_convert')
+def weather_convert(bench):
+    from jobs import JobContext
+    from weather_store import WeatherStore
+    bench.app.weather_store = WeatherStore(os.path.join(bench.work_dir, f'weather-{uuid.uuid4().hex}.sqlite3'))
+    adapter = CannedWeatherAdapter()
+    bench.app.weather_client.session.mount('https://', adapter)
+    bench.app.weather_client.session.mount('http://', adapter)
+    job_dir = os.path.join(bench.work_dir, 'weather-jobs')
+    os.makedirs(job_dir, exist_ok=True)
+    site = bench.app.WEATHER_SITES[0]
+    result = bench.app.run_weather_job(JobContext(job_dir, uuid.uuid4().hex), [(site, f"{bench.key}-weather-{site['id']}")],
+                                       bench.weather_start, bench.weather_end)
+    if result['status'] != 'ok':
+        raise RuntimeError(result['message'])
+    return None
+
+# Transport adapter answering timeline requests (.../<location>/<start>/<end>) with canned
+# responses, so the real client, retries and windowing run without the network
+class CannedWeatherAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        import generate
+        location, start_date, end_date = requests.utils.unquote(request.path_url.split('?')[0]).rsplit('/', 3)[1:]
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(generate.weather_response(location, start_date, end_date)).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+# Median seconds of a fixed workload mixing the work the cases do (CSV parsing, NumPy sorting
+# and reductions, JSON encoding). Case timings are stored as multiples of it, so a baseline
+# recorded on one machine can be checked on a faster or slower one; it is timed right before
+# each case, so the ratio also follows changes in the machine's load during a run.
+def reference_seconds(repeats=REFERENCE_REPEATS):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=REFERENCE_ROWS)
+    csv = pd.DataFrame({'a': values, 'b': values * 2}).to_csv(index=False)
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        frame = pd.read_csv(io.StringIO(csv))
+        np.sort(frame['a'].to_numpy())
+        frame.groupby(np.arange(len(frame)) // 100).agg(['min', 'max', 'mean'])
+        json.dumps(frame['b'].tolist()[:REFERENCE_ROWS // 4])
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+# Runs a case once to warm up (first-call imports and caches), `repeats` times for its median
+# wall time, then once more under tracemalloc for its peak Python memory (tracing slows
+# allocation-heavy code, so it is not timed)
+def measure(func, bench, repeats):
+    func(bench)
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        payload = func(bench)
+        times.append(time.perf_counter() - started)
+    gc.collect()  # Garbage left by the timed runs would otherwise count toward the peak
+    tracemalloc.start()
+    try:
+        func(bench)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(statistics.median(times), 4), 'peak_mb': round(peak / 2 ** 20, 2),
+            'payload_kb': round(payload / 1024, 1) if payload is not None else None}
+
+# Regressions of a result against its baseline entry, as human-readable strings. The baseline
+# time is its `relative` multiple of the reference workload timed on this machine.
+def compare(result, baseline, reference, time_tolerance, size_tolerance):
+    regressions = []
+    if baseline.get('relative') and result['seconds'] > baseline['relative'] * reference * (1 + time_tolerance) and \
+            result['seconds'] - baseline['relative'] * reference > TIME_FLOOR:
+        regressions.append(f"relative {baseline['relative']} -> {result['relative']} "
+                           f"(+{(result['relative'] / baseline['relative'] - 1) * 100:.0f}%)")
+    for field, tolerance, floor in (('peak_mb', size_tolerance, PEAK_FLOOR_MB), ('payload_kb', size_tolerance, 0)):
+        old, new = baseline.get(field), result.get(field)
+        if old and new is not None and new > old * (1 + tolerance) and new - old > floor:
+            regressions.append(f'{field} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)')
+    return regressions
+
+def main(work_dir):
+    parser = argparse.ArgumentParser(description='Benchmark the upload, graph and weather hot paths.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='dataset sizes (10^4 to 10^7)')
+    parser.add_argument('--chillers', type=int, default=2)
+    parser.add_argument('--gaps', type=int, default=0)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='record these results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--size-tolerance', type=float, default=SIZE_TOLERANCE)
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        baseline = {}
+    results, regressions = {}, []
+    print(f"{'case':<28}{'seconds':>10}{'x ref':>8}{'peak MB':>10}{'payload KB':>12}  vs baseline")
+    for rows in args.rows:
+        bench = Bench(work_dir, rows, args.chillers, args.gaps)
+        bench.prepare()
+        for name in args.cases:
+            label = f'{name}[{rows}]'
+            reference = reference_seconds()
+            result = measure(CASES[name], bench, args.repeats)
+            result['relative'] = round(result['seconds'] / reference, 3)
+            results[label] = result
+            found = compare(result, baseline.get(label, {}), reference, args.time_tolerance, args.size_tolerance)
+            regressions += [f'{label}: {regression}' for regression in found]
+            status = 'REGRESSION' if found else ('ok' if label in baseline else 'new')
+            payload = '-' if result['payload_kb'] is None else f"{result['payload_kb']:.1f}"
+            print(f"{label:<28}{result['seconds']:>10.3f}{result['relative']:>8.2f}{result['peak_mb']:>10.1f}{payload:>12}  {status}",
+                  flush=True)
+    if args.save_baseline:
+        # Absolute seconds only describe this machine, so the baseline keeps the relative time
+        saved = {label: {field: value for field, value in result.items() if field != 'seconds'} for label, result in results.items()}
+        with open(args.baseline, 'w') as f:
+            json.dump({**baseline, **saved}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline saved to {args.baseline}')
+    elif regressions:
+        print('\nRegressions:\n' + '\n'.join(regressions))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    # Data, upload, job, weather and cache files of a run live in one temporary directory; the paths
+    # are set before the app is imported so job worker processes inherit them
+    with tempfile.TemporaryDirectory(prefix='data_tool_bench_') as work_dir:
+        for variable, name in (('DATA_TOOL_DATASET_DIR', 'datasets'), ('DATA_TOOL_UPLOAD_DIR', 'uploads'),
+                               ('DATA_TOOL_JOB_DIR', 'jobs'), ('WEATHER_DB_PATH', 'weather.sqlite3'),
+                               ('DATA_TOOL_CACHE_PATH', 'cache.sqlite3')):
+            os.environ[variable] = os.path.join(work_dir, name)
+        os.environ['WEATHER_RATE_LIMIT'] = '0'  # Canned responses are instant; the budget would only add sleeps
+        sys.path[:0] = [ROOT, os.path.dirname(os.path.abspath(__file__))]
+        status = main(work_dir)
+        import dashboard_app
+        if dashboard_app.jobs._executor is not None:
+            dashboard_app.jobs._executor.shutdown()
+    sys.exit(status)
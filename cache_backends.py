@@ -0,0 +1,142 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from flask_caching.backends.base import BaseCache
+from metrics import registry
+
+# Constants
+CACHE_BACKEND = os.environ.get('DATA_TOOL_CACHE_BACKEND', 'sqlite')  # 'sqlite' (shared by all workers) or 'simple' (per process)
+CACHE_PATH = os.environ.get('DATA_TOOL_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'data_tool_cache.sqlite3'))
+CACHE_MAX_BYTES = int(float(os.environ.get('DATA_TOOL_CACHE_MAX_MB', '256')) * 2**20)  # Least recently used entries are evicted beyond this
+CACHE_MAX_AGE = float(os.environ.get('DATA_TOOL_CACHE_MAX_AGE', '86400'))  # Seconds an entry is kept whatever its timeout; 0 for no limit
+CACHE_EVICT_TO = 0.9  # Size eviction frees space down to this fraction of CACHE_MAX_BYTES
+CACHE_TOUCH_INTERVAL = 60  # Seconds between last-use updates of an entry, so hits rarely write
+
+# flask_caching config for CACHE_BACKEND; the cache is named in its metrics and stats
+def cache_config(name):
+    if CACHE_BACKEND == 'simple':
+        return {'CACHE_TYPE': 'SimpleCache'}
+    return {'CACHE_TYPE': 'cache_backends.SQLiteCache',
+            'CACHE_OPTIONS': {'name': name, 'path': CACHE_PATH, 'max_bytes': CACHE_MAX_BYTES, 'max_age': CACHE_MAX_AGE}}
+
+# Stats of a flask_caching Cache bound to the current app: entries, bytes, limits and this
+# process's hits, misses and evictions for the SQLite backend, just the backend otherwise
+def cache_stats(cache):
+    backend = cache.cache
+    return backend.stats() if isinstance(backend, SQLiteCache) else {'backend': type(backend).__name__}
+
+# flask_caching backend keeping pickled values in one SQLite file, so every worker process on
+# the host shares the cache and entries survive restarts. Entries expire after their timeout
+# and after max_age at the latest; when the file holds more than max_bytes of values, the
+# least recently used entries are evicted. flask_caching passes its own backend options
+# (default_timeout, ignore_delete_many_errors) next to CACHE_OPTIONS; they go to BaseCache.
+class SQLiteCache(BaseCache):
+    def __init__(self, name='cache', path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE, **options):
+        super().__init__(**options)
+        self.name = name
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._local = threading.local()
+        self._counts = Counter()  # hits, misses and evictions in this process
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                         'created_at REAL NOT NULL, used_at REAL NOT NULL, expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_used_at ON cache_entries (used_at)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(*args, **kwargs)
+
+    # One connection per thread; WAL lets readers in other processes proceed during writes
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, created_at, expires_at, now):
+        return (expires_at is not None and expires_at <= now) or (self.max_age > 0 and created_at <= now - self.max_age)
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, created_at, used_at, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or self._expired(row[1], row[3], now):
+            self._counts['misses'] += 1
+            return None
+        if now - row[2] > CACHE_TOUCH_INTERVAL:
+            with conn:
+                conn.execute('UPDATE cache_entries SET used_at = ? WHERE key = ?', (now, key))
+        self._counts['hits'] += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=None):
+        return self._store('INSERT OR REPLACE', key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._store('INSERT OR IGNORE', key, value, timeout)
+
+    def _store(self, verb, key, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return False
+        now = time.time()
+        timeout = self._normalize_timeout(timeout)
+        with self._connect() as conn:
+            self._evict_expired(conn, now)
+            cursor = conn.execute(f'{verb} INTO cache_entries (key, value, size, created_at, used_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)',
+                                  (key, data, len(data), now, now, now + timeout if timeout else None))
+            self._evict_size(conn)
+        return cursor.rowcount > 0
+
+    # Drops expired and too old entries, so add can replace an expired key
+    def _evict_expired(self, conn, now):
+        cursor = conn.execute('DELETE FROM cache_entries WHERE expires_at <= ? OR created_at <= ?',
+                              (now, now - self.max_age if self.max_age > 0 else 0))
+        self._record_evictions('age', cursor.rowcount)
+
+    # Drops the least recently used entries until the values fit in CACHE_EVICT_TO of max_bytes
+    def _evict_size(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess, evicted = total - self.max_bytes * CACHE_EVICT_TO, []
+        for key, size in conn.execute('SELECT key, size FROM cache_entries ORDER BY used_at'):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        conn.executemany('DELETE FROM cache_entries WHERE key = ?', evicted)
+        self._record_evictions('size', len(evicted))
+
+    def _record_evictions(self, reason, count):
+        if count > 0:
+            self._counts['evictions'] += count
+            registry.inc('data_tool_cache_evictions_total', count, cache=self.name, reason=reason)
+
+    def delete(self, key):
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+
+    def has(self, key):
+        row = self._connect().execute('SELECT created_at, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        return row is not None and not self._expired(row[0], row[1], time.time())
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache_entries')
+        return True
+
+    def stats(self):
+        entries, size = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+        return {'backend': 'sqlite', 'path': self.path, 'entries': entries, 'bytes': size,
+                'max_bytes': self.max_bytes, 'max_age': self.max_age, 'hits': self._counts['hits'],
+                'misses': self._counts['misses'], 'evictions': self._counts['evictions']}
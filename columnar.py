@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+META_FILE = 'meta.json'
+INDEX_FILE = 'index.npy'
+
+# Writes a DataFrame as one .npy file per column plus a JSON manifest. Numeric and
+# datetime columns are stored raw so they can be memory-mapped back without a copy;
+# text columns are stored as fixed-width unicode with a separate null mask.
+def write_columnar(frame, directory):
+    tmp_dir = directory + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = []
+    for i, name in enumerate(frame.columns):
+        columns.append({'name': name, **_write_array(frame[name], tmp_dir, str(i))})
+    meta = {'rows': len(frame), 'columns': columns, 'index': None, 'attrs': frame.attrs}
+    if not isinstance(frame.index, pd.RangeIndex):
+        meta['index'] = {'name': frame.index.name, **_write_array(frame.index.to_series(), tmp_dir, 'index')}
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+
+def _write_array(series, directory, stem):
+    entry = {'file': f'{stem}.npy', 'dtype': str(series.dtype), 'nulls': None}
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+        entry['kind'] = 'raw'
+        np.save(os.path.join(directory, entry['file']), series.to_numpy())
+    else:
+        entry['kind'] = 'text'
+        nulls = series.isna().to_numpy()
+        np.save(os.path.join(directory, entry['file']), series.astype(str).to_numpy(dtype=str))
+        if nulls.any():
+            entry['nulls'] = f'{stem}.nulls.npy'
+            np.save(os.path.join(directory, entry['nulls']), nulls)
+    return entry
+
+# Read-only view of a dataset written by write_columnar. Columns are memory-mapped
+# on first access, so several processes reading the same files share one copy
+# through the page cache and untouched columns are never read at all.
+class ColumnarDataset:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._entries = {entry['name']: entry for entry in self.meta['columns']}
+        self._mapped = {}
+        self.private_nbytes = 0  # Memory of decoded text columns, which unlike mapped ones is not shared
+
+    @property
+    def columns(self):
+        return [entry['name'] for entry in self.meta['columns']]
+
+    def __len__(self):
+        return self.meta['rows']
+
+    # DataFrame.attrs of the written frame (ingest metadata such as the x-axis column)
+    @property
+    def attrs(self):
+        return self.meta.get('attrs', {})
+
+    def nbytes_on_disk(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    # Returns a column as a read-only memory-mapped array (text columns are decoded to objects)
+    def column(self, name):
+        if name not in self._mapped:
+            entry = self._entries[name]
+            self._mapped[name] = self._load(entry)
+            if entry['kind'] == 'text':
+                self.private_nbytes += int(pd.Series(self._mapped[name], copy=False).memory_usage(deep=True, index=False))
+        return self._mapped[name]
+
+    def index(self):
+        entry = self.meta['index']
+        if entry is None:
+            return pd.RangeIndex(len(self))
+        return pd.Index(self._load(entry), name=entry['name'], copy=False)
+
+    # Builds a DataFrame over the requested columns only, backed by the mapped arrays
+    def frame(self, columns=None):
+        columns = self.columns if columns is None else [col for col in columns if col in self._entries]
+        frame = pd.DataFrame({col: self.column(col) for col in columns}, index=self.index(), columns=columns, copy=False)
+        frame.attrs.update(self.attrs)
+        return frame
+
+    def _load(self, entry):
+        values = np.load(os.path.join(self.directory, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'raw':
+            return values
+        series = pd.Series(values).astype(entry['dtype'])
+        if entry['nulls']:
+            series[np.load(os.path.join(self.directory, entry['nulls']))] = None
+        return series.to_numpy() if entry['dtype'] == 'object' else series.array
@@ -1,24 +1,77 @@
 import dash
-from dash import html, dcc, Input, Output, State, Dash
+from dash import html, dcc, Input, Output, State, Dash, Patch
 import dash_bootstrap_components as dbc
-import pandas as pd
 import io
 import base64
-import plotly.express as px
-import requests
 from datetime import datetime, timedelta
 import os
+import json
+import time
+import hashlib
+import functools
+from flask import session
 from flask_caching import Cache
+from cache_backends import cache_config
+from ingest import (detect_chiller_columns, normalize_frame, merge_append, stream_to_disk, read_csv_chunked,
+                    parse_files, source_label, combine_sources)
+from dataset_store import DatasetManager, session_dataset_key, weather_key
+from downsample import downsample_columns, downsample_indices
+from pyramid import load_or_build_pyramid, parse_x_range, visible_traces
+from rollups import load_or_build_rollups
+from weather_store import WeatherStore
+from weather_client import WeatherClient, parse_weather_sites
+from jobs import FINISHED_STATES, JobRunner
+from metrics import cache_lookup, instrument_app
+from lazy_modules import LazyModule, preload
+from analytics import build_analytics
+from anomalies import load_or_build_anomalies, merge_points
 
-# Initialize cache
-cache = Cache(config={'CACHE_TYPE': 'simple'})  # Simple in-memory cache
+# Loaded on first use (see preload_heavy_modules), so importing the app and serving the login page stay fast
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+px = LazyModule('plotly.express')
+go = LazyModule('plotly.graph_objects')
+plotly_subplots = LazyModule('plotly.subplots')
+requests = LazyModule('requests')
 
-# Global dictionaries
-uploaded_data_store = {}
-weather_data_store = {}
+# Rendered figures, shared by all workers on the host (see cache_backends.py)
+cache = Cache(config=cache_config('figure'))
+
+# Per-session uploaded datasets; what they hold in memory is bounded by DATASET_MEMORY_BUDGET_MB
+datasets = DatasetManager()
+# Per-day weather observations persisted across restarts and workers
+weather_store = WeatherStore()
+# Pooled, retrying Visual Crossing client; long ranges are fetched as concurrent windows
+weather_client = WeatherClient()
+# Process pool for CSV parsing and weather pulls, so they do not hold Flask worker threads
+jobs = JobRunner()
 
 # Constants
-MAX_POINTS = 1000
+WEATHER_SITES = parse_weather_sites(os.environ.get('WEATHER_SITES') or 'Hyderabad, India')  # 'Name=Location;Name=Location'
+MAX_POINTS = 500  # Per-trace point budget after shape-preserving downsampling
+CHILLER_COLORS = ['#00A1D6', '#FF6B6B']
+ANOMALY_COLOR = '#FFC107'
+ANOMALY_TABLE_ROWS = 100  # Latest findings listed on the Dashboard tab
+ANOMALY_MAX_MARKERS = 50  # Flagged points marked per trace and view, strongest first; zooming in shows more
+ANOMALY_MIN_LINE_POINTS = MAX_POINTS // 2  # Downsampled points a line keeps however many flagged rows are in view
+WEATHER_COLORS = ['#00A1D6', '#FF6B6B', '#28A745']
+CHILLER_GRAPHS = [  # (graph id, title, y-axis title, checklist id)
+    ('chiller-power-graph', 'Chiller Power', 'Power (kW)', 'chiller-power-checklist'),
+    ('supply-temp-graph', 'Chiller Water Supply Temperature', 'Temperature (°C)', 'supply-temp-checklist'),
+    ('return-temp-graph', 'Chiller Water Return Temperature', 'Temperature (°C)', 'return-temp-checklist')
+]
+GRANULARITIES = [('raw', 'Raw'), ('hourly', 'Hourly'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')]
+ROLLUP_VIEWS = {  # graph id -> (rolled-up statistic, y-axis title); temperatures add a min-max band
+    'chiller-power-graph': ('energy', 'Energy (kWh)'),
+    'supply-temp-graph': ('mean', 'Temperature (°C)'),
+    'return-temp-graph': ('mean', 'Temperature (°C)')
+}
+FIGURE_CACHE_TIMEOUT = 3600
+ANALYTICS_AXES = {'temp': 'Ambient Temperature (°C)', 'humidity': 'Ambient Humidity (%)'}  # Weather Correlation x-axes
+JOB_POLL_INTERVAL_MS = 500
+PROGRESS_STYLE = {'display': 'flex', 'marginTop': '20px', 'height': '20px'}
+CANCEL_STYLE = {'marginTop': '10px', 'borderRadius': '8px'}
+RENDER_MODE = os.environ.get('GRAPH_RENDER_MODE', 'webgl')  # 'webgl' draws Scattergl traces, 'svg' plain Scatter
 STYLE_NON_EDITABLE = {'userSelect': 'none', 'outline': 'none'}
 PROPS_NON_EDITABLE = {'tabIndex': "-1", 'contentEditable': "false"}
 BASE_NAV_STYLE = {'flex': 1, 'textAlign': 'center', 'padding': '15px', 'cursor': 'pointer', 
@@ -31,6 +84,8 @@ GRAPH_LAYOUT = dict(template='plotly_white', font=dict(family='Roboto, sans-seri
 def setup_dashboard_app(app: Dash):
     # Attach cache to the Flask server
     cache.init_app(app.server)
+    # Latency and payload metrics of every callback, served on /metrics
+    instrument_app(app, 'dashboard')
 
     active_style, inactive_style = BASE_NAV_STYLE.copy(), BASE_NAV_STYLE.copy()
     active_style.update({'backgroundColor': '#4fc3f7', 'color': 'white'})
@@ -80,37 +135,57 @@ def setup_dashboard_app(app: Dash):
         styles[['nav-dashboard', 'nav-data-upload', 'nav-weather', 'nav-settings'].index(active_tab)] = active_style.copy()
         return styles
 
-    @app.callback(Output('upload-output', 'children'), 
+    @app.callback([Output('upload-output', 'children'),
+                   Output('upload-job', 'data')],
                   [Input('upload-data', 'contents'),
-                   Input('reset-button', 'n_clicks')], 
-                  [State('upload-data', 'filename')])
-    def handle_file_upload(contents, reset_clicks, filename):
+                   Input('reset-button', 'n_clicks'),
+                   Input('stream-upload-store', 'data'),
+                   Input('upload-job-result', 'data')],
+                  [State('upload-data', 'filename'),
+                   State('upload-mode', 'value')])
+    def handle_file_upload(contents, reset_clicks, stream_result, job_result, filenames, mode):
         ctx = dash.callback_context
         if ctx.triggered_id == 'reset-button':
-            uploaded_data_store.clear()
+            datasets.discard(session_dataset_key())
             return html.P('Dataset cleared. Please upload a new file.', 
-                          style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
-        return process_file_upload(contents, filename)
-
-    @cache.memoize(timeout=3600)  # Cache for 1 hour
-    def fetch_weather_data_from_api(start_date, end_date):
-        api_key = os.environ.get('WEATHER_API_KEY', '6K9Z93LW56Z4TWPWWVN5DW2M4')
-        location = "Hyderabad, India"
-        url = f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{location}/{start_date}/{end_date}?key={api_key}&unitGroup=metric&include=days"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+                          style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE), None
+        if ctx.triggered_id == 'stream-upload-store' and stream_result:
+            if stream_result.get('status') != 'queued':
+                return render_upload_error(stream_result.get('message', 'Upload failed.')), None
+            return render_upload_pending(stream_result['filename']), {'id': stream_result['job'], 'filename': stream_result['filename']}
+        if ctx.triggered_id == 'upload-job-result' and job_result:
+            return render_upload_result(job_result), None
+        return process_file_upload(contents, filenames, mode)
+
+    # Follows the running upload job: progress bar, cancellation and, once finished, its result
+    @app.callback([Output('upload-job-poll', 'disabled'),
+                   Output('stream-upload-progress', 'value'),
+                   Output('stream-upload-progress', 'label'),
+                   Output('stream-upload-progress', 'style'),
+                   Output('upload-cancel-button', 'style'),
+                   Output('upload-job-result', 'data')],
+                  [Input('upload-job', 'data'),
+                   Input('upload-job-poll', 'n_intervals'),
+                   Input('upload-cancel-button', 'n_clicks')],
+                  prevent_initial_call=True)
+    def poll_upload_job(job, n_intervals, cancel_clicks):
+        return poll_job(job, dash.callback_context.triggered_id == 'upload-cancel-button')
 
     @app.callback(
         [Output('weather-output', 'children'), 
          Output('weather-data-store', 'data'),
-         Output('weather-retry-button', 'style')],
+         Output('weather-retry-button', 'style'),
+         Output('weather-job', 'data')],
         [Input('weather-date-range', 'start_date'),
          Input('weather-date-range', 'end_date'),
-         Input('weather-retry-button', 'n_clicks')],
+         Input('weather-retry-button', 'n_clicks'),
+         Input('weather-sites', 'value'),
+         Input('weather-job-result', 'data')],
         prevent_initial_call=False
     )
-    def fetch_weather_data(start_date, end_date, retry_clicks):
+    def fetch_weather_data(start_date, end_date, retry_clicks, site_ids, job_result):
+        if dash.callback_context.triggered_id == 'weather-job-result' and job_result:
+            return render_weather_result(job_result) + (None,)
         current_date = datetime.now().date()  # Get current date (March 15, 2025)
         
         # Set default dates if none provided
@@ -121,7 +196,8 @@ def setup_dashboard_app(app: Dash):
             return (dbc.Alert(f"Using default range: {datetime.strptime(default_start, '%Y-%m-%d').strftime('%d-%m-%Y')} to {datetime.strptime(default_end, '%Y-%m-%d').strftime('%d-%m-%Y')}.", 
                               color="success", style={'fontFamily': 'Roboto, sans-serif'}),
                     None,  # No data yet, let graph handle empty state
-                    {'display': 'none'})
+                    {'display': 'none'},
+                    None)
 
         try:
             start_date_api = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -130,85 +206,76 @@ def setup_dashboard_app(app: Dash):
             return (dbc.Alert("Invalid date format. Dates should be in YYYY-MM-DD format.", 
                               color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
                     None,
-                    {'display': 'inline-block'})
+                    {'display': 'inline-block'},
+                    None)
 
         # Check if dates are in the future
         if start_date_api > current_date or end_date_api > current_date:
             return (dbc.Alert("Future dates are not allowed. Please select dates up to today only.", 
                               color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
                     None,
-                    {'display': 'inline-block'})
+                    {'display': 'inline-block'},
+                    None)
         
         # Check if end date is before start date
         if end_date_api < start_date_api:
             return (dbc.Alert("End date must be after start date.", 
                               color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
                     None,
-                    {'display': 'inline-block'})
+                    {'display': 'inline-block'},
+                    None)
 
-        try:
-            # Use cached API call
-            data = fetch_weather_data_from_api(start_date, end_date)
-            df = pd.DataFrame(data['days'])
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            weather_data_store['data'] = df.to_dict('records')
-            print("Weather data fetched:", weather_data_store['data'])  # Debug print
-            return (dbc.Alert(f"Weather data fetched for Hyderabad, India from {start_date_api.strftime('%d-%m-%Y')} to {end_date_api.strftime('%d-%m-%Y')}.", 
-                              color="success", style={'fontFamily': 'Roboto, sans-serif'}),
-                    df.to_dict('records'),
-                    {'display': 'none'})
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                error_msg = "Rate limit exceeded, please try again later."
-            elif e.response.status_code == 400:
-                error_msg = "Invalid date range or location."
-            else:
-                error_msg = f"Error fetching weather data: {str(e)}"
-            return (dbc.Alert(error_msg, color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
-                    None,
-                    {'display': 'inline-block', 'marginTop': '15px'})
-        except Exception as e:
-            return (dbc.Alert(f"Error fetching weather data: {str(e)}", color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
+        sites = [site for site_id in dict.fromkeys(site_ids or []) for site in WEATHER_SITES if site['id'] == site_id]
+        if not sites:
+            return (dbc.Alert("Select at least one site.", color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
                     None,
-                    {'display': 'inline-block', 'marginTop': '15px'})
+                    {'display': 'none'},
+                    None)
+        # The first selected site is the one the Dashboard's analytics and exports use
+        session['weather_site'] = sites[0]['id']
+
+        # The pull runs as a background job; poll_weather_job reports its progress and result
+        targets = [(site, weather_dataset_key(site['id'])) for site in sites]
+        job_id = jobs.submit(run_weather_job, targets, start_date, end_date, owner=session_dataset_key())
+        return (dbc.Alert(f"Fetching weather data for {site_names(sites)} from {start_date_api.strftime('%d-%m-%Y')} to {end_date_api.strftime('%d-%m-%Y')}...", 
+                          color="info", style={'fontFamily': 'Roboto, sans-serif'}),
+                dash.no_update,
+                {'display': 'none'},
+                {'id': job_id, 'start_date': start_date, 'end_date': end_date})
+
+    # Follows the running weather job: progress bar, cancellation and, once finished, its result
+    @app.callback([Output('weather-job-poll', 'disabled'),
+                   Output('weather-job-progress', 'value'),
+                   Output('weather-job-progress', 'label'),
+                   Output('weather-job-progress', 'style'),
+                   Output('weather-cancel-button', 'style'),
+                   Output('weather-job-result', 'data')],
+                  [Input('weather-job', 'data'),
+                   Input('weather-job-poll', 'n_intervals'),
+                   Input('weather-cancel-button', 'n_clicks')],
+                  prevent_initial_call=True)
+    def poll_weather_job(job, n_intervals, cancel_clicks):
+        return poll_job(job, dash.callback_context.triggered_id == 'weather-cancel-button')
 
     @app.callback(
-        Output('weather-graph', 'figure'),
+        [Output('weather-graph', 'figure'),
+         Output('weather-graph-traces', 'data')],
         [Input('weather-data-store', 'data'),
-         Input('weather-metrics', 'value')]
+         Input('weather-metrics', 'value'),
+         Input('weather-view', 'value')],
+        [State('weather-graph-traces', 'data')]
     )
-    def update_weather_graph(data, metrics):
-        print("Graph data:", data, "Metrics:", metrics)  # Debug print
-        if not data or not metrics:
-            fig = px.line(title="No data available", template='plotly_white')
-            fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
-            fig.add_annotation(text="No data to display. Please fetch weather data.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
-            return fig
-        
-        df = pd.DataFrame(data)
-        if df.empty:
-            fig = px.line(title="No data available", template='plotly_white')
-            fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
-            fig.add_annotation(text="No data to display.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
-            return fig
-
-        if len(df) > MAX_POINTS:
-            df = df.iloc[::len(df) // MAX_POINTS, :].copy()
-        
-        # Ensure metrics exist in data
-        valid_metrics = [m for m in metrics if m in df.columns]
-        if not valid_metrics:
-            fig = px.line(title="No valid metrics selected", template='plotly_white')
-            fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
-            fig.add_annotation(text="Selected metrics not found in data.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
-            return fig
-
-        df_melted = df.melt(id_vars=['datetime'], value_vars=valid_metrics, var_name='Metric', value_name='Value')
-        fig = px.line(df_melted, x='datetime', y='Value', color='Metric',
-                      title="Weather Data for Hyderabad, India",
-                      color_discrete_sequence=['#00A1D6', '#FF6B6B', '#28A745'])
-        fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value", legend_title_text='')
-        return fig
+    def update_weather_graph(handle, metrics, view, drawn):
+        ctx = dash.callback_context
+        sites = resolve_weather_handle(handle)
+        series = weather_series(sites, metrics or [])
+        if (ctx.triggered_id == 'weather-metrics' and view != 'facet' and drawn and drawn['traces']
+                and drawn['handle'] == handle and drawn.get('view') == view and series):
+            patch, names = patch_traces(drawn['traces'], list(series),
+                                        lambda added: weather_traces(series, added), WEATHER_COLORS)
+            return patch, {'handle': handle, 'view': view, 'traces': names}
+        fig = build_weather_figure(sites, metrics, view)
+        return fig, {'handle': handle, 'view': view, 'traces': [trace.name for trace in fig.data]}
 
     @app.callback(
         [Output('weather-date-range', 'start_date'),
@@ -228,20 +295,31 @@ def setup_dashboard_app(app: Dash):
             start_date = end_date - timedelta(days=7)
         return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
 
-    # Updated callbacks for chiller graphs using a loop
-    for graph_id, title, yaxis, input_id in [
-        ('chiller-power-graph', 'Chiller Power', 'Power (kW)', 'chiller-power-checklist'),
-        ('supply-temp-graph', 'Chiller Water Supply Temperature', 'Temperature (°C)', 'supply-temp-checklist'),
-        ('return-temp-graph', 'Chiller Water Return Temperature', 'Temperature (°C)', 'return-temp-checklist')
-    ]:
-        @app.callback(Output(graph_id, 'figure'), 
-                      Input(input_id, 'value'))
-        def update_graph(cols):
-            df, x_col = prepare_data(cols or [])
-            fig = px.line(df, x=x_col, y=cols or [], title=title, color_discrete_sequence=['#00A1D6', '#FF6B6B']) \
-                  if df is not None else px.line()
-            fig.update_layout(**GRAPH_LAYOUT, xaxis_title=x_col, yaxis_title=yaxis)
-            return fig
+    # One batched callback renders all chiller graphs, sharing the dataset and pyramid lookups
+    @app.callback([Output(graph_id, 'figure') for graph_id, _, _, _ in CHILLER_GRAPHS] +
+                  [Output(f'{graph_id}-traces', 'data') for graph_id, _, _, _ in CHILLER_GRAPHS],
+                  [Input(check_id, 'value') for _, _, _, check_id in CHILLER_GRAPHS] +
+                  [Input(graph_id, 'relayoutData') for graph_id, _, _, _ in CHILLER_GRAPHS] +
+                  [Input('chiller-granularity', 'value')],
+                  [State(f'{graph_id}-traces', 'data') for graph_id, _, _, _ in CHILLER_GRAPHS])
+    def update_chiller_graphs(*values):
+        ctx = dash.callback_context
+        triggered = {t['prop_id'].split('.')[0] for t in ctx.triggered if t['prop_id'] != '.'}
+        count = len(CHILLER_GRAPHS)
+        figures, drawn = render_chiller_figures(values[:count], values[count:2 * count], triggered,
+                                                values[2 * count + 1:], values[2 * count])
+        return figures + drawn
+
+    @app.callback(Output('export-link', 'href'), Input('chiller-granularity', 'value'))
+    def update_export_link(granularity):
+        return export_url(granularity)
+
+    @app.callback([Output('analytics-scatter-graph', 'figure'),
+                   Output('analytics-trend-graph', 'figure'),
+                   Output('analytics-summary', 'children')],
+                  [Input('analytics-x-axis', 'value')])
+    def update_analytics(axis):
+        return render_analytics(axis)
 
     @app.callback(
         Output('url', 'pathname'),
@@ -253,170 +331,778 @@ def setup_dashboard_app(app: Dash):
             return '/logout'
         return dash.no_update
 
+# /export download of the session's dataset at a granularity, with its weather joined
+def export_url(granularity):
+    return f'/export?granularity={granularity or "raw"}&weather=1'
+
+# The weather site linked to the session's dataset (used by analytics and exports): the first
+# site selected on the Weather tab, else the first configured one
+def linked_weather_site():
+    site_id = session.get('weather_site')
+    return site_id if any(site['id'] == site_id for site in WEATHER_SITES) else WEATHER_SITES[0]['id']
+
+# Weather frames are kept by the dataset manager under a per-session, per-site key, like uploads
+def weather_dataset_key(site_id=None):
+    return weather_key(session_dataset_key(), site_id or linked_weather_site())
+
+def site_names(sites):
+    return ', '.join(site['name'] for site in sites)
+
+# Persists a fetched weather frame of a site server-side and returns its entry of the small
+# handle ({'sites': [...]}) kept in weather-data-store
+def store_weather_frame(df, site, key=None):
+    key = key or weather_dataset_key(site['id'])
+    return {'site': site['id'], 'name': site['name'], 'id': key, 'version': datasets.put(key, df)}
+
+# Resolves a weather-data-store handle to [(site entry, columnar dataset)]; entries of other
+# sessions and stale entries (the site's weather was fetched again since) are left out
+def resolve_weather_handle(handle):
+    resolved = []
+    for site in (handle or {}).get('sites', []):
+        if site.get('id') == weather_dataset_key(site.get('site')) and site.get('version') == datasets.version(site['id']):
+            dataset = datasets.open(site['id'])
+            if dataset is not None:
+                resolved.append((site, dataset))
+    return resolved
+
+# Served from the persistent day store; only days not stored yet hit the API. The missing
+# ranges of all sites are fetched together, sharing the client's concurrency and rate budget.
+# Returns {location: {'days': [...]} or the exception that failed it}. progress(done, total)
+# is called as the API windows of the missing days arrive.
+def fetch_weather_data_from_api(start_date, end_date, progress=None, sites=None):
+    return weather_store.fetch_ranges([site['location'] for site in sites or WEATHER_SITES[:1]], start_date, end_date,
+                                      lambda ranges: weather_client.fetch_many(ranges, progress))
+
+# User-facing message for a failed weather fetch
+def weather_error_message(error):
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        if error.response.status_code == 429:
+            return "Rate limit exceeded, please try again later."
+        if error.response.status_code == 400:
+            return "Invalid date range or location."
+    return f"Error fetching weather data: {str(error)}"
+
+# Background job: pulls the weather of a date range for [(site, key)] targets and stores each
+# site's frame under its key. Sites that fail or return no days are reported; the others are still stored.
+def run_weather_job(job, targets, start_date, end_date):
+    job.progress(0, 'Fetching...')
+    results = fetch_weather_data_from_api(start_date, end_date,
+                                          lambda done, total: job.progress(done / total, f'{done} of {total} windows'),
+                                          [site for site, _ in targets])
+    handles, failures = [], []
+    for site, key in targets:
+        data = results[site['location']]
+        if isinstance(data, Exception):
+            message = weather_error_message(data)
+            failures.append(message if len(targets) == 1 else f"{site['name']}: {message}")
+            continue
+        if not data.get('days'):
+            message = "No weather data available for this date range."
+            failures.append(message if len(targets) == 1 else f"{site['name']}: {message}")
+            continue
+        df = pd.DataFrame(data['days'])
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        # The frame stays server-side; the browser only receives a handle to it
+        handles.append(store_weather_frame(df.set_index('datetime'), site, key))
+    if not handles:
+        return {'status': 'error', 'message': ' '.join(failures)}
+    return {'status': 'ok', 'handle': {'sites': handles}, 'failures': failures}
+
+# (alert, weather-data-store handle, retry button style) for a finished weather job
+def render_weather_result(job_result):
+    result = job_result.get('result') or {}
+    if job_result['state'] == 'done' and result.get('status') == 'ok':
+        start_date = datetime.strptime(job_result['start_date'], '%Y-%m-%d').strftime('%d-%m-%Y')
+        end_date = datetime.strptime(job_result['end_date'], '%Y-%m-%d').strftime('%d-%m-%Y')
+        message = f"Weather data fetched for {site_names(result['handle']['sites'])} from {start_date} to {end_date}."
+        if result.get('failures'):
+            return (dbc.Alert(f"{message} Not fetched: {' '.join(result['failures'])}",
+                              color="warning", style={'fontFamily': 'Roboto, sans-serif'}),
+                    result['handle'],
+                    {'display': 'inline-block', 'marginTop': '15px'})
+        return (dbc.Alert(message, color="success", style={'fontFamily': 'Roboto, sans-serif'}),
+                result['handle'],
+                {'display': 'none'})
+    if job_result['state'] == 'cancelled':
+        return (dbc.Alert("Weather fetch cancelled.", color="warning", style={'fontFamily': 'Roboto, sans-serif'}),
+                dash.no_update,
+                {'display': 'inline-block', 'marginTop': '15px'})
+    message = result.get('message') or f"Error fetching weather data: {job_result.get('message', '')}"
+    return (dbc.Alert(message, color="danger", style={'fontFamily': 'Roboto, sans-serif'}),
+            None,
+            {'display': 'inline-block', 'marginTop': '15px'})
+
+# Outputs of a job-polling callback: (interval disabled, progress value, progress label,
+# progress style, cancel button style, finished status). The finished status is only set
+# once, when the job reaches a final state, and carries the job's own fields as well.
+def poll_job(job, cancel=False):
+    hidden = {'display': 'none'}
+    if not job:
+        return True, 0, '', hidden, hidden, dash.no_update
+    owner = session_dataset_key()
+    if cancel:
+        jobs.cancel(job['id'], owner)
+    status = jobs.status(job['id'], owner)
+    if status is None:
+        return True, 0, '', hidden, hidden, {**job, 'state': 'error', 'message': 'The job is no longer available.'}
+    if status['state'] in FINISHED_STATES:
+        status.pop('traceback', None)
+        return True, 100, '', hidden, hidden, {**job, **status}
+    percent = round(status.get('progress', 0) * 100)
+    label = status.get('message') or f'{percent}%'
+    return False, percent, label, PROGRESS_STYLE, CANCEL_STYLE, dash.no_update
+
+# {trace name: (dataset, metric)} of the selected metrics of each resolved site. With one
+# site the traces are named after the metric, with several after the metric and site.
+def weather_series(sites, metrics):
+    return {(f"{metric} ({site['name']})" if len(sites) > 1 else metric): (dataset, metric)
+            for site, dataset in sites for metric in metrics if metric in dataset.columns}
+
+# {name: (x, y)} of the named weather_series entries, downsampled to MAX_POINTS
+def weather_traces(series, names):
+    traces = {}
+    for name in names:
+        dataset, metric = series[name]
+        df = dataset.frame([metric])
+        traces[name] = downsample_columns(df.index.to_numpy(), df, [metric], MAX_POINTS)[metric]
+    return traces
+
+# Weather graph for the selected metrics of the resolved sites (none shows the empty state):
+# overlaid on one chart, or faceted into one row per site with a shared time axis
+def build_weather_figure(sites, metrics, view='overlay'):
+    if not sites or not metrics:
+        fig = px.line(title="No data available", template='plotly_white')
+        fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
+        fig.add_annotation(text="No data to display. Please fetch weather data.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
+        return fig
+    
+    if not any(len(dataset) for _, dataset in sites):
+        fig = px.line(title="No data available", template='plotly_white')
+        fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
+        fig.add_annotation(text="No data to display.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
+        return fig
+
+    # Ensure metrics exist in data
+    series = weather_series(sites, metrics)
+    if not series:
+        fig = px.line(title="No valid metrics selected", template='plotly_white')
+        fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value")
+        fig.add_annotation(text="Selected metrics not found in data.", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
+        return fig
+
+    title = f"Weather Data for {site_names([site for site, _ in sites])}"
+    if view != 'facet' or len(sites) == 1:
+        fig = build_line_figure(weather_traces(series, list(series)), title, WEATHER_COLORS)
+        fig.update_layout(**GRAPH_LAYOUT, xaxis_title="Date", yaxis_title="Value", legend_title_text='')
+        return fig
+    fig = plotly_subplots.make_subplots(rows=len(sites), cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                                        subplot_titles=[site['name'] for site, _ in sites])
+    for row, (site, dataset) in enumerate(sites, 1):
+        names = [name for name, (site_dataset, _) in series.items() if site_dataset is dataset]
+        for name, (x, y) in weather_traces(series, names).items():
+            metric = series[name][1]
+            color = WEATHER_COLORS[metrics.index(metric) % len(WEATHER_COLORS)]
+            # The rows are titled by site, so one legend entry per metric toggles it on every row
+            fig.add_trace(line_trace(metric, x, y, color).update(showlegend=row == 1), row=row, col=1)
+    fig.update_layout(**GRAPH_LAYOUT, title=title, legend_title_text='')
+    fig.update_layout(height=max(450, 220 * len(sites)))
+    fig.update_yaxes(title_text="Value")
+    fig.update_xaxes(title_text="Date", row=len(sites), col=1)
+    return fig
+
+# Builds a line figure with one trace per entry of {name: (x_values, y_values)}
+def build_line_figure(traces, title, colors):
+    fig = go.Figure([line_trace(name, x, y, colors[i % len(colors)]) for i, (name, (x, y)) in enumerate(traces.items())])
+    fig.update_layout(title=title)
+    return fig
+
+# One line trace; WebGL (Scattergl) keeps panning smooth when many columns are selected
+def line_trace(name, x, y, color):
+    trace_type = go.Scattergl if RENDER_MODE == 'webgl' else go.Scatter
+    return trace_type(x=x, y=y, mode='lines', name=name, legendgroup=name, line=dict(color=color))
+
+# Markers over a column's flagged anomalies. The trace carries the column's name and legend
+# group, so it is shown, hidden and removed together with the column's line.
+def anomaly_trace(name, x, y, rules):
+    trace_type = go.Scattergl if RENDER_MODE == 'webgl' else go.Scatter
+    return trace_type(x=x, y=y, mode='markers', name=name, legendgroup=name, showlegend=False, customdata=rules,
+                      marker=dict(color=ANOMALY_COLOR, size=9, symbol='x'),
+                      hovertemplate='%{x}<br>%{y}<br>Flagged by %{customdata}<extra>%{fullData.name}</extra>')
+
+# Anomaly marker traces of the given columns in the visible x range, at most ANOMALY_MAX_MARKERS
+# (the strongest) per column; {} when the dataset has no anomaly findings
+def anomaly_markers(columns, x_range=None):
+    anomalies = datasets.artifact(session_dataset_key(), 'anomalies', load_or_build_anomalies)
+    markers = {}
+    for col in columns if anomalies is not None else []:
+        times, values, rules = anomalies.points(col, x_range, ANOMALY_MAX_MARKERS)
+        if len(times):
+            markers[col] = anomaly_trace(col, times, values, rules)
+    return markers
+
+# Turns a checklist change into a Patch of the drawn figure: unticked traces are deleted and
+# newly ticked ones appended, computed by traces_for(names) -> {name: (x, y)}. markers_for(names)
+# may add overlay traces ({name: trace}) named after their columns. Returns the Patch and the
+# trace names drawn afterwards.
+def patch_traces(drawn_names, selected, traces_for, colors, markers_for=None):
+    patch = Patch()
+    kept = [name for name in drawn_names if name in selected]
+    for i in sorted((i for i, name in enumerate(drawn_names) if name not in selected), reverse=True):
+        del patch['data'][i]
+    added = traces_for([name for name in selected if name not in drawn_names])
+    lines = len(dict.fromkeys(kept))  # Overlays share their column's name and take no color
+    for j, (name, (x, y)) in enumerate(added.items()):
+        patch['data'].append(line_trace(name, x, y, colors[(lines + j) % len(colors)]).to_plotly_json())
+    markers = markers_for(list(added)) if markers_for is not None else {}
+    for trace in markers.values():
+        patch['data'].append(trace.to_plotly_json())
+    return patch, kept + list(added) + list(markers)
+
+# Renders the figures of CHILLER_GRAPHS from their checklist values and relayoutData. Only
+# graphs whose own inputs triggered the call are redrawn (all of them on the first call or a
+# granularity change). A checklist toggle on an unchanged dataset, zoom and raw granularity
+# becomes a Patch that only removes or appends the affected traces; full figures are cached
+# per dataset version, selected columns, visible x range and granularity, so returning to an
+# earlier selection or zoom is a cache hit. Rolled-up granularities read the precomputed rollups;
+# the raw view marks flagged anomalies. Returns (figures, drawn) where drawn describes the traces now on each graph.
+def render_chiller_figures(selections, relayouts, triggered=(), drawn_states=None, granularity='raw'):
+    key = session_dataset_key()
+    granularity = granularity or 'raw'
+    figures, drawn = [], []
+    for (graph_id, title, yaxis, check_id), cols, relayout_data, state in zip(
+            CHILLER_GRAPHS, selections, relayouts, drawn_states or [None] * len(CHILLER_GRAPHS)):
+        cols = cols or []
+        x_range = parse_x_range(relayout_data)
+        # Appends after the visible range leave its figure valid, so it keeps its version
+        version = datasets.cache_token(key, x_range[1] if x_range else None)
+        if triggered and check_id not in triggered and 'chiller-granularity' not in triggered and (
+                graph_id not in triggered or (x_range is None and not (relayout_data or {}).get('xaxis.autorange'))):
+            # Untouched graph, or a relayout without an x-range change (autosize, y-only zoom)
+            figures.append(dash.no_update)
+            drawn.append(dash.no_update)
+            continue
+        if (triggered == {check_id} and granularity == 'raw' and state and state['version'] == version
+                and state.get('granularity', 'raw') == 'raw' and state['x_range'] == (list(x_range) if x_range else None)):
+            patch, names = patch_traces(state['traces'], cols, lambda added: prepare_traces(added, x_range)[0] or {}, CHILLER_COLORS,
+                                        lambda added: anomaly_markers(added, x_range))
+            figures.append(patch)
+            drawn.append({**state, 'traces': names})
+            continue
+        cache_key = 'chiller-figure:' + hashlib.sha1(json.dumps(
+            [key, version, graph_id, cols, x_range, granularity, MAX_POINTS, RENDER_MODE]).encode()).hexdigest()
+        fig = cache.get(cache_key)
+        cache_lookup('figure', fig is not None)
+        if fig is None:
+            fig = build_rollup_figure(graph_id, title, cols, granularity, x_range) if granularity != 'raw' else None
+            if fig is None:
+                traces, x_col = prepare_traces(cols, x_range)
+                fig = build_line_figure(traces, title, CHILLER_COLORS) if traces is not None else px.line()
+                fig.add_traces(list(anomaly_markers(list(traces or {}), x_range).values()))
+                fig.update_layout(xaxis_title=x_col, yaxis_title=yaxis)
+            # uirevision keeps the user's zoom while the data behind it is swapped for the visible range
+            fig.update_layout(**GRAPH_LAYOUT, uirevision=graph_id)
+            fig = fig.to_dict()
+            cache.set(cache_key, fig, timeout=FIGURE_CACHE_TIMEOUT)
+        figures.append(fig)
+        drawn.append({'version': version, 'x_range': list(x_range) if x_range else None, 'granularity': granularity,
+                      'traces': [trace.get('name') for trace in fig['data']]})
+    return figures, drawn
+
+# Figure of one chiller graph at a rolled-up granularity: energy per bucket for power, the
+# mean with a min-max band for temperatures. Returns None when the dataset has no rollups
+# (no timestamp index), so the caller falls back to the raw view.
+def build_rollup_figure(graph_id, title, selected_cols, granularity, x_range=None):
+    rollups = datasets.artifact(session_dataset_key(), 'rollups', load_or_build_rollups)
+    if rollups is None:
+        return None
+    stat, yaxis = ROLLUP_VIEWS[graph_id]
+    label = dict(GRANULARITIES)[granularity]
+    fig = go.Figure()
+    for i, col in enumerate(col for col in selected_cols if col in rollups.columns):
+        color = CHILLER_COLORS[i % len(CHILLER_COLORS)]
+        series = rollups.series(granularity, col, stat)
+        if x_range is not None:
+            series = series.loc[pd.Timestamp(x_range[0]):pd.Timestamp(x_range[1])]
+        x, y = series.index.to_numpy(), series.to_numpy()
+        indices = downsample_indices(x, y, MAX_POINTS)
+        if stat == 'mean':
+            # Band edges share the mean's picked buckets so the fill stays aligned with the line
+            low = rollups.series(granularity, col, 'min').reindex(series.index).to_numpy()[indices]
+            high = rollups.series(granularity, col, 'max').reindex(series.index).to_numpy()[indices]
+            fig.add_trace(go.Scatter(x=x[indices], y=high, mode='lines', line=dict(width=0), name=f'{col} (max)',
+                                     showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=x[indices], y=low, mode='lines', line=dict(width=0), name=f'{col} (min)',
+                                     fill='tonexty', fillcolor=band_color(color), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(line_trace(col, x[indices], y[indices], color))
+    fig.update_layout(title=f'{title} ({label})', xaxis_title='Date/Time', yaxis_title=yaxis)
+    return fig
+
+# Translucent fill for the min-max band behind a line of the given hex color
+def band_color(color, alpha=0.2):
+    red, green, blue = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f'rgba({red}, {green}, {blue}, {alpha})'
+
+# Per-column (x, y) traces for the visible x range, served from the resolution pyramid
+# when the dataset has a timestamp index and from the raw columns otherwise. Every flagged
+# anomaly in the range is among the points; they come out of the trace's MAX_POINTS budget,
+# down to ANOMALY_MIN_LINE_POINTS for the downsampled line.
+def prepare_traces(selected_cols, x_range=None):
+    key = session_dataset_key()
+    dataset = datasets.open(key)
+    if dataset is None or not len(dataset) or not dataset.columns:
+        return None, None
+    x_col = dataset.attrs.get('x_col')
+    cols = [col for col in selected_cols if col in dataset.columns]
+    if x_col in dataset.columns:
+        df, x_col = prepare_data(cols)
+        return downsample_columns(df[x_col].to_numpy(), df, cols, MAX_POINTS), x_col
+    pyramid = datasets.artifact(key, 'pyramid', load_or_build_pyramid)
+    anomalies = datasets.artifact(key, 'anomalies', load_or_build_anomalies)
+    if anomalies is None:
+        return visible_traces(dataset, pyramid, cols, x_range, MAX_POINTS), x_col
+    traces = {}
+    for col in cols:
+        times, values, _ = anomalies.points(col, x_range)
+        budget = max(MAX_POINTS - len(times), ANOMALY_MIN_LINE_POINTS)
+        for name, (x, y) in visible_traces(dataset, pyramid, [col], x_range, budget).items():
+            # Downsampling may drop a flagged row; putting it back keeps the spike on the line
+            traces[name] = merge_points(x, y, times, values)
+    return traces, x_col
+
+# Selects the timestamp and requested columns of the typed dataset; parsing already happened at ingest
 def prepare_data(selected_cols):
-    if 'data' not in uploaded_data_store or uploaded_data_store['data'].empty:
+    dataset = datasets.open(session_dataset_key())
+    if dataset is None or not len(dataset) or not dataset.columns:
         return None, None
-    df = uploaded_data_store['data']
-    if len(df) > MAX_POINTS:
-        df = df.iloc[::len(df) // MAX_POINTS, :].copy()
-    x_col = 'Date/Time' if 'Date/Time' in df.columns else \
-            ('Date/Time' if 'Date' in df.columns and 'Time' in df.columns else df.columns[0])
-    if x_col == 'Date/Time':
-        df[x_col] = pd.to_datetime(
-            df['Date/Time'] if 'Date/Time' in df.columns else df['Date'] + ' ' + df['Time'], 
-            format='%m/%d/%Y %H:%M:%S' if 'Date/Time' in df.columns else None, errors='coerce')
-    for col in selected_cols:
-        df[col] = pd.to_numeric(df.get(col, pd.Series()), errors='coerce')
-    return df, x_col
+    x_col = dataset.attrs.get('x_col')
+    df = dataset.frame(list(dict.fromkeys(([x_col] if x_col in dataset.columns else []) + list(selected_cols))))
+    return (df.reset_index() if x_col not in df.columns else df), x_col
 
 def get_page_content(ctx):
     tab_id = 'nav-data-upload' if not ctx.triggered else ctx.triggered[0]['prop_id'].split('.')[0]
-    current_date = datetime.now().date()  # For weather date picker max limit
-    
     if tab_id == 'nav-dashboard':
-        if 'data' in uploaded_data_store and not uploaded_data_store['data'].empty:
-            df = uploaded_data_store['data']
-            power_cols = [col for col in df.columns if 'chiller' in col.lower() and 'power' in col.lower()]
-            supply_cols = [col for col in df.columns if ('supply' in col.lower() or 'chws' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
-            return_cols = [col for col in df.columns if ('return' in col.lower() or 'chwr' in col.lower() or 'ret' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
-            sections = [
-                ('Chiller Power', 'chiller-power-checklist', power_cols, 'chiller-power-graph'),
-                ('Supply Temperature', 'supply-temp-checklist', supply_cols, 'supply-temp-graph'),
-                ('Return Temperature', 'return-temp-checklist', return_cols, 'return-temp-graph')
-            ]
-            return html.Div([
-                html.P(f"Available columns in dataset: {', '.join(df.columns)}", 
-                       style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', 'marginTop': '15px', **STYLE_NON_EDITABLE}, 
-                       **PROPS_NON_EDITABLE) if not any([power_cols, supply_cols, return_cols]) else None,
-                *[dbc.Row(dbc.Col(dbc.Card([
-                    dbc.CardHeader(html.H5(title, style={'color': '#0056D2', 'fontWeight': '700', 'textAlign': 'center', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, 
-                                          **PROPS_NON_EDITABLE)),
-                    dbc.CardBody([
-                        dcc.Checklist(id=check_id, options=[{'label': col, 'value': col} for col in cols], 
-                                      value=cols, style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'}),
-                        html.P(f"No columns detected for {title}.", style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE) if not cols else None,
-                        dcc.Graph(id=graph_id, style={'height': '400px'})
-                    ])
-                ], style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'marginBottom': '25px'}))) 
-                for title, check_id, cols, graph_id in sections]
-            ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
-        return html.Div([
-            html.H3('Dashboard', style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-            html.P('Upload a dataset to view visualizations.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
-        ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
-
+        # Built once per dataset version instead of on every tab switch
+        layout = datasets.artifact(session_dataset_key(), 'dashboard-layout', build_dashboard_layout)
+        return layout if layout is not None else empty_dashboard_layout()
     elif tab_id == 'nav-data-upload':
-        return dbc.Card(dbc.CardBody([
-            html.P('Upload only .csv files', style={'color': '#dc3545', 'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-            dcc.Upload(id='upload-data', 
-                       children=html.Div(['Drag and Drop or ', html.A('Select Files', style={'color': '#00A1D6', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)], 
-                                        style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE),
-                       style={'width': '100%', 'height': '100px', 'lineHeight': '100px', 'borderWidth': '2px', 'borderStyle': 'dashed', 
-                              'borderRadius': '10px', 'textAlign': 'center', 'backgroundColor': '#f8f9fa', 'borderColor': '#ced4da', 
-                              'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, multiple=False),
-            dbc.Button('Reset Dataset', id='reset-button', color='danger', style={'marginRight': '15px', 'borderRadius': '8px'}),
-            dcc.Loading(id="loading-upload", children=html.Div(id='upload-output', style={'marginTop': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, 
-                                                               **PROPS_NON_EDITABLE), type="circle", color='#00A1D6')
-        ]), style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'background': 'linear-gradient(135deg, #ffffff, #f8f9fa)', **STYLE_NON_EDITABLE})
-
+        return upload_layout()
     elif tab_id == 'nav-weather':
-        default_start_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        default_end_date = current_date.strftime('%Y-%m-%d')
-        return dbc.Card(dbc.CardBody([
-            html.H2("Weather Data", style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '700', **STYLE_NON_EDITABLE}),
-            html.P("Location: Hyderabad, India", style={'color': '#666', 'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', 'fontSize': '16px', **STYLE_NON_EDITABLE}),
-            dbc.Row([
-                dbc.Col([
-                    dbc.Label("Select Date Range", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
-                    dcc.DatePickerRange(
-                        id='weather-date-range',
-                        start_date=default_start_date,
-                        end_date=default_end_date,
-                        max_date_allowed=current_date,
-                        display_format='DD-MM-YYYY',
-                        style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'},
-                        className='custom-date-picker'
-                    )
-                ], width=6),
-                dbc.Col([
-                    dbc.Label("Select Preset", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
-                    dcc.Dropdown(
-                        id='weather-presets',
-                        options=[
-                            {'label': 'Last 7 Days', 'value': '7days'},
-                            {'label': 'Last 30 Days', 'value': '30days'},
-                            {'label': 'Last Year', 'value': '1year'}
-                        ],
-                        value='7days',
-                        style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', 'borderRadius': '8px', 'borderColor': '#ced4da'},
-                        className='custom-dropdown'
-                    )
-                ], width=6)
-            ]),
-            dbc.Label("Select Metrics", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
-            dcc.Checklist(
-                id='weather-metrics',
-                options=[
-                    {'label': 'Temperature (°C)', 'value': 'temp'},
-                    {'label': 'Humidity (%)', 'value': 'humidity'},
-                    {'label': 'Wind Speed (m/s)', 'value': 'windspeed'}
-                ],
-                value=['temp'],  # Default value to ensure graph triggers
-                style={'marginTop': '15px', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif'},
-                inline=True,
-                className='custom-checklist'
-            ),
-            dcc.Loading(
-                id="loading-weather",
-                children=[
-                    html.Div(id='weather-output', style={'marginTop': '25px', 'marginBottom': '20px', **STYLE_NON_EDITABLE}),
-                    dbc.Button("Retry", id='weather-retry-button', color='primary', 
-                               style={'display': 'none', 'borderRadius': '8px', 'backgroundColor': '#00A1D6', 'borderColor': '#00A1D6'}),
-                    dcc.Graph(id='weather-graph', style={'height': '450px', 'border': '1px solid #e9ecef', 'borderRadius': '8px', 'backgroundColor': '#ffffff'})
-                ],
-                type="circle", color='#00A1D6'
-            ),
-            dcc.Store(id='weather-data-store')
-        ]), style={'boxShadow': '0 4px 12px rgba(0,0,0,0.1)', 'borderRadius': '12px', 'background': 'linear-gradient(135deg, #ffffff, #f0f4f8)', 'padding': '25px', **STYLE_NON_EDITABLE})
-
+        return weather_layout(datetime.now().date())  # The date picker ends today
     elif tab_id == 'nav-settings':
-        return dbc.Card(dbc.CardBody([
-            html.H3("Settings", style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}),
-            html.P("Manage your session below:", style={'color': '#666', 'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}),
-            dbc.Button("Logout", id='logout-button', color='danger', style={'marginTop': '15px', 'borderRadius': '8px'}),
-        ]), style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'background': 'linear-gradient(135deg, #ffffff, #f8f9fa)', **STYLE_NON_EDITABLE})
-
+        return settings_layout()
     return html.Div()
 
-def process_file_upload(contents, filename):
-    global uploaded_data_store
+# Dashboard tab for a dataset: the granularity switch and a checklist and graph per chiller
+# section. Returns None for an empty dataset.
+def build_dashboard_layout(dataset):
+    if not len(dataset) or not dataset.columns:
+        return None
+    power_cols, supply_cols, return_cols = detect_chiller_columns(dataset.columns)
+    sections = [
+        ('Chiller Power', 'chiller-power-checklist', power_cols, 'chiller-power-graph'),
+        ('Supply Temperature', 'supply-temp-checklist', supply_cols, 'supply-temp-graph'),
+        ('Return Temperature', 'return-temp-checklist', return_cols, 'return-temp-graph')
+    ]
+    return html.Div([
+        html.P(f"Available columns in dataset: {', '.join(dataset.attrs.get('source_columns', dataset.columns))}",
+               style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', 'marginTop': '15px', **STYLE_NON_EDITABLE},
+               **PROPS_NON_EDITABLE) if not any([power_cols, supply_cols, return_cols]) else None,
+        html.Div([
+            html.Label('Granularity:', style={'fontWeight': 'bold', 'marginRight': '15px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+            dcc.RadioItems(id='chiller-granularity', options=[{'label': label, 'value': value} for value, label in GRANULARITIES],
+                           value='raw', inline=True, inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                           style={'display': 'inline-block', 'fontFamily': 'Roboto, sans-serif'}),
+            html.A('Download CSV', id='export-link', href=export_url('raw'), style={'float': 'right', 'fontFamily': 'Roboto, sans-serif'})
+        ], style={'marginBottom': '20px', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        *[dbc.Row(dbc.Col(dbc.Card([
+            dbc.CardHeader(html.H5(title, style={'color': '#0056D2', 'fontWeight': '700', 'textAlign': 'center', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE},
+                                  **PROPS_NON_EDITABLE)),
+            dbc.CardBody([
+                dcc.Checklist(id=check_id, options=[{'label': col, 'value': col} for col in cols],
+                              value=cols, style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'}),
+                html.P(f"No columns detected for {title}.", style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE) if not cols else None,
+                dcc.Graph(id=graph_id, style={'height': '400px'}),
+                dcc.Store(id=f'{graph_id}-traces')  # Trace names on the graph, for Patch updates
+            ])
+        ], style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'marginBottom': '25px'})))
+        for title, check_id, cols, graph_id in sections],
+        anomalies_section(datasets.artifact(session_dataset_key(), 'anomalies', load_or_build_anomalies)),
+        analytics_section() if power_cols else None
+    ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
+
+# Anomalies card of the Dashboard tab: counts per column and the latest ANOMALY_TABLE_ROWS
+# findings. None for datasets without anomaly findings (no timestamp index).
+def anomalies_section(anomalies):
+    if anomalies is None or not anomalies.columns:
+        return None
+    findings = anomalies.findings
+    cell = {'padding': '4px 10px', 'fontFamily': 'Roboto, sans-serif'}
+    if len(findings):
+        counts = findings['column'].value_counts()
+        summary = f"{len(findings)} flagged readings: " + ', '.join(f'{col} {count}' for col, count in counts.items())
+    else:
+        summary = 'No anomalies found.'
+    header = ['Time', 'Column', 'Value', 'Rules', 'z-score', 'MAD score', 'Change per hour']
+    rows = [html.Tr([html.Td(f'{time:%Y-%m-%d %H:%M}', style=cell), html.Td(row.column, style=cell),
+                     html.Td(f'{row.value:.2f}', style=cell), html.Td(row.rules, style=cell),
+                     *[html.Td(f'{value:+.1f}' if pd.notna(value) else '', style=cell)
+                       for value in (row.zscore, row.mad_score, row.rate_per_hour)]])
+            for time, row in findings.iloc[::-1].head(ANOMALY_TABLE_ROWS).iterrows()]
+    return dbc.Row(dbc.Col(dbc.Card([
+        dbc.CardHeader(html.H5('Anomalies', style={'color': '#0056D2', 'fontWeight': '700', 'textAlign': 'center', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE},
+                               **PROPS_NON_EDITABLE)),
+        dbc.CardBody([
+            html.P(summary, style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+            html.Div(html.Table([html.Thead(html.Tr([html.Th(name, style=cell) for name in header])), html.Tbody(rows)],
+                                style={'width': '100%', 'fontSize': '14px'}),
+                     style={'maxHeight': '400px', 'overflowY': 'auto'}) if rows else None
+        ])
+    ], style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'marginBottom': '25px'})))
+
+# Weather correlation card of the Dashboard tab, filled in by render_analytics
+def analytics_section():
+    return dbc.Row(dbc.Col(dbc.Card([
+        dbc.CardHeader(html.H5('Weather Correlation', style={'color': '#0056D2', 'fontWeight': '700', 'textAlign': 'center', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE},
+                               **PROPS_NON_EDITABLE)),
+        dbc.CardBody([
+            dcc.RadioItems(id='analytics-x-axis', options=[{'label': label, 'value': value} for value, label in ANALYTICS_AXES.items()],
+                           value='temp', inline=True, inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                           style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'}),
+            html.Div(id='analytics-summary', style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'marginBottom': '10px', **STYLE_NON_EDITABLE},
+                     **PROPS_NON_EDITABLE),
+            dcc.Graph(id='analytics-scatter-graph', style={'height': '400px'}),
+            dcc.Graph(id='analytics-trend-graph', style={'height': '400px'})
+        ])
+    ], style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'marginBottom': '25px'})))
+
+# Analytics of the session's chiller dataset against its fetched weather, rebuilt only when either
+# dataset changes. The weather is read from the dataset manager rather than weather-data-store,
+# which is not mounted on the Dashboard tab.
+def session_analytics():
+    weather_token = datasets.cache_token(weather_dataset_key())
+    return datasets.artifact(session_dataset_key(), 'analytics',
+                             lambda dataset: build_analytics(dataset, datasets.open(weather_dataset_key())),
+                             token=weather_token)
+
+# (scatter figure, trend figure, summary) of the Weather Correlation card for an x-axis of
+# ANALYTICS_AXES. Both figures plot the daily aggregates (the trend lines downsampled to
+# MAX_POINTS), so they stay small for multi-year data; they are cached per chiller and weather
+# version like the chiller graphs.
+def render_analytics(axis):
+    axis = axis if axis in ANALYTICS_AXES else 'temp'
+    key = session_dataset_key()
+    cache_key = 'analytics-figures:' + hashlib.sha1(json.dumps(
+        [key, datasets.cache_token(key), datasets.cache_token(weather_dataset_key()), axis, RENDER_MODE]).encode()).hexdigest()
+    cached = cache.get(cache_key)
+    cache_lookup('figure', cached is not None)
+    if cached is not None:
+        return cached
+    analytics = session_analytics()
+    if analytics is None:
+        return px.scatter(), px.line(), 'Analytics need a dataset with a timestamp and chiller power columns.'
+    daily, summary = analytics.daily, analytics.summary
+    trace_type = go.Scattergl if RENDER_MODE == 'webgl' else go.Scatter
+    other = 'humidity' if axis == 'temp' else 'temp'
+    weathered = daily[daily[f'ambient_{axis}'].notna()]
+    scatter = go.Figure(trace_type(
+        x=weathered[f'ambient_{axis}'].to_numpy(), y=weathered['energy_kwh'].to_numpy(), mode='markers', name='Days',
+        text=weathered.index.strftime('%Y-%m-%d'),
+        marker=dict(color=weathered[f'ambient_{other}'].to_numpy(), colorscale='Viridis', showscale=True,
+                    colorbar=dict(title=ANALYTICS_AXES[other]))))
+    if axis == 'temp' and summary['kwh_per_cdd'] is not None and len(weathered):
+        temps = np.linspace(weathered['ambient_temp'].min(), weathered['ambient_temp'].max(), 50)
+        scatter.add_trace(go.Scatter(x=temps, y=summary['base_kwh'] + summary['kwh_per_cdd'] * np.maximum(temps - summary['cdd_base'], 0),
+                                     mode='lines', name='Energy signature', line=dict(color=CHILLER_COLORS[1])))
+    scatter.update_layout(**GRAPH_LAYOUT, title='Daily Chiller Energy vs Weather', xaxis_title=ANALYTICS_AXES[axis],
+                          yaxis_title='Energy (kWh/day)', legend_title_text='')
+    trends = downsample_columns(daily.index.to_numpy(), daily, [f'delta_t:{name}' for name in analytics.pairs] + ['efficiency'], MAX_POINTS)
+    efficiency_x, efficiency_y = trends.pop('efficiency')
+    trend = go.Figure([line_trace(f'ΔT {col.split(":", 1)[1]}', x, y, WEATHER_COLORS[i % len(WEATHER_COLORS)])
+                       for i, (col, (x, y)) in enumerate(trends.items())])
+    trend.add_trace(trace_type(x=efficiency_x, y=efficiency_y, mode='lines', name='kW per °C ΔT',
+                               yaxis='y2', line=dict(color='#6C757D', dash='dot')))
+    trend.update_layout(**GRAPH_LAYOUT, title='Daily Delta-T and Efficiency', xaxis_title='Date', yaxis_title='ΔT (°C)',
+                        yaxis2=dict(title='kW per °C ΔT', overlaying='y', side='right', showgrid=False), legend_title_text='')
+    result = (scatter.to_dict(), trend.to_dict(), analytics_summary_text(analytics))
+    cache.set(cache_key, result, timeout=FIGURE_CACHE_TIMEOUT)
+    return result
+
+# One-line summary of the correlations and energy signature, or a hint to fetch the missing weather
+def analytics_summary_text(analytics):
+    summary = analytics.summary
+    if not summary['weather_days']:
+        first, last = analytics.daily.index[0], analytics.daily.index[-1]
+        return (f"No weather data covers this dataset yet. Fetch the weather for {first:%Y-%m-%d} to {last:%Y-%m-%d} "
+                f"on the Weather tab to correlate it.")
+    def corr(value):
+        return f'{value:+.2f}' if value is not None else 'n/a'
+    parts = [f"{summary['weather_days']} of {summary['days']} days with weather",
+             f"r(power, temperature) {corr(summary['r_temp'])}", f"r(power, humidity) {corr(summary['r_humidity'])}",
+             f"{summary['cdd_total']:.0f} cooling degree-days (base {summary['cdd_base']:g} °C)"]
+    if summary['kwh_per_cdd'] is not None:
+        parts.append(f"{summary['kwh_per_cdd']:.1f} kWh per degree-day over a {summary['base_kwh']:.0f} kWh/day base")
+    return ' · '.join(parts)
+
+# The static tabs are built once per process; Dash only reads the returned components
+@functools.lru_cache(maxsize=None)
+def empty_dashboard_layout():
+    return html.Div([
+        html.H3('Dashboard', style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.P('Upload a dataset to view visualizations.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
+    ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
+
+@functools.lru_cache(maxsize=None)
+def upload_layout():
+    return dbc.Card(dbc.CardBody([
+        html.P('Upload only .csv files', style={'color': '#dc3545', 'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        dcc.RadioItems(id='upload-mode', options=[{'label': 'Replace dataset', 'value': 'replace'},
+                                                  {'label': 'Append to dataset', 'value': 'append'}],
+                       value='replace', inline=True, inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                       style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'}),
+        dcc.Upload(id='upload-data', 
+                   children=html.Div(['Drag and Drop or ', html.A('Select Files', style={'color': '#00A1D6', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)], 
+                                    style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE),
+                   style={'width': '100%', 'height': '100px', 'lineHeight': '100px', 'borderWidth': '2px', 'borderStyle': 'dashed', 
+                          'borderRadius': '10px', 'textAlign': 'center', 'backgroundColor': '#f8f9fa', 'borderColor': '#ced4da', 
+                          'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, multiple=True),
+        dbc.Button('Reset Dataset', id='reset-button', color='danger', style={'marginRight': '15px', 'borderRadius': '8px'}),
+        # Large files bypass dcc.Upload and are streamed to the /upload endpoint by assets/stream_upload.js
+        dbc.Button('Upload Large CSV', id='stream-upload-button', color='primary', 
+                   style={'borderRadius': '8px', 'backgroundColor': '#00A1D6', 'borderColor': '#00A1D6'}),
+        dbc.Progress(id='stream-upload-progress', value=0, striped=True, animated=True, 
+                     style={'display': 'none', 'marginTop': '20px', 'height': '20px'}),
+        dbc.Button('Cancel', id='upload-cancel-button', color='secondary', size='sm', style={'display': 'none'}),
+        dcc.Store(id='stream-upload-store'),
+        dcc.Store(id='upload-job'),  # {'id', 'filename'} of the running upload job
+        dcc.Store(id='upload-job-result'),
+        dcc.Interval(id='upload-job-poll', interval=JOB_POLL_INTERVAL_MS, disabled=True),
+        dcc.Loading(id="loading-upload", children=html.Div(id='upload-output', style={'marginTop': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, 
+                                                           **PROPS_NON_EDITABLE), type="circle", color='#00A1D6')
+    ]), style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'background': 'linear-gradient(135deg, #ffffff, #f8f9fa)', **STYLE_NON_EDITABLE})
+
+# Weather tab for a given day: the date picker defaults to the last week and ends that day
+@functools.lru_cache(maxsize=1)
+def weather_layout(current_date):
+    default_start_date = (current_date - timedelta(days=7)).strftime('%Y-%m-%d')
+    default_end_date = current_date.strftime('%Y-%m-%d')
+    return dbc.Card(dbc.CardBody([
+        html.H2("Weather Data", style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '700', **STYLE_NON_EDITABLE}),
+        dbc.Row([
+            dbc.Col([
+                dbc.Label("Select Sites", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
+                dcc.Dropdown(
+                    id='weather-sites',
+                    options=[{'label': site['name'] if site['name'] == site['location'] else f"{site['name']} ({site['location']})",
+                              'value': site['id']} for site in WEATHER_SITES],
+                    value=[WEATHER_SITES[0]['id']],
+                    multi=True,
+                    clearable=False,
+                    style={'marginBottom': '5px', 'fontFamily': 'Roboto, sans-serif', 'borderRadius': '8px', 'borderColor': '#ced4da'},
+                    className='custom-dropdown'
+                ),
+                html.Small("The first site is the one used by the Dashboard's analytics and exports.",
+                           style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE})
+            ], width=8),
+            dbc.Col([
+                dbc.Label("Multiple Sites", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
+                dcc.RadioItems(
+                    id='weather-view',
+                    options=[{'label': 'Overlay', 'value': 'overlay'}, {'label': 'One chart per site', 'value': 'facet'}],
+                    value='overlay',
+                    style={'fontFamily': 'Roboto, sans-serif'},
+                    inputStyle={'marginRight': '5px', 'marginLeft': '10px'}
+                )
+            ], width=4)
+        ], style={'marginBottom': '20px'}),
+        dbc.Row([
+            dbc.Col([
+                dbc.Label("Select Date Range", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
+                dcc.DatePickerRange(
+                    id='weather-date-range',
+                    start_date=default_start_date,
+                    end_date=default_end_date,
+                    max_date_allowed=current_date,
+                    display_format='DD-MM-YYYY',
+                    style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif'},
+                    className='custom-date-picker'
+                )
+            ], width=6),
+            dbc.Col([
+                dbc.Label("Select Preset", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
+                dcc.Dropdown(
+                    id='weather-presets',
+                    options=[
+                        {'label': 'Last 7 Days', 'value': '7days'},
+                        {'label': 'Last 30 Days', 'value': '30days'},
+                        {'label': 'Last Year', 'value': '1year'}
+                    ],
+                    value='7days',
+                    style={'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', 'borderRadius': '8px', 'borderColor': '#ced4da'},
+                    className='custom-dropdown'
+                )
+            ], width=6)
+        ]),
+        dbc.Label("Select Metrics", style={'color': '#333', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', **STYLE_NON_EDITABLE}),
+        dcc.Checklist(
+            id='weather-metrics',
+            options=[
+                {'label': 'Temperature (°C)', 'value': 'temp'},
+                {'label': 'Humidity (%)', 'value': 'humidity'},
+                {'label': 'Wind Speed (m/s)', 'value': 'windspeed'}
+            ],
+            value=['temp'],  # Default value to ensure graph triggers
+            style={'marginTop': '15px', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif'},
+            inline=True,
+            className='custom-checklist'
+        ),
+        # Outside the loading wrapper, so polling the job does not flash the spinner
+        dbc.Progress(id='weather-job-progress', value=0, striped=True, animated=True, style={'display': 'none'}),
+        dbc.Button('Cancel', id='weather-cancel-button', color='secondary', size='sm', style={'display': 'none'}),
+        dcc.Store(id='weather-job'),  # {'id', 'start_date', 'end_date'} of the running weather job
+        dcc.Store(id='weather-job-result'),
+        dcc.Interval(id='weather-job-poll', interval=JOB_POLL_INTERVAL_MS, disabled=True),
+        dcc.Loading(
+            id="loading-weather",
+            children=[
+                html.Div(id='weather-output', style={'marginTop': '25px', 'marginBottom': '20px', **STYLE_NON_EDITABLE}),
+                dbc.Button("Retry", id='weather-retry-button', color='primary', 
+                           style={'display': 'none', 'borderRadius': '8px', 'backgroundColor': '#00A1D6', 'borderColor': '#00A1D6'}),
+                dcc.Graph(id='weather-graph', style={'minHeight': '450px', 'border': '1px solid #e9ecef', 'borderRadius': '8px', 'backgroundColor': '#ffffff'})
+            ],
+            type="circle", color='#00A1D6'
+        ),
+        dcc.Store(id='weather-data-store'),
+        dcc.Store(id='weather-graph-traces')  # Handle, view and trace names on the weather graph, for Patch updates
+    ]), style={'boxShadow': '0 4px 12px rgba(0,0,0,0.1)', 'borderRadius': '12px', 'background': 'linear-gradient(135deg, #ffffff, #f0f4f8)', 'padding': '25px', **STYLE_NON_EDITABLE})
+
+@functools.lru_cache(maxsize=None)
+def settings_layout():
+    return dbc.Card(dbc.CardBody([
+        html.H3("Settings", style={'color': '#0056D2', 'marginBottom': '25px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}),
+        html.P("Manage your session below:", style={'color': '#666', 'marginBottom': '20px', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}),
+        dbc.Button("Logout", id='logout-button', color='danger', style={'marginTop': '15px', 'borderRadius': '8px'}),
+    ]), style={'boxShadow': '0 4px 8px rgba(0,0,0,0.1)', 'borderRadius': '10px', 'background': 'linear-gradient(135deg, #ffffff, #f8f9fa)', **STYLE_NON_EDITABLE})
+
+# Starts importing the modules callbacks need once, when the dashboard page is first served
+@functools.lru_cache(maxsize=None)
+def preload_heavy_modules():
+    preload('pandas', 'numpy', 'plotly.express', 'plotly.graph_objects', 'plotly.subplots', 'requests')
+
+# Builds the zoom pyramid, time-bucket rollups and anomaly findings of a freshly stored dataset at upload time
+def precompute_artifacts(key):
+    datasets.artifact(key, 'pyramid', load_or_build_pyramid)
+    datasets.artifact(key, 'rollups', load_or_build_rollups)
+    datasets.artifact(key, 'anomalies', load_or_build_anomalies)
+
+# Stores a normalized upload for the session. 'replace' swaps the dataset; 'append' merges the
+# new rows into the current one on its timestamp index and updates the pyramid, rollups and
+# anomalies from the first changed bucket or row only. Returns the number of rows the upload added or replaced.
+def store_upload(df, mode='replace', key=None):
+    key = key or session_dataset_key()
+    dataset = datasets.open(key) if mode == 'append' else None
+    if dataset is None:
+        datasets.put(key, df)
+        precompute_artifacts(key)
+        return len(df)
+    pyramid = datasets.artifact(key, 'pyramid', load_or_build_pyramid)
+    rollups = datasets.artifact(key, 'rollups', load_or_build_rollups)
+    anomalies = datasets.artifact(key, 'anomalies', load_or_build_anomalies)
+    merged, changed_from, changed_row = merge_append(dataset.frame(), df)
+    if changed_from is None:
+        return 0
+    datasets.put(key, merged, changed_from)
+    datasets.artifact(key, 'pyramid', lambda dataset: load_or_build_pyramid(dataset, pyramid, changed_row))
+    datasets.artifact(key, 'rollups', lambda dataset: load_or_build_rollups(dataset, rollups, changed_from))
+    datasets.artifact(key, 'anomalies', lambda dataset: load_or_build_anomalies(dataset, anomalies, changed_from))
+    return len(merged) - changed_row
+
+# Spools a streamed request body to disk and queues it for parsing; returns a JSON-able status
+def ingest_upload_stream(stream, filename, mode='replace'):
+    if not filename.endswith('.csv'):
+        return {'status': 'error', 'filename': filename, 'message': 'Unsupported file format. Please upload a valid CSV file.'}
+    path = stream_to_disk(stream)
+    job_id = jobs.submit(run_upload_job, session_dataset_key(), [path], [filename], mode, owner=session_dataset_key())
+    return {'status': 'queued', 'filename': filename, 'job': job_id}
+
+# Background job: parses spooled CSV files and stores them as the dataset of session `key`.
+# A single file is parsed in chunks with row progress; several files are parsed concurrently
+# and combined by timestamp and source (see combine_sources). Reports per-file rows and timings.
+def run_upload_job(job, key, paths, filenames, mode):
+    started = time.perf_counter()
+    try:
+        job.progress(0, 'Parsing...')
+        if len(paths) == 1:
+            df = read_csv_chunked(paths[0], progress=lambda rows, total: job.progress(0.8 * rows / total if total else 0.4,
+                                                                                      f'Parsed {rows:,} rows'))
+            parsed = [(normalize_frame(df), time.perf_counter() - started)]
+        else:
+            parsed = parse_files(paths, lambda done, total: job.progress(0.8 * done / total, f'Parsed {done} of {total} files'))
+        job.progress(0.8, 'Storing...')
+        sources = [source_label(filename) for filename in filenames]
+        df = combine_sources([frame for frame, _ in parsed], sources)
+        rows = store_upload(df, mode, key)
+    finally:
+        for path in paths:
+            os.remove(path)
+    files = [{'filename': filename, 'source': source, 'rows': len(frame), 'seconds': round(seconds, 3),
+              'detected': [len(cols) for cols in detect_chiller_columns(frame.columns)]}
+             for filename, source, (frame, seconds) in zip(filenames, sources, parsed)]
+    return {'status': 'ok', 'filename': ', '.join(filenames), 'rows': len(df), 'columns': len(df.attrs['source_columns']),
+            'appended': rows if mode == 'append' else None, 'files': files, 'seconds': round(time.perf_counter() - started, 3)}
+
+def render_upload_pending(filename):
+    return html.P(f'Processing {filename}...', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
+
+# Summary, cancellation note or error for a finished upload job
+def render_upload_result(job_result):
+    if job_result['state'] == 'cancelled':
+        return html.P(f"Upload of {job_result['filename']} cancelled.", style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
+    if job_result['state'] != 'done':
+        return render_upload_error(job_result.get('message', 'Upload failed.'))
+    dataset = datasets.open(session_dataset_key())
+    if dataset is None:
+        return render_upload_error('The uploaded dataset is no longer available. Please upload it again.')
+    result = job_result['result']
+    return render_upload_summary(job_result['filename'], dataset, result.get('appended'),
+                                 result.get('files') if len(result.get('files', [])) > 1 else None, result.get('seconds'))
+
+def render_upload_summary(filename, df, appended=None, files=None, seconds=None):
+    columns = df.attrs.get('source_columns', list(df.columns))
+    power_cols, supply_cols, return_cols = detect_chiller_columns(df.columns)
+    return html.Div([
+        html.P(f'Successfully uploaded: {filename}', style={'fontWeight': 'bold', 'color': '#333', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.Div([
+            html.P(f'Parsed {len(files)} files in {seconds:.2f} s:', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+            html.Ul([html.Li(f"{f['filename']} ({f['source']}): {f['rows']:,} rows in {f['seconds']:.2f} s; "
+                             f"detected {f['detected'][0]} power, {f['detected'][1]} supply, {f['detected'][2]} return columns")
+                     for f in files], style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
+        ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE) if files else None,
+        html.P(f'Appended {appended} new or updated rows.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE) if appended is not None else None,
+        html.P(f'Dataset has {len(df)} rows and {len(columns)} columns.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.P(f"Detected Chiller Power columns: {', '.join(power_cols) if power_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.P(f"Detected Supply Temp columns: {', '.join(supply_cols) if supply_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.P(f"Detected Return Temp columns: {', '.join(return_cols) if return_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+        html.P(f"All columns in dataset: {', '.join(columns)}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
+    ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
+
+def render_upload_error(message):
+    return html.Div([html.P('There was an error processing the file.', style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+                     html.P(message, style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)], 
+                   style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
+
+# Spools dcc.Upload files to disk and queues them for parsing; returns (output, upload-job data)
+def process_file_upload(contents, filenames, mode='replace'):
     if contents:
-        _, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        try:
-            if not filename.endswith('.csv'):
-                return html.Div(html.P('Unsupported file format. Please upload a valid CSV file.', 
-                                       style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE), 
-                               style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-            uploaded_data_store['data'] = df
-            power_cols = [col for col in df.columns if 'chiller' in col.lower() and 'power' in col.lower()]
-            supply_cols = [col for col in df.columns if ('supply' in col.lower() or 'chws' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
-            return_cols = [col for col in df.columns if ('return' in col.lower() or 'chwr' in col.lower() or 'ret' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
-            return html.Div([
-                html.P(f'Successfully uploaded: {filename}', style={'fontWeight': 'bold', 'color': '#333', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                html.P(f'Dataset has {len(df)} rows and {len(df.columns)} columns.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                html.P(f"Detected Chiller Power columns: {', '.join(power_cols) if power_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                html.P(f"Detected Supply Temp columns: {', '.join(supply_cols) if supply_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                html.P(f"Detected Return Temp columns: {', '.join(return_cols) if return_cols else 'None'}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                html.P(f"All columns in dataset: {', '.join(df.columns)}", style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
-            ], style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
-        except Exception as e:
-            return html.Div([html.P('There was an error processing the file.', style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                             html.P(str(e), style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)], 
-                           style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE)
-    return html.Div([html.P('Previously uploaded file is still available.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
-                    html.P(f'Dataset has {len(uploaded_data_store["data"])} rows and {len(uploaded_data_store["data"].columns)} columns.', 
+        if not all(filename.endswith('.csv') for filename in filenames):
+            return html.Div(html.P('Unsupported file format. Please upload a valid CSV file.', 
+                                   style={'color': '#dc3545', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE), 
+                           style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE), None
+        paths = [stream_to_disk(io.BytesIO(base64.b64decode(content.split(',')[1]))) for content in contents]
+        job_id = jobs.submit(run_upload_job, session_dataset_key(), paths, filenames, mode, owner=session_dataset_key())
+        return render_upload_pending(', '.join(filenames)), {'id': job_id, 'filename': ', '.join(filenames)}
+    df = datasets.open(session_dataset_key())
+    return (html.Div([html.P('Previously uploaded file is still available.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE),
+                    html.P(f'Dataset has {len(df)} rows and {len(df.attrs.get("source_columns", df.columns))} columns.', 
                            style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)], 
-                   style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE) if 'data' in uploaded_data_store else \
-           html.P('No file uploaded yet.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)
\ No newline at end of file
+                   style=STYLE_NON_EDITABLE, **PROPS_NON_EDITABLE) if df is not None else \
+           html.P('No file uploaded yet.', style={'color': '#666', 'fontFamily': 'Roboto, sans-serif', **STYLE_NON_EDITABLE}, **PROPS_NON_EDITABLE)), dash.no_update
\ No newline at end of file
@@ -0,0 +1,257 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from flask import session
+from columnar import META_FILE, ColumnarDataset, write_columnar
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+DATASET_DIR = os.environ.get('DATA_TOOL_DATASET_DIR', os.path.join(tempfile.gettempdir(), 'data_tool_datasets'))
+DATASET_MEMORY_BUDGET = int(float(os.environ.get('DATASET_MEMORY_BUDGET_MB', '512')) * 1024 * 1024)
+CURRENT_FILE = 'CURRENT'
+HISTORY_FILE = 'HISTORY'
+GENERATION_FILE = 'GENERATION'
+HISTORY_LENGTH = 100  # Versions remembered for range_version; older appends count as full replaces
+WEATHER_KEY_INFIX = '-weather-'
+
+# Returns the dataset key of the current Flask session, creating one on first use
+def session_dataset_key():
+    if 'dataset_id' not in session:
+        session['dataset_id'] = uuid.uuid4().hex
+    return session['dataset_id']
+
+# Key of a session's weather frame for one site, stored next to its dataset
+def weather_key(key, site_id):
+    return f'{key}{WEATHER_KEY_INFIX}{site_id}'
+
+# Approximate private memory of a value: arrays, pandas objects, containers and the attributes
+# of objects, each counted once. Memory-mapped arrays are shared through the page cache and count 0.
+def memory_size(value):
+    total, seen, stack = 0, set(), [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen or value is None or isinstance(value, (type, type(sys), LazyModule)):
+            continue
+        seen.add(id(value))
+        if 'numpy' in sys.modules and isinstance(value, np.ndarray):
+            base = value
+            while isinstance(base, np.ndarray) and not isinstance(base, np.memmap):
+                base = base.base
+            if base is None:
+                total += value.nbytes
+                if value.dtype == object:
+                    total += sum(sys.getsizeof(item) for item in value.flat)
+        elif 'pandas' in sys.modules and isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+            frame = value.to_frame() if isinstance(value, (pd.Series, pd.Index)) else value
+            stack += [frame[col].to_numpy() for col in frame.columns]
+            if not isinstance(frame.index, pd.RangeIndex):
+                stack.append(frame.index.to_numpy())
+        elif isinstance(value, dict):
+            total += sys.getsizeof(value)
+            stack += list(value.keys()) + list(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(value)
+            stack += list(value)
+        elif hasattr(value, '__dict__'):
+            total += sys.getsizeof(value)
+            stack.append(vars(value))
+        else:
+            total += sys.getsizeof(value)
+    return total
+
+# Holds one dataset per session. Every upload is persisted once to a columnar,
+# memory-mappable directory (DATASET_DIR/<key>/<version>/), so datasets survive
+# restarts and are shared by all worker processes through the page cache.
+# What this process holds privately per key (derived artifacts such as the pyramid, rollups,
+# anomalies and analytics, plus the open handle's manifest and decoded text columns) is kept
+# within a total memory budget; when it is exceeded, the least recently used keys are dropped
+# from memory and rebuilt or reloaded from disk on their next use.
+class DatasetManager:
+    def __init__(self, memory_budget=DATASET_MEMORY_BUDGET, root_dir=DATASET_DIR):
+        self.memory_budget = memory_budget
+        self.root_dir = root_dir
+        self._handles = {}  # key -> (version, ColumnarDataset, manifest bytes)
+        self._artifacts = {}  # (key, name) -> (version, token, value, nbytes)
+        self._used = OrderedDict()  # Keys held in memory, least recently used first
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return self.version(key) is not None
+
+    # Current version of a dataset as recorded on disk, or None if there is none
+    def version(self, key):
+        try:
+            with open(os.path.join(self.root_dir, key, CURRENT_FILE)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    # Stores a new version of the dataset. changed_from is the earliest timestamp whose rows
+    # differ from the previous version (appends); None means the whole dataset was replaced.
+    def put(self, key, frame, changed_from=None):
+        with self._lock:
+            previous = self.version(key)
+            version = (previous or 0) + 1
+            key_dir = os.path.join(self.root_dir, key)
+            write_columnar(frame, os.path.join(key_dir, str(version)))
+            if previous is None:
+                # Versions restart at 1 after a discard; the generation tells the two lifetimes apart
+                self._write_atomic(key_dir, GENERATION_FILE, uuid.uuid4().hex)
+            history = self.history(key) if changed_from is not None else []
+            history.append([version, pd.Timestamp(changed_from).isoformat() if changed_from is not None else None])
+            if len(history) > HISTORY_LENGTH:
+                history = history[-HISTORY_LENGTH:]
+                history[0][1] = None  # The oldest kept entry stands in for everything before it
+            self._write_atomic(key_dir, HISTORY_FILE, json.dumps(history))
+            self._write_atomic(key_dir, CURRENT_FILE, str(version))
+            # Older versions can go; processes still mapping them keep their open files
+            for entry in os.scandir(key_dir):
+                if entry.is_dir() and entry.name != str(version):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            self._drop_artifacts(key)
+            self._hold(key, version, ColumnarDataset(os.path.join(key_dir, str(version))))
+            return version
+
+    # [version, changed_from] of the recorded puts, oldest first (changed_from None for a full replace)
+    def history(self, key):
+        try:
+            with open(os.path.join(self.root_dir, key, HISTORY_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    # Oldest version whose rows up to `end` match the current version's. Results derived from
+    # data before `end` (e.g. a zoomed-in figure) keyed by it survive appends of later rows.
+    def range_version(self, key, end=None):
+        version = self.version(key)
+        if version is None or end is None:
+            return version
+        end = pd.Timestamp(end)
+        for entry_version, changed_from in reversed(self.history(key)):
+            if entry_version <= version and (changed_from is None or pd.Timestamp(changed_from) <= end):
+                return entry_version
+        return version
+
+    # Identifies this lifetime of the key's data; discard and a new put start another one
+    def generation(self, key):
+        try:
+            with open(os.path.join(self.root_dir, key, GENERATION_FILE)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    # range_version qualified by the generation, for keys of caches that outlive a discard
+    # (e.g. the shared figure cache): a reset and re-upload never reuses an earlier token
+    def cache_token(self, key, end=None):
+        version = self.range_version(key, end)
+        return None if version is None else f'{self.generation(key)}:{version}'
+
+    # Memory-mapped view of the current version, reopened when another process replaced it
+    def open(self, key):
+        with self._lock:
+            version = self.version(key)
+            if version is None:
+                self._release(key)
+                return None
+            if key not in self._handles or self._handles[key][0] != version:
+                self._hold(key, version, ColumnarDataset(os.path.join(self.root_dir, key, str(version))))
+            self._used.move_to_end(key)
+            return self._handles[key][1]
+
+    # Derived data (e.g. the resolution pyramid) computed by build(dataset) once per dataset version.
+    # Data that also depends on something else (e.g. the weather dataset's version) passes it as
+    # token; a different token rebuilds the artifact and replaces the old one.
+    def artifact(self, key, name, build, token=None):
+        with self._lock:
+            dataset = self.open(key)
+            if dataset is None:
+                return None
+            version = self._handles[key][0]
+            cached = self._artifacts.get((key, name))
+            if cached is not None and cached[0] == version and cached[1] == token:
+                return cached[2]
+        value = build(dataset)
+        nbytes = memory_size(value)  # Measured outside the lock, like the build
+        with self._lock:
+            if self._handles.get(key, (None,))[0] == version:
+                self._artifacts[(key, name)] = (version, token, value, nbytes)
+                self._enforce_budget(keep=key)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._release(key)
+            shutil.rmtree(os.path.join(self.root_dir, key), ignore_errors=True)
+
+    # Memory this process holds for the keys it served (see _key_bytes) and the size on disk of
+    # every session's current dataset version with its persisted artifacts. The disk side reads
+    # file sizes only, so other sessions' datasets and weather frames are never opened.
+    def stats(self):
+        disk_bytes, disk_datasets = 0, 0
+        if os.path.isdir(self.root_dir):
+            for entry in os.scandir(self.root_dir):
+                version = self.version(entry.name) if entry.is_dir() and WEATHER_KEY_INFIX not in entry.name else None
+                version_dir = os.path.join(entry.path, str(version))
+                if version is None or not os.path.exists(os.path.join(version_dir, META_FILE)):
+                    continue
+                disk_bytes += sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(version_dir) for name in names)
+                disk_datasets += 1
+        with self._lock:
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'resident_bytes': self._resident_bytes(),
+                'resident_keys': len(self._used),
+                'disk_bytes': disk_bytes,
+                'disk_datasets': disk_datasets,
+            }
+
+    def _write_atomic(self, key_dir, name, text):
+        temp = os.path.join(key_dir, f'{name}.{uuid.uuid4().hex}')
+        with open(temp, 'w') as f:
+            f.write(text)
+        os.replace(temp, os.path.join(key_dir, name))
+
+    def _drop_artifacts(self, key):
+        for artifact_key in [artifact_key for artifact_key in self._artifacts if artifact_key[0] == key]:
+            del self._artifacts[artifact_key]
+
+    def _hold(self, key, version, dataset):
+        self._handles[key] = (version, dataset, memory_size(dataset.meta))
+        self._used[key] = None
+        self._used.move_to_end(key)
+        self._enforce_budget(keep=key)
+
+    # Forgets everything this process holds for a key; its files are left alone
+    def _release(self, key):
+        self._handles.pop(key, None)
+        self._used.pop(key, None)
+        self._drop_artifacts(key)
+
+    # Private memory held per key: the handle's manifest and decoded text columns plus its artifacts
+    def _key_bytes(self):
+        held = {key: meta_bytes + dataset.private_nbytes for key, (_, dataset, meta_bytes) in self._handles.items()}
+        for (key, _), (_, _, _, nbytes) in self._artifacts.items():
+            held[key] = held.get(key, 0) + nbytes
+        return held
+
+    def _resident_bytes(self):
+        return sum(self._key_bytes().values())
+
+    def _enforce_budget(self, keep):
+        held = self._key_bytes()
+        resident_bytes = sum(held.values())
+        for key in list(self._used):
+            if resident_bytes <= self.memory_budget:
+                break
+            if key == keep:
+                continue  # The key in use stays even if it alone exceeds the budget
+            resident_bytes -= held.get(key, 0)
+            self._release(key)
@@ -0,0 +1,103 @@
+import os
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+
+# Constants
+DOWNSAMPLE_METHODS = ('lttb', 'minmax', 'm4')
+DOWNSAMPLE_METHOD = os.environ.get('DOWNSAMPLE_METHOD', 'lttb')
+
+# Converts an x axis to float64 so it can take part in arithmetic. Numbers and datetimes keep
+# their spacing; any other x (e.g. a text timestamp column) is treated as evenly spaced row
+# positions, and callers index the original x with the picked positions.
+def _as_float(x):
+    x = np.asarray(x)
+    if x.dtype.kind in 'mM':
+        return x.view('int64').astype('float64')
+    if x.dtype.kind in 'biuf':
+        return x.astype('float64', copy=False)
+    return np.arange(len(x), dtype='float64')
+
+# Pads y into a (buckets, width) matrix so per-bucket reductions run as single NumPy calls
+def _bucket_matrix(y, buckets, fill):
+    width = -(-len(y) // buckets)
+    padded = np.full(buckets * width, fill, dtype='float64')
+    padded[:len(y)] = y
+    return padded.reshape(buckets, width), width
+
+# Indices of the minimum and maximum of every bucket; keeps every spike in O(n)
+def minmax_indices(y, n_out):
+    y = np.asarray(y, dtype='float64')
+    if len(y) <= n_out:
+        return np.arange(len(y))
+    buckets = max(n_out // 2, 1)
+    low, width = _bucket_matrix(np.where(np.isnan(y), np.inf, y), buckets, np.inf)
+    high, _ = _bucket_matrix(np.where(np.isnan(y), -np.inf, y), buckets, -np.inf)
+    offsets = np.arange(buckets) * width
+    indices = np.concatenate([offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)])
+    return np.unique(indices[indices < len(y)])
+
+# Indices of the first, last, minimum and maximum of every bucket (M4 aggregation)
+def m4_indices(y, n_out):
+    y = np.asarray(y, dtype='float64')
+    if len(y) <= n_out:
+        return np.arange(len(y))
+    buckets = max(n_out // 4, 1)
+    low, width = _bucket_matrix(np.where(np.isnan(y), np.inf, y), buckets, np.inf)
+    high, _ = _bucket_matrix(np.where(np.isnan(y), -np.inf, y), buckets, -np.inf)
+    offsets = np.arange(buckets) * width
+    last = np.minimum(offsets + width, len(y)) - 1
+    indices = np.concatenate([offsets, last, offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)])
+    return np.unique(indices[indices < len(y)])
+
+# Largest-Triangle-Three-Buckets: keeps the point of each bucket that forms the largest
+# triangle with the previous pick and the next bucket's average. Bucket averages are
+# computed in one vectorized pass; the remaining loop runs once per output point.
+def lttb_indices(x, y, n_out):
+    x, y = _as_float(x), np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n) if n <= n_out else np.unique(np.linspace(0, n - 1, max(n_out, 1)).astype(int))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    valid = ~np.isnan(y)
+    # reduceat sums each bucket up to the next edge; the last bucket stops before the final point
+    sum_x = np.add.reduceat(x[:n - 1], edges[:-1])
+    sum_y = np.add.reduceat(np.where(valid, y, 0.0)[:n - 1], edges[:-1])
+    count_y = np.add.reduceat(valid[:n - 1].astype('int64'), edges[:-1])
+    avg_x = sum_x / counts
+    avg_y = np.divide(sum_y, count_y, out=np.full(len(counts), np.nan), where=count_y > 0)
+    picked = np.empty(n_out, dtype='int64')
+    picked[0], picked[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_x, next_y = (avg_x[i + 1], avg_y[i + 1]) if i + 1 < len(counts) else (x[-1], y[-1])
+        if np.isnan(next_y):
+            next_y = y[prev]
+        area = np.abs((x[prev] - next_x) * (y[start:stop] - y[prev]) - (x[prev] - x[start:stop]) * (next_y - y[prev]))
+        area = np.where(np.isnan(area), -1.0, area)
+        prev = start + int(area.argmax())
+        picked[i + 1] = prev
+    return picked
+
+# Returns the row positions to plot for one trace, at most n_out of them
+def downsample_indices(x, y, n_out, method=DOWNSAMPLE_METHOD):
+    if method == 'minmax':
+        return minmax_indices(y, n_out)
+    if method == 'm4':
+        return m4_indices(y, n_out)
+    if method == 'lttb':
+        return lttb_indices(x, y, n_out)
+    raise ValueError(f'Unknown downsampling method {method!r}; expected one of {", ".join(DOWNSAMPLE_METHODS)}.')
+
+# Downsamples every column of a frame independently against a shared x axis,
+# returning {column: (x_values, y_values)} with a fixed point budget per trace
+def downsample_columns(x, frame, columns, n_out, method=DOWNSAMPLE_METHOD):
+    x = np.asarray(x)
+    traces = {}
+    for col in columns:
+        y = np.asarray(frame[col], dtype='float64')
+        indices = downsample_indices(x, y, n_out, method)
+        traces[col] = (x[indices], y[indices])
+    return traces
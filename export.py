@@ -0,0 +1,166 @@
+import importlib.util
+import io
+import os
+from analytics import asof_positions
+from ingest import detect_chiller_columns
+from lazy_modules import LazyModule
+from rollups import ROLLUP_PERIODS
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '50000'))  # Rows formatted and sent at a time
+EXPORT_FORMATS = {'csv': ('text/csv', 'csv'), 'parquet': ('application/vnd.apache.parquet', 'parquet')}  # -> (mimetype, extension)
+WEATHER_PREFIX = 'weather_'
+WEATHER_SKIPPED = ['datetimeEpoch']  # Numeric weather fields that are not measurements
+
+# Validated export options from the /export query string: format, columns (comma-separated,
+# all by default), start and end (timestamps, inclusive), granularity (raw or a rollup
+# granularity) and weather=1 to join the session's weather. Raises ValueError with a message
+# for the user on anything the dataset cannot serve.
+def parse_export_args(args, dataset):
+    export_format = args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{export_format}'; use {' or '.join(EXPORT_FORMATS)}.")
+    if export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError('Parquet export needs the pyarrow package; install it or use format=csv.')
+    granularity = args.get('granularity', 'raw').lower()
+    if granularity != 'raw' and granularity not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown granularity '{granularity}'; use raw, {', '.join(ROLLUP_PERIODS)}.")
+    timestamped = isinstance(dataset.index(), pd.DatetimeIndex)
+    x_col = dataset.attrs.get('x_col')
+    available = [col for col in dataset.columns if col != x_col]
+    if granularity != 'raw':
+        if not timestamped:
+            raise ValueError('Rolled-up exports need a dataset with a Date/Time column.')
+        power_cols, supply_cols, return_cols = detect_chiller_columns(dataset.columns)
+        available = list(dict.fromkeys(power_cols + supply_cols + return_cols))
+    columns = [col.strip() for col in args.get('columns', '').split(',') if col.strip()] or available
+    unknown = [col for col in columns if col not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}." +
+                         (' Rolled-up exports cover the chiller power, supply and return columns.' if granularity != 'raw' else ''))
+    if not columns:
+        raise ValueError('The dataset has no columns to export.')
+    bounds = []
+    for name in ('start', 'end'):
+        if not args.get(name):
+            bounds.append(None)
+            continue
+        if not timestamped:
+            raise ValueError('Time ranges need a dataset with a Date/Time column.')
+        try:
+            bounds.append(pd.Timestamp(args[name]))
+        except ValueError:
+            raise ValueError(f"Invalid {name} time '{args[name]}'.") from None
+    weather = args.get('weather') == '1'
+    if weather and not timestamped:
+        raise ValueError('Weather can only be joined to a dataset with a Date/Time column.')
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return {'format': export_format, 'columns': columns, 'start': bounds[0], 'end': bounds[1],
+            'granularity': granularity, 'weather': weather, 'mimetype': mimetype,
+            'filename': f'chiller-data-{granularity}.{extension}'}
+
+# Yields the export as DataFrames of at most EXPORT_CHUNK_ROWS rows. Raw rows are sliced from
+# the memory-mapped dataset, rolled-up buckets (whose start lies in the range) come from its
+# rollups, so memory stays bounded by the chunk size. weather is the session's weather dataset
+# or None.
+def export_frames(dataset, options, rollups=None, weather=None):
+    if options['granularity'] == 'raw':
+        # Without a timestamp index, the unparsed time column (if any) still leads the export
+        x_col = dataset.attrs.get('x_col')
+        frame = dataset.frame(([x_col] if x_col in dataset.columns else []) + options['columns'])
+    else:
+        frame = rollup_table(rollups, options['granularity'], options['columns'])
+    lo, hi = 0, len(frame)
+    if options['start'] is not None:
+        lo = int(frame.index.searchsorted(options['start'], side='left'))
+    if options['end'] is not None:
+        hi = int(frame.index.searchsorted(options['end'], side='right'))
+    weather_frame = weather_table(weather, options['granularity']) if options['weather'] else None
+    for start in range(lo, max(hi, lo + 1), EXPORT_CHUNK_ROWS):
+        chunk = frame.iloc[start:min(start + EXPORT_CHUNK_ROWS, hi)]
+        yield join_weather(chunk, weather_frame, options['granularity']) if weather_frame is not None else chunk
+
+# Mean, min and max per bucket of each column, plus the energy (kWh) of power columns
+def rollup_table(rollups, granularity, columns):
+    power_cols = set(detect_chiller_columns(columns)[0])
+    table = {}
+    for col in columns:
+        for stat in ('mean', 'min', 'max') + (('energy',) if col in power_cols else ()):
+            table[f'{col} {"energy_kwh" if stat == "energy" else stat}'] = rollups.series(granularity, col, stat)
+    return pd.DataFrame(table)
+
+# Numeric weather columns, prefixed with WEATHER_PREFIX: per day for raw and hourly exports,
+# averaged per bucket for daily and coarser ones
+def weather_table(weather, granularity):
+    if weather is None:
+        return pd.DataFrame(index=pd.DatetimeIndex([]))
+    frame = weather.frame().select_dtypes('number').drop(columns=WEATHER_SKIPPED, errors='ignore').add_prefix(WEATHER_PREFIX)
+    if granularity in ('raw', 'hourly'):
+        return frame
+    return frame.groupby(frame.index.to_period(ROLLUP_PERIODS[granularity]).start_time).mean()
+
+# Adds the weather columns to an export chunk: each raw row or hourly bucket gets its day's
+# weather (as-of join), coarser buckets the weather averaged over the same bucket
+def join_weather(chunk, weather_frame, granularity):
+    chunk = chunk.copy()
+    if granularity not in ('raw', 'hourly'):
+        for col in weather_frame.columns:
+            chunk[col] = weather_frame[col].reindex(chunk.index).to_numpy()
+        return chunk
+    times = chunk.index.to_numpy(dtype='datetime64[ns]')
+    weather_times = weather_frame.index.to_numpy(dtype='datetime64[ns]')
+    positions = asof_positions(times, weather_times, np.timedelta64(1, 'D'))
+    for col in weather_frame.columns:
+        values = weather_frame[col].to_numpy(dtype='float64')
+        chunk[col] = np.where(positions >= 0, values[np.maximum(positions, 0)], np.nan) if len(values) else np.nan
+    return chunk
+
+# CSV bytes of the chunks, with the header before the first one. The index is written as the
+# first column unless it is a plain row number.
+def stream_csv(frames):
+    header = True
+    for chunk in frames:
+        write_index = not isinstance(chunk.index, pd.RangeIndex)
+        yield chunk.to_csv(header=header, index=write_index).encode('utf-8')
+        header = False
+
+# Parquet bytes of the chunks, one row group per chunk, sent as each group is written
+def stream_parquet(frames):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = None
+    for chunk in frames:
+        table = pa.Table.from_pandas(chunk, preserve_index=not isinstance(chunk.index, pd.RangeIndex))
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+# Write-only file object that hands out what was written since the last drain, so a Parquet
+# file can be sent while it is being written
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import uuid
+from jobs import JOB_MAX_WORKERS
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+UPLOAD_DIR = os.environ.get('DATA_TOOL_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'data_tool_uploads'))
+STREAM_CHUNK_BYTES = 1024 * 1024  # Bytes copied from the request body per read
+CSV_CHUNK_ROWS = 100_000  # Rows parsed per pandas chunk
+DTYPE_SAMPLE_ROWS = 1000  # Rows used to declare column dtypes up front
+# Files parsed at once per upload job. Up to JOB_MAX_WORKERS jobs parse at the same time, so each
+# gets its share of the CPUs; UPLOAD_PARSE_WORKERS can lower the share but not raise it.
+UPLOAD_PARSE_WORKERS = min(int(os.environ.get('UPLOAD_PARSE_WORKERS', str(os.cpu_count() or 1))),
+                           max((os.cpu_count() or 1) // JOB_MAX_WORKERS, 1))
+DATE_SUFFIX = re.compile(r'([ _\-.]*(\d{4}([ _\-.]?\d{1,2}){0,2}|\d{1,2}[ _\-.]\d{4}|'
+                         r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[ _\-.]?\d{2,4}))+$', re.IGNORECASE)
+
+
+# Returns the detected (power, supply, return) column lists for a chiller dataset
+def detect_chiller_columns(columns):
+    power_cols = [col for col in columns if 'chiller' in col.lower() and 'power' in col.lower()]
+    supply_cols = [col for col in columns if ('supply' in col.lower() or 'chws' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
+    return_cols = [col for col in columns if ('return' in col.lower() or 'chwr' in col.lower() or 'ret' in col.lower()) and ('temp' in col.lower() or 't' in col.lower())]
+    return power_cols, supply_cols, return_cols
+
+# Builds the typed representation every graph works from: a sorted DatetimeIndex parsed
+# once from the Date/Time (or Date + Time) columns and numeric value columns. The column
+# names of the original upload and the x-axis column are recorded in attrs.
+def normalize_frame(df):
+    source_columns = list(df.columns)
+    if 'Date/Time' in df.columns:
+        timestamps = pd.to_datetime(df['Date/Time'], format='%m/%d/%Y %H:%M:%S', errors='coerce')
+        df = df.drop(columns=['Date/Time'])
+    elif 'Date' in df.columns and 'Time' in df.columns:
+        timestamps = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'].astype(str), errors='coerce')
+        df = df.drop(columns=['Date', 'Time'])
+    else:
+        timestamps = None
+    typed = {}
+    for col in df.columns:
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            numeric = pd.to_numeric(values, errors='coerce')
+            # Only text columns that actually hold numbers are converted
+            values = numeric if numeric.notna().any() or values.isna().all() else values
+        typed[col] = values.array
+    if timestamps is None:
+        frame = pd.DataFrame(typed, columns=list(df.columns), copy=False)
+        x_col = source_columns[0] if source_columns else None
+    else:
+        frame = pd.DataFrame(typed, index=pd.DatetimeIndex(timestamps, name='Date/Time'), columns=list(df.columns), copy=False)
+        frame = frame.sort_index(kind='stable')
+        x_col = 'Date/Time'
+    frame.attrs.update({'x_col': x_col, 'source_columns': source_columns})
+    return frame
+
+# Merges newly parsed rows into an existing time-indexed frame. Only the existing rows from the
+# new rows' first timestamp onward are re-sorted; existing rows at timestamps the new file also
+# contains are replaced by the new ones, and of rows repeating a timestamp within the new file
+# the last one is kept. Returns (merged, changed_from, changed_row): the first
+# timestamp and row position whose contents may differ from the existing frame.
+def merge_append(existing, new):
+    if not isinstance(existing.index, pd.DatetimeIndex) or not isinstance(new.index, pd.DatetimeIndex):
+        raise ValueError('Append mode needs Date/Time (or Date and Time) columns in both the existing data and the new file.')
+    # Rows without a timestamp cannot be placed on the timeline
+    existing = existing[existing.index.notna()] if existing.index.hasnans else existing
+    new = new[new.index.notna()] if new.index.hasnans else new
+    new = new[~new.index.duplicated(keep='last')]
+    source_columns = list(dict.fromkeys(existing.attrs.get('source_columns', list(existing.columns)) +
+                                        new.attrs.get('source_columns', list(new.columns))))
+    if not len(new):
+        return existing, None, len(existing)
+    changed_from = new.index[0]
+    changed_row = int(existing.index.searchsorted(changed_from, side='left'))
+    tail = existing.iloc[changed_row:]
+    tail = tail[~tail.index.isin(new.index)]
+    merged = pd.concat([existing.iloc[:changed_row], pd.concat([tail, new]).sort_index(kind='stable')])
+    merged.attrs = {'x_col': 'Date/Time', 'source_columns': source_columns}
+    return merged, changed_from, changed_row
+
+# Copies a binary stream to a spool file without ever holding more than one chunk in memory
+def stream_to_disk(stream, chunk_bytes=STREAM_CHUNK_BYTES):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f'{uuid.uuid4().hex}.csv')
+    with open(path, 'wb') as spool:
+        while True:
+            chunk = stream.read(chunk_bytes)
+            if not chunk:
+                break
+            spool.write(chunk)
+    return path
+
+# Upper bound on the number of data rows in a CSV file, counted in binary chunks
+def count_rows(path, chunk_bytes=STREAM_CHUNK_BYTES):
+    newlines, last = 0, b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            newlines += chunk.count(b'\n')
+            last = chunk
+    # A final row without a trailing newline still counts; the header does not
+    return max(newlines + (0 if last.endswith(b'\n') else 1) - 1, 0)
+
+# Declares column dtypes from a small sample so every chunk parses to the same types
+def sniff_dtypes(path, sample_rows=DTYPE_SAMPLE_ROWS):
+    return pd.read_csv(path, nrows=sample_rows).dtypes.to_dict()
+
+# Parses a CSV file chunk by chunk into the same DataFrame pd.read_csv would return.
+# Numeric columns are written into preallocated arrays, so parsing overhead stays
+# bounded by the chunk size instead of growing with the file.
+def read_csv_chunked(path, chunk_rows=CSV_CHUNK_ROWS, progress=None):
+    try:
+        return _read_csv_declared(path, sniff_dtypes(path), chunk_rows, progress)
+    except (ValueError, TypeError):
+        # The sample did not represent the whole file (e.g. NaNs in an int column); let pandas infer
+        chunks = []
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            chunks.append(chunk)
+            if progress:
+                progress(sum(map(len, chunks)), None)
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.read_csv(path)
+
+def _read_csv_declared(path, dtypes, chunk_rows, progress):
+    capacity = count_rows(path)
+    columns = list(dtypes)
+    numeric = {col: np.empty(capacity, dtype=dtype) for col, dtype in dtypes.items()
+               if isinstance(dtype, np.dtype) and dtype.kind in 'biuf'}
+    pieces = {col: [] for col in columns if col not in numeric}
+    filled = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=dtypes):
+        rows = len(chunk)
+        if filled + rows > capacity:
+            # Line counting undershoots on bare carriage-return files; grow instead of failing
+            capacity = max(capacity * 2, filled + rows)
+            numeric = {col: np.resize(arr, capacity) for col, arr in numeric.items()}
+        for col in columns:
+            if col in numeric:
+                numeric[col][filled:filled + rows] = chunk[col].to_numpy()
+            else:
+                pieces[col].append(chunk[col])
+        filled += rows
+        if progress:
+            progress(filled, capacity)
+    data = {col: numeric[col][:filled] if col in numeric else
+            (pd.concat(pieces[col], ignore_index=True) if pieces[col] else pd.Series(dtype=dtypes[col]))
+            for col in columns}
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+# Source label of an uploaded file: its name without extension and trailing date
+# ('PlantA_2024-01.csv' -> 'PlantA'), so monthly exports of one plant share a label
+def source_label(filename):
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return DATE_SUFFIX.sub('', stem).strip() or stem
+
+# Parses and normalizes one spooled CSV; returns (frame, seconds). Runs in a parse_files worker.
+def parse_file(path):
+    started = time.perf_counter()
+    frame = normalize_frame(read_csv_chunked(path))
+    return frame, time.perf_counter() - started
+
+# Parses several CSV files concurrently in a process pool, so a batch takes about as long
+# as its largest files rather than the sum of all of them. Returns [(frame, seconds)] in the
+# order of paths; progress(done, total) is called as files finish.
+def parse_files(paths, progress=None):
+    if len(paths) == 1 or UPLOAD_PARSE_WORKERS < 2:
+        results = []
+        for done, path in enumerate(paths, 1):
+            results.append(parse_file(path))
+            if progress:
+                progress(done, len(paths))
+        return results
+    results = [None] * len(paths)
+    # A short-lived pool per batch: parse_files usually runs inside a job worker process,
+    # which must not keep pool children of its own alive between jobs
+    with multiprocessing.get_context('spawn').Pool(min(UPLOAD_PARSE_WORKERS, len(paths))) as pool:
+        for done, (i, result) in enumerate(pool.imap_unordered(_parse_indexed, enumerate(paths)), 1):
+            results[i] = result
+            if progress:
+                progress(done, len(paths))
+    return results
+
+def _parse_indexed(item):
+    return item[0], parse_file(item[1])
+
+# Combines parsed files into one dataset keyed by timestamp and source. Files of the same
+# source are stacked in time (later files win on repeated timestamps); with several sources
+# every column becomes '<column> [<source>]' and the sources are joined on the timestamp.
+def combine_sources(frames, sources):
+    if len(frames) == 1:
+        return frames[0]
+    if not all(isinstance(frame.index, pd.DatetimeIndex) for frame in frames):
+        raise ValueError('Combining several files needs Date/Time (or Date and Time) columns in every file.')
+    by_source = {}
+    for frame, source in zip(frames, sources):
+        by_source.setdefault(source, []).append(frame[frame.index.notna()])
+    combined = []
+    for source, parts in by_source.items():
+        frame = pd.concat(parts).sort_index(kind='stable')
+        frame = frame[~frame.index.duplicated(keep='last')]
+        if len(by_source) > 1:
+            frame = frame.rename(columns=lambda col: f'{col} [{source}]')
+        combined.append(frame)
+    merged = pd.concat(combined, axis=1).sort_index(kind='stable') if len(combined) > 1 else combined[0]
+    merged.index.name = 'Date/Time'
+    source_columns = list(dict.fromkeys(col for frame in frames for col in frame.attrs.get('source_columns', frame.columns)))
+    merged.attrs = {'x_col': 'Date/Time',
+                    'source_columns': ['Date/Time', *merged.columns] if len(by_source) > 1 else source_columns}
+    return merged
@@ -0,0 +1,139 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import registry
+
+# Constants
+JOB_DIR = os.environ.get('DATA_TOOL_JOB_DIR', os.path.join(tempfile.gettempdir(), 'data_tool_jobs'))
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', '2'))  # Heavy jobs running at once per server process
+JOB_RETENTION = 24 * 3600  # Seconds a finished job's status file is kept
+FINISHED_STATES = ('done', 'error', 'cancelled')
+
+class JobCancelled(Exception):
+    pass
+
+def _write_json(path, data):
+    temp = f'{path}.{uuid.uuid4().hex}'
+    with open(temp, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+# Handed to every job function as its first argument. Status lives in a small JSON file per
+# job, so any server process can report on a job started by another one; cancellation is a
+# marker file the job notices the next time it reports progress.
+class JobContext:
+    def __init__(self, job_dir, job_id):
+        self.job_dir = job_dir
+        self.job_id = job_id
+
+    def cancelled(self):
+        return os.path.exists(os.path.join(self.job_dir, f'{self.job_id}.cancel'))
+
+    # Records progress (0 to 1) and a message; raises JobCancelled once the job was cancelled
+    def progress(self, fraction, message=''):
+        if self.cancelled():
+            raise JobCancelled()
+        self.update(state='running', progress=max(0.0, min(float(fraction), 1.0)), message=message)
+
+    def update(self, **fields):
+        path = os.path.join(self.job_dir, f'{self.job_id}.json')
+        try:
+            with open(path) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            status = {}
+        status.update(fields, updated_at=time.time())
+        _write_json(path, status)
+
+# Runs in a pool process: executes func(context, *args) and records how it ended. A job
+# cancelled while queued still starts, so its own cleanup runs when it first reports progress.
+def _run_job(job_dir, job_id, func, args):
+    context = JobContext(job_dir, job_id)
+    context.update(state='running', started_at=time.time())
+    started, state = time.perf_counter(), 'done'
+    try:
+        result = func(context, *args)
+    except JobCancelled:
+        state = 'cancelled'
+        context.update(state=state, message='Cancelled.')
+    except Exception as e:
+        state = 'error'
+        context.update(state=state, message=str(e) or e.__class__.__name__, traceback=traceback.format_exc())
+    else:
+        context.update(state=state, progress=1.0, message='', result=result)
+    registry.observe('data_tool_job_seconds', time.perf_counter() - started, job=func.__name__, state=state)
+    registry.flush()  # The pool process may sit idle for a long time; publish the job's metrics now
+
+# Local job queue for heavy work (CSV parsing, long weather pulls) that would otherwise hold
+# a Flask worker thread for the whole request. Jobs run in a process pool capped at
+# max_workers, so interactive callbacks keep their threads and CPU; further jobs wait queued.
+# Job functions must be importable module-level callables taking a JobContext first.
+class JobRunner:
+    def __init__(self, max_workers=JOB_MAX_WORKERS, job_dir=JOB_DIR):
+        self.max_workers = max_workers
+        self.job_dir = job_dir
+        self._executor = None  # Started on first submit, so importing processes do not spawn pools
+        self._lock = threading.Lock()
+
+    # Queues func(context, *args) and returns its job id; owner ties the job to a session
+    def submit(self, func, *args, owner=None):
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._prune()
+        job_id = uuid.uuid4().hex
+        _write_json(self._status_path(job_id), {'id': job_id, 'owner': owner, 'state': 'queued', 'progress': 0.0,
+                                                'message': 'Waiting for a free worker...', 'submitted_at': time.time()})
+        with self._lock:
+            try:
+                future = self._pool().submit(_run_job, self.job_dir, job_id, func, args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                future = self._pool().submit(_run_job, self.job_dir, job_id, func, args)
+        future.add_done_callback(lambda done: self._finished(job_id, done))
+        return job_id
+
+    # Status dict of a job ('state', 'progress', 'message', 'result', ...), or None if unknown
+    # or, when owner is given, started by someone else
+    def status(self, job_id, owner=None):
+        try:
+            with open(self._status_path(job_id)) as f:
+                status = json.load(f)
+        except (OSError, ValueError, TypeError):
+            return None
+        return status if owner is None or status.get('owner') == owner else None
+
+    def cancel(self, job_id, owner=None):
+        status = self.status(job_id, owner)
+        if status is None or status['state'] in FINISHED_STATES:
+            return
+        open(os.path.join(self.job_dir, f'{job_id}.cancel'), 'w').close()
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn keeps worker processes clear of locks held by the server's threads
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _finished(self, job_id, future):
+        if future.exception() is not None:
+            # The pool process died before the job could record how it ended
+            JobContext(self.job_dir, job_id).update(state='error', message=str(future.exception()))
+
+    def _status_path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.json')
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for entry in os.scandir(self.job_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
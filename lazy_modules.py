@@ -0,0 +1,31 @@
+import importlib
+import threading
+
+# Stand-in for a heavy module (pandas, numpy, plotly, requests) that imports it on
+# first attribute access, so serving the login page and importing the app stay cheap. The
+# real module is imported normally and nothing is placed in sys.modules ahead of it, so
+# libraries probing sys.modules (e.g. plotly's JSON encoder) do not load it by accident.
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    # Only called for attributes not resolved yet; each one is then kept on the stand-in, so
+    # hot loops (e.g. np.* calls while downsampling) pay for the indirection once
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f'<lazy module {self._name!r}{" (loaded)" if self._module is not None else ""}>'
+
+# Imports the named modules in a background thread, e.g. when the dashboard page is served,
+# so the callbacks that follow it find them loaded
+def preload(*names):
+    thread = threading.Thread(target=lambda: [importlib.import_module(name) for name in names],
+                              name='preload-modules', daemon=True)
+    thread.start()
+    return thread
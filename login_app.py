@@ -1,12 +1,16 @@
 from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
 from flask import session
+from metrics import instrument_app
 
 # Constant for error styling
 RED_BORDER = "1px solid red"
 
 # Configures the login Dash app
 def setup_login_app(app):
+    # Latency and payload metrics of every callback, served on /metrics
+    instrument_app(app, 'login')
+
     # Define the layout for the login page
     app.layout = html.Div(
         style={"display": "flex", "justifyContent": "center", "alignItems": "center", 
@@ -0,0 +1,249 @@
+import atexit
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import g, request
+
+# Constants
+METRICS_DIR = os.environ.get('DATA_TOOL_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'data_tool_metrics'))
+METRICS_FLUSH_INTERVAL = 1.0  # Seconds between snapshots of this process's metrics for /metrics
+METRICS_RETENTION = 24 * 3600  # Seconds the snapshot of an exited process keeps counting
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B to 64 MB
+PROFILE_DIR = os.environ.get('DATA_TOOL_PROFILE_DIR', os.path.join(METRICS_DIR, 'profiles'))
+PROFILE_MARKER = os.path.join(METRICS_DIR, 'profile.enabled')
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', '1.0'))  # Requests slower than this are dumped
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+DASH_CALLBACK_PATH = '_dash-update-component'
+
+# Counters and histograms of this process. Every process (server workers and job workers)
+# snapshots its own to METRICS_DIR/<pid>-<id>.json; /metrics adds all snapshots up, so work
+# done in background jobs (e.g. upstream weather calls) shows up next to the callbacks.
+class Registry:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._buckets = {}  # histogram name -> upper bounds
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._timer = None  # Pending flush of metrics recorded since the last snapshot
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            key = (name, tuple(sorted(labels.items())))
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            self._buckets[name] = buckets
+            key = (name, tuple(sorted(labels.items())))
+            counts = self._histograms.setdefault(key, [0] * (len(buckets) + 2))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                    'histograms': [[name, list(labels), list(counts)] for (name, labels), counts in self._histograms.items()],
+                    'buckets': dict(self._buckets)}
+
+    def flush(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = f'{self.path}.{uuid.uuid4().hex}'
+            with open(temp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp, self.path)
+        except OSError:
+            pass  # Metrics must never fail the work that records them
+        self._flushed_at = time.monotonic()
+
+    # Snapshots at most every METRICS_FLUSH_INTERVAL; later changes are flushed by a timer,
+    # so an idle process still publishes its last requests
+    def _maybe_flush(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(max(0.0, METRICS_FLUSH_INTERVAL - (time.monotonic() - self._flushed_at)),
+                                          self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    # Prometheus text exposition of all processes' metrics; gauges are (name, help, {labels: value})
+    # read by the scraping process itself (e.g. its dataset memory)
+    def render(self, gauges=()):
+        counters, histograms, buckets = Counter(), {}, {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            buckets.update(snapshot['buckets'])
+            for name, labels, counts in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(counts))
+                histograms[key] = [a + b for a, b in zip(merged, counts)]
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{_labels(labels)} {_number(value)}' for (n, labels), value in sorted(counters.items()) if n == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# TYPE {name} histogram')
+            for (n, labels), counts in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, count in zip(buckets[name], counts):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {count}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {counts[-1]}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(counts[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {counts[-1]}')
+        for name, help_text, values in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}' for labels, value in values]
+        return '\n'.join(lines) + '\n'
+
+    # This process's live metrics plus the last snapshot of every other process
+    def _snapshots(self):
+        snapshots = [self.snapshot()]
+        cutoff = time.time() - METRICS_RETENTION
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json') or entry.path == self.path:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        continue
+                    with open(entry.path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    pass  # Removed or being replaced by its process
+        return snapshots
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+registry = Registry()
+atexit.register(lambda: registry.flush() if registry._counters or registry._histograms else None)
+
+def cache_lookup(cache, hit):
+    registry.inc('data_tool_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+def upstream_call(service, seconds, status):
+    registry.observe('data_tool_upstream_seconds', seconds, service=service, status=status)
+
+# Samples the Python stacks of the threads serving profiled requests. Stacks are kept in
+# folded form ('outer;inner;leaf count'), which flamegraph.pl, speedscope and inferno read.
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._samples = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-profiler', daemon=True)
+                self._thread.start()
+
+    # Stops sampling a thread and returns its Counter of folded stacks
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame, stack = frames.get(thread_id), []
+                    while frame is not None:
+                        stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+                        frame = frame.f_back
+                    if stack:
+                        samples[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+profiler = SamplingProfiler()
+
+# The profiler is opt-in: PROFILE_SLOW_REQUESTS=1, or the marker file set through
+# set_profiling, which every worker process sees
+def profiling_enabled():
+    return os.environ.get('PROFILE_SLOW_REQUESTS') == '1' or os.path.exists(PROFILE_MARKER)
+
+def set_profiling(enabled):
+    if enabled:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        open(PROFILE_MARKER, 'w').close()
+    elif os.path.exists(PROFILE_MARKER):
+        os.remove(PROFILE_MARKER)
+
+def _dump_profile(callback, seconds, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in callback.strip('.'))[:80]
+    path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(seconds * 1000)}ms-{name}.folded')
+    with open(path, 'w') as f:
+        f.writelines(f'{stack} {count}\n' for stack, count in samples.most_common())
+
+# Records latency, request and response sizes and status of every callback of a Dash app,
+# labelled with the app's name and the callback's outputs. With profiling on, the stacks of
+# callbacks slower than PROFILE_SLOW_SECONDS are written to PROFILE_DIR.
+def instrument_app(app, name):
+    path = app.config.routes_pathname_prefix + DASH_CALLBACK_PATH
+
+    @app.server.before_request
+    def start_callback_timer():
+        if request.path != path:
+            return
+        g.metrics_started = time.perf_counter()
+        if profiling_enabled():
+            g.metrics_profiled = threading.get_ident()
+            profiler.start(g.metrics_profiled)
+
+    @app.server.after_request
+    def record_callback(response):
+        if request.path != path or 'metrics_started' not in g:
+            return response
+        seconds = time.perf_counter() - g.metrics_started
+        body = request.get_json(silent=True) or {}
+        callback = body.get('output', 'unknown') if isinstance(body, dict) else 'unknown'
+        registry.observe('data_tool_callback_seconds', seconds, app=name, callback=callback)
+        registry.observe('data_tool_callback_request_bytes', request.content_length or 0, SIZE_BUCKETS, app=name, callback=callback)
+        if not response.is_streamed:
+            registry.observe('data_tool_callback_response_bytes', response.calculate_content_length() or 0, SIZE_BUCKETS,
+                             app=name, callback=callback)
+        registry.inc('data_tool_callback_requests_total', app=name, callback=callback, status=str(response.status_code))
+        if 'metrics_profiled' in g:
+            samples = profiler.stop(g.metrics_profiled)
+            if seconds >= PROFILE_SLOW_SECONDS and samples:
+                try:
+                    _dump_profile(callback, seconds, samples)
+                except OSError:
+                    pass
+        return response
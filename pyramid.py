@@ -0,0 +1,189 @@
+import json
+import os
+from downsample import DOWNSAMPLE_METHOD, downsample_columns
+from lazy_modules import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Constants
+PYRAMID_BASE_BUCKET = 8  # Rows per bucket at the finest level
+PYRAMID_FACTOR = 4  # Buckets merged into one at each coarser level
+PYRAMID_MIN_BUCKETS = 64  # Coarsest level stops at about this many buckets
+PYRAMID_SCAN_LIMIT = 50_000  # Visible ranges up to this many rows are downsampled from raw data
+PYRAMID_DIR = 'pyramid'
+STATS = ('min', 'max', 'min_pos', 'max_pos', 'sum', 'count')
+
+# First-level buckets straight from the raw values of one column
+def _base_level(y, size):
+    buckets = -(-len(y) // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    matrix = padded.reshape(buckets, size)
+    valid = ~np.isnan(matrix)
+    offsets = np.arange(buckets) * size
+    min_arg = np.where(valid, matrix, np.inf).argmin(axis=1)
+    max_arg = np.where(valid, matrix, -np.inf).argmax(axis=1)
+    rows = np.arange(buckets)
+    return {
+        'min': np.where(valid.any(axis=1), matrix[rows, min_arg], np.nan),
+        'max': np.where(valid.any(axis=1), matrix[rows, max_arg], np.nan),
+        'min_pos': offsets + min_arg,
+        'max_pos': offsets + max_arg,
+        'sum': np.where(valid, matrix, 0.0).sum(axis=1),
+        'count': valid.sum(axis=1),
+    }
+
+# Next-coarser level, merging every `factor` buckets of the previous one without touching raw data
+def _merge_level(level, factor):
+    buckets = -(-len(level['min']) // factor)
+    rows = np.arange(buckets)
+
+    def grouped(values, fill):
+        padded = np.full(buckets * factor, fill, dtype=values.dtype)
+        padded[:len(values)] = values
+        return padded.reshape(buckets, factor)
+
+    mins, maxs = grouped(level['min'], np.nan), grouped(level['max'], np.nan)
+    min_arg = np.where(np.isnan(mins), np.inf, mins).argmin(axis=1)
+    max_arg = np.where(np.isnan(maxs), -np.inf, maxs).argmax(axis=1)
+    return {
+        'min': mins[rows, min_arg],
+        'max': maxs[rows, max_arg],
+        'min_pos': grouped(level['min_pos'], 0)[rows, min_arg],
+        'max_pos': grouped(level['max_pos'], 0)[rows, max_arg],
+        'sum': grouped(level['sum'], 0.0).sum(axis=1),
+        'count': grouped(level['count'], 0).sum(axis=1),
+    }
+
+# Replaces the buckets of a level from position `first` on with freshly computed ones;
+# `offset` shifts row positions of buckets computed from a slice of the raw data
+def _splice(old, new, first, offset=0):
+    return {stat: np.concatenate([old[stat][:first], new[stat] + offset if stat in ('min_pos', 'max_pos') else new[stat]])
+            for stat in STATS}
+
+# Multi-resolution summary of a time-indexed dataset: for every numeric column and
+# every level, the min, max, sum and count of fixed-size row buckets, with bucket
+# sizes growing by PYRAMID_FACTOR per level. Zoomed-out views read a coarse level,
+# zoomed-in views a fine one, so the payload stays constant at any zoom.
+class Pyramid:
+    def __init__(self, sizes, levels):
+        self.sizes = sizes  # Rows per bucket of each level, finest first
+        self.levels = levels  # One {column: {stat: array}} dict per level
+
+    @classmethod
+    def build(cls, frame):
+        columns = [col for col in frame.columns if pd.api.types.is_numeric_dtype(frame[col])]
+        sizes, levels = [PYRAMID_BASE_BUCKET], [{col: _base_level(np.asarray(frame[col], dtype='float64'), PYRAMID_BASE_BUCKET)
+                                                 for col in columns}]
+        while columns and len(levels[-1][columns[0]]['min']) > PYRAMID_MIN_BUCKETS:
+            sizes.append(sizes[-1] * PYRAMID_FACTOR)
+            levels.append({col: _merge_level(levels[-1][col], PYRAMID_FACTOR) for col in columns})
+        return cls(sizes, levels)
+
+    # Pyramid of `frame` after its rows from position changed_row onward were added or
+    # replaced: earlier buckets are kept and only the later ones are recomputed per level
+    def update(self, frame, changed_row):
+        columns = [col for col in frame.columns if pd.api.types.is_numeric_dtype(frame[col])]
+        if columns != list(self.levels[0]):
+            return Pyramid.build(frame)
+        size = self.sizes[0]
+        first = changed_row // size
+        sizes, levels = [size], [{col: _splice(self.levels[0][col], _base_level(
+            np.asarray(frame[col].iloc[first * size:], dtype='float64'), size), first, first * size) for col in columns}]
+        while columns and len(levels[-1][columns[0]]['min']) > PYRAMID_MIN_BUCKETS:
+            depth = len(levels)
+            sizes.append(sizes[-1] * PYRAMID_FACTOR)
+            if depth >= len(self.levels):
+                # The data outgrew the previous pyramid; the new top level is merged in full
+                levels.append({col: _merge_level(levels[-1][col], PYRAMID_FACTOR) for col in columns})
+                continue
+            first //= PYRAMID_FACTOR
+            levels.append({col: _splice(self.levels[depth][col], _merge_level(
+                {stat: values[first * PYRAMID_FACTOR:] for stat, values in levels[-1][col].items()}, PYRAMID_FACTOR), first)
+                for col in columns})
+        return Pyramid(sizes, levels)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        columns = list(self.levels[0])
+        for depth, level in enumerate(self.levels):
+            for i, col in enumerate(columns):
+                for stat in STATS:
+                    np.save(os.path.join(directory, f'{depth}.{i}.{stat}.npy'), level[col][stat])
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'sizes': self.sizes, 'columns': columns}, f)
+
+    # Memory-maps a saved pyramid so worker processes share it like the dataset itself
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        levels = [{col: {stat: np.load(os.path.join(directory, f'{depth}.{i}.{stat}.npy'), mmap_mode='r') for stat in STATS}
+                   for i, col in enumerate(meta['columns'])} for depth in range(len(meta['sizes']))]
+        return cls(meta['sizes'], levels)
+
+    def __contains__(self, column):
+        return column in self.levels[0]
+
+    # Finest level whose min/max envelope over `rows` rows fits in `budget` points; a range
+    # that does not start on a bucket boundary overlaps one bucket more
+    def level_for(self, rows, budget):
+        for depth, size in enumerate(self.sizes):
+            if 2 * (-(-rows // size) + 1) <= budget:
+                return depth
+        return len(self.sizes) - 1
+
+    # Min and max of every bucket overlapping rows [lo, hi), in time order, as (positions, values)
+    def envelope(self, depth, column, lo, hi):
+        size, stats = self.sizes[depth], self.levels[depth][column]
+        first, last = lo // size, -(-hi // size)
+        positions = np.stack([stats['min_pos'][first:last], stats['max_pos'][first:last]], axis=1)
+        values = np.stack([stats['min'][first:last], stats['max'][first:last]], axis=1)
+        order = np.argsort(positions, axis=1)
+        positions = np.take_along_axis(positions, order, axis=1).ravel()
+        values = np.take_along_axis(values, order, axis=1).ravel()
+        keep = (positions >= lo) & (positions < hi) & ~np.isnan(values)
+        return positions[keep], values[keep]
+
+# Returns the persisted pyramid of a dataset version, building and saving it on first use.
+# With the previous version's pyramid, only buckets from changed_row onward are recomputed.
+def load_or_build_pyramid(dataset, previous=None, changed_row=0):
+    if not isinstance(dataset.index(), pd.DatetimeIndex):
+        return None
+    directory = os.path.join(dataset.directory, PYRAMID_DIR)
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return Pyramid.load(directory)
+    pyramid = previous.update(dataset.frame(), changed_row) if previous is not None else Pyramid.build(dataset.frame())
+    pyramid.save(directory)
+    return pyramid
+
+# Converts a graph's relayoutData into the visible (start, end) x range, or None for the full range
+def parse_x_range(relayout_data):
+    if not relayout_data or relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'][:2])
+    return None
+
+# Traces for the visible x range with a fixed point budget. Small ranges are read at full
+# fidelity from the raw columns; larger ones are served from the matching pyramid level.
+def visible_traces(dataset, pyramid, columns, x_range, budget, method=DOWNSAMPLE_METHOD):
+    index = dataset.index()
+    lo, hi = 0, len(index)
+    if x_range is not None:
+        lo = int(index.searchsorted(pd.Timestamp(x_range[0]), side='left'))
+        hi = int(index.searchsorted(pd.Timestamp(x_range[1]), side='right'))
+    if pyramid is None or hi - lo <= PYRAMID_SCAN_LIMIT:
+        frame = dataset.frame(columns).iloc[lo:hi]
+        return downsample_columns(index[lo:hi].to_numpy(), frame, columns, budget, method)
+    depth = pyramid.level_for(hi - lo, budget)
+    traces = {}
+    for col in columns:
+        if col not in pyramid:
+            continue
+        positions, values = pyramid.envelope(depth, col, lo, hi)
+        traces[col] = (index.to_numpy()[positions], values)
+    return traces
@@ -0,0 +1,97 @@
+import json
+import os
+from columnar import ColumnarDataset, write_columnar
+from ingest import detect_chiller_columns
+from lazy_modules import LazyModule
+
+pd = LazyModule('pandas')
+
+# Constants
+ROLLUP_PERIODS = {'hourly': 'h', 'daily': 'D', 'weekly': 'W', 'monthly': 'M'}  # Granularity -> pandas period
+ROLLUP_STATS = ('sum', 'min', 'max', 'count')
+ROLLUP_DIR = 'rollups'
+
+# Per-bucket sum, min, max and count of every column, keyed by bucket start; columns are named 'column:stat'
+def _aggregate(frame, columns, period):
+    if not columns or not len(frame):
+        return pd.DataFrame(columns=[f'{col}:{stat}' for col in columns for stat in ROLLUP_STATS], dtype='float64')
+    labels = frame.index.to_period(period).start_time
+    table = frame[columns].groupby(labels).agg(list(ROLLUP_STATS))
+    table.columns = [f'{col}:{stat}' for col, stat in table.columns]
+    table.index.name = 'bucket'
+    return table.astype('float64')
+
+# Time-bucket aggregates (hourly, daily, weekly, monthly) of the detected power, supply and
+# return columns, computed once at ingest. Means are derived from sum and count, so buckets
+# can be recomputed for a changed time range and spliced in without touching older buckets.
+class Rollups:
+    def __init__(self, tables, columns, interval_hours):
+        self.tables = tables  # granularity -> DataFrame of 'column:stat' columns
+        self.columns = columns
+        self.interval_hours = interval_hours  # Typical spacing of the raw rows, for energy (kWh) from kW sums
+
+    # Detected power, supply and return columns of a frame that hold numbers
+    @staticmethod
+    def columns_of(frame):
+        power_cols, supply_cols, return_cols = detect_chiller_columns(frame.columns)
+        return [col for col in dict.fromkeys(power_cols + supply_cols + return_cols) if pd.api.types.is_numeric_dtype(frame[col])]
+
+    @classmethod
+    def build(cls, frame):
+        columns = cls.columns_of(frame)
+        step = frame.index.dropna().to_series().diff().median()
+        interval_hours = step / pd.Timedelta(hours=1) if pd.notna(step) and step > pd.Timedelta(0) else 1.0
+        return cls({name: _aggregate(frame, columns, period) for name, period in ROLLUP_PERIODS.items()},
+                   columns, interval_hours)
+
+    # Rollups for `frame` after rows from `changed_from` onwards were added or replaced:
+    # buckets before the one containing changed_from are kept, the rest are recomputed. When the
+    # new rows bring other columns (e.g. another chiller), everything is rebuilt.
+    def update(self, frame, changed_from):
+        if self.columns_of(frame) != self.columns:
+            return Rollups.build(frame)
+        tables = {}
+        for name, period in ROLLUP_PERIODS.items():
+            start = pd.Timestamp(changed_from).to_period(period).start_time
+            kept = self.tables[name][self.tables[name].index < start]
+            changed = frame.iloc[int(frame.index.searchsorted(start, side='left')):]
+            tables[name] = pd.concat([kept, _aggregate(changed, self.columns, period)])
+        return Rollups(tables, self.columns, self.interval_hours)
+
+    # One statistic of one column at a granularity; 'mean' and 'energy' (kWh from kW) are derived
+    def series(self, granularity, column, stat):
+        table = self.tables[granularity]
+        if stat == 'mean':
+            return table[f'{column}:sum'] / table[f'{column}:count'].where(table[f'{column}:count'] > 0)
+        if stat == 'energy':
+            return table[f'{column}:sum'] * self.interval_hours
+        return table[f'{column}:{stat}']
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, table in self.tables.items():
+            write_columnar(table, os.path.join(directory, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'columns': self.columns, 'interval_hours': self.interval_hours}, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        tables = {name: ColumnarDataset(os.path.join(directory, name)).frame() for name in ROLLUP_PERIODS}
+        return cls(tables, meta['columns'], meta['interval_hours'])
+
+# Returns the persisted rollups of a dataset version, building and saving them on first use.
+# With the previous version's rollups, only buckets from changed_from onward are recomputed.
+def load_or_build_rollups(dataset, previous=None, changed_from=None):
+    if not isinstance(dataset.index(), pd.DatetimeIndex):
+        return None
+    directory = os.path.join(dataset.directory, ROLLUP_DIR)
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return Rollups.load(directory)
+    if previous is not None and changed_from is not None:
+        rollups = previous.update(dataset.frame(), changed_from)
+    else:
+        rollups = Rollups.build(dataset.frame())
+    rollups.save(directory)
+    return rollups
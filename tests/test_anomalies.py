@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+import pandas as pd
+from anomalies import Anomalies, merge_points
+from benchmarks.generate import chiller_frame
+from ingest import merge_append, normalize_frame
+
+
+class AnomaliesUpdateTest(unittest.TestCase):
+    def frame(self, rows=24 * 60):
+        frame = normalize_frame(chiller_frame(rows, gaps=2))
+        rng = np.random.default_rng(3)
+        for col in frame.columns[:3]:
+            frame.iloc[rng.choice(np.arange(100, rows), 12, replace=False), frame.columns.get_loc(col)] += 60
+        return frame
+
+    def test_update_matches_a_full_build(self):
+        full = self.frame()
+        # A plain append, one replacing recent rows, and one shorter than the window
+        for existing_rows, overlap in ((24 * 30, 0), (24 * 45, 24 * 5), (len(full) - 5, 0)):
+            with self.subTest(existing_rows=existing_rows, overlap=overlap):
+                existing = full.iloc[:existing_rows]
+                new = full.iloc[existing_rows - overlap:].copy()
+                new.iloc[:overlap, 1] += 40  # Replaced rows are scored again
+                merged, changed_from, _ = merge_append(existing, new)
+                updated, built = Anomalies.build(existing).update(merged, changed_from), Anomalies.build(merged)
+                self.assertGreater(len(built.findings), 0)
+                pd.testing.assert_frame_equal(updated.findings, built.findings, check_freq=False)
+
+    def test_update_picks_up_columns_of_an_appended_file(self):
+        full = self.frame()
+        existing = full.drop(columns=['Chiller 2 Power']).iloc[:24 * 30]
+        merged, changed_from, _ = merge_append(existing, full.iloc[24 * 30:])
+        updated, built = Anomalies.build(existing).update(merged, changed_from), Anomalies.build(merged)
+        self.assertEqual(updated.columns['Chiller 2 Power'], 'power')
+        pd.testing.assert_frame_equal(updated.findings, built.findings, check_freq=False)
+
+    def test_points_limit_keeps_the_strongest_in_time_order(self):
+        anomalies = Anomalies.build(self.frame())
+        col = anomalies.findings['column'].iloc[0]
+        times, values, _ = anomalies.points(col)
+        strongest, _, _ = anomalies.points(col, limit=3)
+        self.assertEqual(len(strongest), 3)
+        self.assertTrue(np.isin(strongest, times).all())
+        self.assertTrue((np.diff(strongest) > np.timedelta64(0)).all())
+        x, y = merge_points(times[::2], values[::2], times, values)
+        np.testing.assert_array_equal(x, times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from flask_caching import Cache
+import cache_backends
+from cache_backends import SQLiteCache, cache_config
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.now = 1_700_000_000.0
+        clock = mock.patch('cache_backends.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def cache(self, **options):
+        cache = SQLiteCache(name='test', path=self.path, **{'max_bytes': 2**20, 'max_age': 0, **options})
+        self.addCleanup(cache._connect().close)
+        return cache
+
+    def test_entries_expire_after_their_timeout(self):
+        cache = self.cache()
+        cache.set('short', 'a', timeout=10)
+        cache.set('forever', 'b', timeout=0)
+        self.assertEqual(cache.get('short'), 'a')
+        self.now += 11
+        self.assertIsNone(cache.get('short'))
+        self.assertFalse(cache.has('short'))
+        self.assertEqual(cache.get('forever'), 'b')
+        self.assertTrue(cache.add('short', 'c'))  # An expired key can be added again
+        self.assertEqual(cache.get('short'), 'c')
+
+    def test_entries_expire_after_max_age(self):
+        cache = self.cache(max_age=60)
+        cache.set('key', 'value', timeout=0)
+        self.now += 61
+        self.assertIsNone(cache.get('key'))
+        cache.set('other', 'value')
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_least_recently_used_entries_are_evicted_beyond_max_bytes(self):
+        value = b'x' * 1000
+        cache = self.cache(max_bytes=3500)
+        with mock.patch.object(cache_backends, 'CACHE_TOUCH_INTERVAL', 0):
+            for key in 'abc':
+                cache.set(key, value)
+                self.now += 1
+            self.assertEqual(cache.get('a'), value)  # b is now the least recently used
+            self.now += 1
+            cache.set('d', value)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(key) for key in 'acd'], [value] * 3)
+        self.assertLessEqual(cache.stats()['bytes'], 3500)
+        self.assertFalse(cache.set('huge', b'x' * 4000))
+
+    def test_stats_count_hits_misses_and_evictions(self):
+        cache = self.cache(max_bytes=2500)
+        cache.set('a', b'x' * 1000, timeout=5)
+        cache.get('a')
+        cache.get('a')
+        cache.get('missing')
+        self.now += 6
+        cache.set('b', b'x' * 1000)  # Evicts the expired a
+        self.now += 1
+        cache.set('c', b'x' * 1000)
+        cache.set('d', b'x' * 1000)  # Evicts b for size
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 2))
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual((stats['backend'], stats['path'], stats['max_bytes']), ('sqlite', self.path, 2500))
+
+    def test_workers_share_one_file(self):
+        self.cache().set('key', {'figure': [1, 2, 3]})
+        other = self.cache()
+        self.assertEqual(other.get('key'), {'figure': [1, 2, 3]})
+        self.assertTrue(other.delete('key'))
+        self.assertIsNone(self.cache().get('key'))
+
+    def test_flask_caching_builds_the_backend_from_cache_config(self):
+        with mock.patch.multiple(cache_backends, CACHE_BACKEND='sqlite', CACHE_PATH=self.path):
+            config = cache_config('figure')
+        app = Flask(__name__)
+        cache = Cache(config={**config, 'CACHE_DEFAULT_TIMEOUT': 30})
+        cache.init_app(app)
+        with app.app_context():
+            backend = cache.cache
+            self.addCleanup(backend._connect().close)
+            self.assertIsInstance(backend, SQLiteCache)
+            self.assertEqual((backend.name, backend.path, backend.default_timeout), ('figure', self.path, 30))
+            cache.set('key', 'value')
+            self.assertEqual(cache.get('key'), 'value')
+            self.assertEqual(cache_backends.cache_stats(cache)['entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import tempfile
+import unittest
+import pandas as pd
+from dataset_store import DatasetManager
+
+
+class DatasetManagerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.datasets = DatasetManager(root_dir=directory.name)
+
+    def frame(self, start, periods=4):
+        return pd.DataFrame({'Chiller 1 Power': range(periods)},
+                            index=pd.date_range(start, periods=periods, freq='h', name='Date/Time'))
+
+    def test_cache_token_follows_range_version(self):
+        self.datasets.put('key', self.frame('2024-01-01'))
+        first = self.datasets.cache_token('key')
+        self.datasets.put('key', self.frame('2024-01-01', periods=8), changed_from='2024-01-01 04:00')
+        self.assertEqual(self.datasets.cache_token('key', '2024-01-01 03:00'), first)  # Rows before the append are unchanged
+        self.assertNotEqual(self.datasets.cache_token('key'), first)
+        self.assertIsNone(self.datasets.cache_token('missing'))
+
+    def test_cache_token_is_not_reused_after_discard(self):
+        self.assertEqual(self.datasets.put('key', self.frame('2024-01-01')), 1)
+        before = self.datasets.cache_token('key')
+        self.datasets.discard('key')
+        self.assertIsNone(self.datasets.cache_token('key'))
+        self.assertEqual(self.datasets.put('key', self.frame('2025-01-01')), 1)  # Versions restart at 1
+        self.assertNotEqual(self.datasets.cache_token('key'), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
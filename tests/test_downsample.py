@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import pandas as pd
+from downsample import downsample_columns, downsample_indices, lttb_indices, m4_indices, minmax_indices
+
+
+class DownsampleTest(unittest.TestCase):
+    # Minutely sine with noise, a spike up and one down (returned as `spikes`) and a gap of NaNs
+    def series(self, n=100_000):
+        rng = np.random.default_rng(0)
+        x = np.datetime64('2024-01-01') + np.arange(n).astype('timedelta64[m]')
+        y = np.sin(np.arange(n) / 2000) + rng.normal(0, 0.1, n)
+        spikes = [n // 8 + 3, n * 2 // 3 + 1]
+        y[spikes] = [25.0, -25.0]
+        y[n * 2 // 5:n * 2 // 5 + 50] = np.nan
+        return x, y, spikes
+
+    def test_methods_respect_the_point_budget_and_keep_extrema(self):
+        x, y, spikes = self.series()
+        for method in ('lttb', 'minmax', 'm4'):
+            for n_out in (500, 101, 4):
+                with self.subTest(method=method, n_out=n_out):
+                    indices = downsample_indices(x, y, n_out, method)
+                    self.assertLessEqual(len(indices), n_out)
+                    self.assertTrue((np.diff(indices) > 0).all())
+                    self.assertTrue(np.isin(spikes, indices).all())
+
+    def test_bucket_methods_keep_every_bucket_extreme(self):
+        _, y, _ = self.series(10_000)
+        for indices, buckets in ((minmax_indices(y, 100), 50), (m4_indices(y, 100), 25)):
+            width = -(-len(y) // buckets)
+            for bucket in range(buckets):
+                part = y[bucket * width:(bucket + 1) * width]
+                picked = y[indices[(indices >= bucket * width) & (indices < (bucket + 1) * width)]]
+                self.assertEqual(np.nanmax(picked), np.nanmax(part))
+                self.assertEqual(np.nanmin(picked), np.nanmin(part))
+
+    def test_lttb_keeps_the_end_points(self):
+        x, y, _ = self.series(5000)
+        indices = lttb_indices(x, y, 200)
+        self.assertEqual((len(indices), indices[0], indices[-1]), (200, 0, 4999))
+        np.testing.assert_array_equal(lttb_indices(x[:150], y[:150], 200), np.arange(150))  # Short series are kept whole
+
+    def test_text_x_is_downsampled_on_row_positions(self):
+        x = np.array([f'2024-01-01 {hour:02d}:{minute:02d}' for hour in range(24) for minute in range(60)], dtype=object)
+        frame = pd.DataFrame({'Chiller 1 Power': np.sin(np.arange(len(x)) / 50)})
+        frame.loc[700, 'Chiller 1 Power'] = 5.0
+        for method in ('lttb', 'minmax', 'm4'):
+            with self.subTest(method=method):
+                (xs, ys), = downsample_columns(x, frame, ['Chiller 1 Power'], 100, method).values()
+                self.assertLessEqual(len(xs), 100)
+                positions = [int(hour) * 60 + int(minute) for hour, minute in (value[-5:].split(':') for value in xs)]
+                np.testing.assert_array_equal(ys, frame['Chiller 1 Power'].to_numpy()[positions])
+                self.assertIn(x[700], xs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from benchmarks.generate import chiller_frame
+from columnar import ColumnarDataset, write_columnar
+from export import export_frames, parse_export_args, stream_csv
+from ingest import normalize_frame
+from rollups import Rollups
+
+
+class ExportChunkingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.frame = normalize_frame(chiller_frame(1000, gaps=2))
+        write_columnar(self.frame, os.path.join(directory.name, 'dataset'))
+        self.dataset = ColumnarDataset(os.path.join(directory.name, 'dataset'))
+        chunk_rows = mock.patch('export.EXPORT_CHUNK_ROWS', 64)
+        chunk_rows.start()
+        self.addCleanup(chunk_rows.stop)
+
+    def export(self, args, rollups=None):
+        return list(export_frames(self.dataset, parse_export_args(args, self.dataset), rollups))
+
+    def test_raw_export_is_chunked_and_complete(self):
+        args = {'columns': 'Chiller 1 Power,Chiller 2 Water Ret T', 'start': '2023-07-22 05:30', 'end': '2023-08-30'}
+        chunks = self.export(args)
+        expected = self.frame.loc[pd.Timestamp(args['start']):pd.Timestamp(args['end']), ['Chiller 1 Power', 'Chiller 2 Water Ret T']]
+        self.assertEqual([len(chunk) for chunk in chunks[:-1]], [64] * (len(chunks) - 1))
+        self.assertLessEqual(len(chunks[-1]), 64)
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected, check_freq=False)
+        csv = pd.read_csv(io.BytesIO(b''.join(stream_csv(iter(chunks)))), index_col=0, parse_dates=True)
+        self.assertEqual(len(csv), len(expected))  # One header, however many chunks
+        self.assertEqual(list(csv.columns), list(expected.columns))
+
+    def test_rolled_up_export_is_chunked(self):
+        rollups = Rollups.build(self.frame)
+        chunks = self.export({'granularity': 'hourly', 'columns': 'Chiller 1 Power'}, rollups)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+        table = pd.concat(chunks)
+        pd.testing.assert_series_equal(table['Chiller 1 Power energy_kwh'], rollups.series('hourly', 'Chiller 1 Power', 'energy'),
+                                       check_names=False, check_freq=False)
+
+    def test_empty_range_still_streams_the_header(self):
+        chunks = self.export({'start': '2030-01-01'})
+        self.assertEqual([len(chunk) for chunk in chunks], [0])
+        self.assertEqual(b''.join(stream_csv(iter(chunks))).decode().strip().split(','), ['Date/Time'] + self.dataset.columns)
+
+    def test_invalid_options_are_rejected(self):
+        for args in ({'format': 'xml'}, {'granularity': 'yearly'}, {'columns': 'Nope'}, {'start': 'not a time'}):
+            with self.subTest(args=args), self.assertRaises(ValueError):
+                parse_export_args(args, self.dataset)
+
+
+if __name__ == '__main__':
+    unittest.main()
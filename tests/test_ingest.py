@@ -0,0 +1,32 @@
+import unittest
+import pandas as pd
+from ingest import merge_append, normalize_frame
+
+
+class MergeAppendTest(unittest.TestCase):
+    def raw(self, timestamps, values):
+        return pd.DataFrame({'Date/Time': [f'{stamp:%m/%d/%Y %H:%M:%S}' for stamp in timestamps],
+                             'Chiller 1 Power': values})
+
+    def test_merge_matches_a_full_reingest(self):
+        old = self.raw(pd.date_range('2024-01-01', periods=48, freq='h'), range(48))
+        # Overlaps the old data and repeats some of its own timestamps, out of order
+        stamps = list(pd.date_range('2024-01-02 12:00', periods=24, freq='h'))
+        stamps += [stamps[3], stamps[20], pd.Timestamp('2024-01-02 13:00')]
+        new = self.raw(stamps, [1000 + i for i in range(len(stamps))])
+        merged, changed_from, changed_row = merge_append(normalize_frame(old), normalize_frame(new))
+        reingested = normalize_frame(pd.concat([old, new], ignore_index=True))
+        reingested = reingested[~reingested.index.duplicated(keep='last')]
+        self.assertTrue(merged.index.is_unique)
+        pd.testing.assert_frame_equal(merged, reingested)
+        self.assertEqual(merged.loc['2024-01-02 13:00', 'Chiller 1 Power'], 1026)  # The last repeat wins
+        self.assertEqual((changed_from, changed_row), (pd.Timestamp('2024-01-02 12:00'), 36))
+
+    def test_merge_needs_timestamps(self):
+        frame = normalize_frame(pd.DataFrame({'Chiller 1 Power': [1, 2]}))
+        with self.assertRaises(ValueError):
+            merge_append(frame, frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
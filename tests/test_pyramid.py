@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from benchmarks.generate import chiller_frame
+from ingest import merge_append, normalize_frame
+from pyramid import PYRAMID_SCAN_LIMIT, STATS, Pyramid
+
+
+class PyramidUpdateTest(unittest.TestCase):
+    def assert_same_pyramid(self, updated, built):
+        self.assertEqual(updated.sizes, built.sizes)
+        for depth, level in enumerate(built.levels):
+            self.assertEqual(list(updated.levels[depth]), list(level))
+            for col, stats in level.items():
+                for stat in STATS:
+                    np.testing.assert_array_equal(updated.levels[depth][col][stat], stats[stat], err_msg=f'{depth} {col} {stat}')
+
+    def append(self, existing_rows, new_rows, overlap, seed=1):
+        full = normalize_frame(chiller_frame(existing_rows + new_rows - overlap, gaps=3))
+        existing = full.iloc[:existing_rows]
+        new = normalize_frame(chiller_frame(existing_rows + new_rows - overlap, gaps=3, seed=seed)).iloc[existing_rows - overlap:]
+        new.iloc[::7, 0] = np.nan  # Missing readings inside the new rows
+        return existing, merge_append(existing, new)
+
+    def test_update_matches_a_full_build(self):
+        # Short appends, appends that replace earlier rows, and data outgrowing the previous levels
+        for existing_rows, new_rows, overlap in ((5000, 37, 0), (5000, 3000, 1234), (600, 40000, 5), (10, 10, 10)):
+            with self.subTest(existing_rows=existing_rows, new_rows=new_rows, overlap=overlap):
+                existing, (merged, _, changed_row) = self.append(existing_rows, new_rows, overlap)
+                self.assert_same_pyramid(Pyramid.build(existing).update(merged, changed_row), Pyramid.build(merged))
+
+    def test_envelope_fits_the_budget_and_keeps_extrema(self):
+        frame = normalize_frame(chiller_frame(PYRAMID_SCAN_LIMIT * 2))
+        frame.iloc[12345, 0] = 10_000.0
+        pyramid = Pyramid.build(frame)
+        for lo, hi, budget in ((0, len(frame), 500), (1001, 90001, 500), (12000, 13000, 100)):
+            positions, values = pyramid.envelope(pyramid.level_for(hi - lo, budget), frame.columns[0], lo, hi)
+            self.assertLessEqual(len(positions), budget)
+            self.assertIn(12345, positions)
+            self.assertEqual(values.min(), frame.iloc[lo:hi, 0].min())
+
+
+if __name__ == '__main__':
+    unittest.main()
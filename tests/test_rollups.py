@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+import pandas as pd
+from benchmarks.generate import chiller_frame
+from ingest import merge_append, normalize_frame
+from rollups import ROLLUP_PERIODS, Rollups
+
+
+class RollupsUpdateTest(unittest.TestCase):
+    def test_update_matches_a_full_build(self):
+        full = normalize_frame(chiller_frame(4 * 24 * 120, gaps=4, freq='15min'))
+        # Appends starting mid-hour, at midnight on the first of a month, and replacing the last weeks of data
+        first_of_month = int(full.index.searchsorted(pd.Timestamp('2023-09-01')))
+        for existing_rows, overlap in ((4 * 24 * 40 + 7, 0), (first_of_month, 0), (4 * 24 * 100, 4 * 24 * 20)):
+            with self.subTest(existing_rows=existing_rows, overlap=overlap):
+                existing = full.iloc[:existing_rows]
+                new = full.iloc[existing_rows - overlap:].copy()
+                new.iloc[:overlap, 0] += 100  # Replaced rows change the sums of their buckets
+                new.iloc[::11, 1] = np.nan
+                merged, changed_from, _ = merge_append(existing, new)
+                updated, built = Rollups.build(existing).update(merged, changed_from), Rollups.build(merged)
+                self.assertEqual(updated.columns, built.columns)
+                for name in ROLLUP_PERIODS:
+                    pd.testing.assert_frame_equal(updated.tables[name], built.tables[name], check_freq=False, obj=name)
+
+    def test_update_picks_up_columns_of_an_appended_file(self):
+        full = normalize_frame(chiller_frame(24 * 60))
+        existing = full.drop(columns=['Chiller 2 Power']).iloc[:24 * 30]
+        merged, changed_from, _ = merge_append(existing, full.iloc[24 * 30:])
+        updated, built = Rollups.build(existing).update(merged, changed_from), Rollups.build(merged)
+        self.assertIn('Chiller 2 Power', updated.columns)
+        pd.testing.assert_series_equal(updated.series('daily', 'Chiller 2 Power', 'mean'), built.series('daily', 'Chiller 2 Power', 'mean'),
+                                       check_freq=False)
+
+    def test_series_derive_means_and_energy(self):
+        index = pd.date_range('2024-01-01', periods=48, freq='30min', name='Date/Time')
+        frame = pd.DataFrame({'Chiller 1 Power': np.arange(48, dtype='float64'),
+                              'Chiller 1 Water Supply T': np.full(48, 7.0)}, index=index)
+        frame.iloc[3, 1] = np.nan
+        rollups = Rollups.build(frame)
+        np.testing.assert_allclose(rollups.series('daily', 'Chiller 1 Power', 'energy'), [np.arange(48).sum() * 0.5])
+        np.testing.assert_allclose(rollups.series('hourly', 'Chiller 1 Water Supply T', 'mean'), np.full(24, 7.0))
+        self.assertEqual(rollups.series('hourly', 'Chiller 1 Water Supply T', 'count').iloc[1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
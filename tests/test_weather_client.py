@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+import requests
+from weather_client import WeatherClient
+
+# Local stand-in for the Visual Crossing timeline API. Requests to /<location>/<start>/<end>
+# answer with one day per date; responses queued in `script` (status, headers, delay) are
+# served first, in order. Every request and the peak number of concurrent ones are recorded.
+class StubServer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.script = []
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle(self, handler):
+        with self._lock:
+            self.requests.append(handler.path.split('?')[0])
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            status, headers, delay = self.script.pop(0) if self.script else (200, {}, self.delay)
+        try:
+            time.sleep(delay)
+            _, _, start, end = handler.path.split('?')[0].rsplit('/', 3)
+            days = []
+            day = date.fromisoformat(start)
+            while day <= date.fromisoformat(end):
+                days.append({'datetime': day.isoformat(), 'temp': 30.0})
+                day += timedelta(days=1)
+            body = json.dumps({'days': days} if status == 200 else {'error': status}).encode()
+            handler.send_response(status)
+            for name, value in headers.items():
+                handler.send_header(name, value)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up on a delayed response
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WeatherClientTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubServer()
+        self.addCleanup(self.stub.close)
+
+    def client(self, **options):
+        options = {'api_key': 'test', 'rate_limit': 0, 'backoff_base': 0.01, 'backoff_max': 0.2, **options}
+        return WeatherClient(base_url=self.stub.base_url, **options)
+
+    def test_long_ranges_are_split_into_windows(self):
+        days = self.client(window_days=31).fetch_days('Hyderabad, India', '2024-01-01', '2024-03-10')
+        self.assertEqual(sorted(self.stub.requests), ['/Hyderabad%2C%20India/2024-01-01/2024-01-31',
+                                                      '/Hyderabad%2C%20India/2024-02-01/2024-03-02',
+                                                      '/Hyderabad%2C%20India/2024-03-03/2024-03-10'])
+        self.assertEqual([day['datetime'] for day in days],
+                         [(date(2024, 1, 1) + timedelta(days=i)).isoformat() for i in range(70)])
+
+    def test_429_waits_for_retry_after(self):
+        self.stub.script = [(429, {'Retry-After': '1'}, 0.0)]
+        started = time.monotonic()
+        days = self.client().fetch_days('Pune', '2024-01-01', '2024-01-05')
+        self.assertEqual(len(days), 5)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)  # Retry-After, capped at backoff_max
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.stub.script = [(503, {}, 0.0), (500, {}, 0.0)]
+        days = self.client().fetch_days('Pune', '2024-01-01', '2024-01-03')
+        self.assertEqual(len(days), 3)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_persistent_server_errors_raise(self):
+        self.stub.script = [(502, {}, 0.0)] * 3
+        with self.assertRaises(requests.exceptions.HTTPError) as raised:
+            self.client(max_retries=2).fetch_days('Pune', '2024-01-01', '2024-01-03')
+        self.assertEqual(raised.exception.response.status_code, 502)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_slow_responses_time_out_and_are_retried(self):
+        self.stub.script = [(200, {}, 1.0)]
+        days = self.client(timeout=(1, 0.2)).fetch_days('Pune', '2024-01-01', '2024-01-02')
+        self.assertEqual(len(days), 2)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.stub.script = [(200, {}, 1.0)]
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client(timeout=(1, 0.2), max_retries=0).fetch_days('Pune', '2024-01-01', '2024-01-02')
+
+    def test_concurrent_windows_respect_the_cap(self):
+        self.stub.delay = 0.1
+        days = self.client(window_days=1, max_concurrency=2).fetch_days('Pune', '2024-01-01', '2024-01-08')
+        self.assertEqual(len(days), 8)
+        self.assertEqual(self.stub.max_active, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+from weather_store import WEATHER_EMPTY_TTL, WeatherStore
+
+
+def weather_day(day, size=100):
+    return {'datetime': day.isoformat(), 'temp': 20.0, 'conditions': 'x' * size}
+
+
+class WeatherStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'weather.sqlite3')
+        self.now = 1_700_000_000.0
+        clock = mock.patch('weather_store.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.calls = []
+
+    def store(self, **options):
+        store = WeatherStore(self.path, **{'max_age': 0, 'max_bytes': 2**20, **options})
+        self.addCleanup(store._connect().close)
+        return store
+
+    # fetch callback answering every day of the range except those in `gaps`
+    def fetch(self, gaps=(), size=100):
+        def fetch(location, start_date, end_date):
+            self.calls.append((location, start_date, end_date))
+            start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+            return [weather_day(start + timedelta(days=i), size) for i in range((end - start).days + 1)
+                    if start + timedelta(days=i) not in gaps]
+        return fetch
+
+    def test_only_missing_days_are_fetched(self):
+        store = self.store()
+        store.fetch_range('here', '2024-01-05', '2024-01-10', self.fetch())
+        days = store.fetch_range('here', '2024-01-01', '2024-01-12', self.fetch())['days']
+        self.assertEqual(self.calls[1:], [('here', '2024-01-01', '2024-01-04'), ('here', '2024-01-11', '2024-01-12')])
+        self.assertEqual(len(days), 12)
+
+    def test_days_the_api_did_not_return_are_asked_for_after_a_ttl(self):
+        store = self.store()
+        gap = date(2024, 1, 3)
+        days = store.fetch_range('here', '2024-01-01', '2024-01-05', self.fetch(gaps={gap}))['days']
+        self.assertNotIn(gap.isoformat(), [day['datetime'] for day in days])
+        store.fetch_range('here', '2024-01-01', '2024-01-05', self.fetch())
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(store.stats()['days'], 4)
+        self.now += WEATHER_EMPTY_TTL + 1
+        self.assertEqual(store.missing_ranges('here', '2024-01-01', '2024-01-05', today=date(2024, 6, 1)), [(gap, gap)])
+
+    def test_a_store_larger_than_max_bytes_keeps_what_it_fetched(self):
+        store = self.store(max_bytes=3000)
+        store.fetch_range('old', '2024-01-01', '2024-01-05', self.fetch())
+        self.now += 10
+        days = store.fetch_range('new', '2024-02-01', '2024-02-28', self.fetch())['days']
+        self.assertEqual(len(days), 28)
+        self.assertEqual(store.get_days('old', '2024-01-01', '2024-01-05'), [])  # Older days made room
+        store.fetch_range('new', '2024-02-01', '2024-02-28', self.fetch())
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
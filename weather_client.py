@@ -0,0 +1,209 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from lazy_modules import LazyModule
+from metrics import upstream_call
+from weather_store import WEATHER_DB_PATH
+
+requests = LazyModule('requests')
+
+# Constants
+WEATHER_API_BASE_URL = os.environ.get('WEATHER_API_BASE_URL',
+                                      'https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline')
+WEATHER_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+WEATHER_MAX_RETRIES = 4
+WEATHER_BACKOFF_BASE = 0.5  # Seconds before the first retry, doubled on every further attempt
+WEATHER_BACKOFF_MAX = 30
+WEATHER_WINDOW_DAYS = int(os.environ.get('WEATHER_WINDOW_DAYS', '31'))  # Long ranges are split into windows of this many days
+WEATHER_MAX_CONCURRENCY = int(os.environ.get('WEATHER_MAX_CONCURRENCY', '4'))
+WEATHER_RATE_LIMIT = float(os.environ.get('WEATHER_RATE_LIMIT', '5'))  # Requests per second across all sites and processes; 0 for no limit
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Splits an inclusive 'YYYY-MM-DD' date range into consecutive windows of at most window_days days
+def split_date_range(start_date, end_date, window_days=WEATHER_WINDOW_DAYS):
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end + timedelta(days=1)
+    return windows
+
+# Weather sites from 'Name=Location;Name=Location' (an entry without '=' is named after its
+# location), as dicts with a URL-safe id, the display name and the location sent to the API
+def parse_weather_sites(spec):
+    sites = []
+    for entry in filter(None, (part.strip() for part in spec.split(';'))):
+        name, _, location = entry.partition('=') if '=' in entry else (entry, '', entry)
+        site_id = re.sub(r'[^a-z0-9]+', '-', name.strip().lower()).strip('-')
+        if site_id and location.strip() and site_id not in {site['id'] for site in sites}:
+            sites.append({'id': site_id, 'name': name.strip(), 'location': location.strip()})
+    return sites
+
+# Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+# Request budget shared by every process on the host: the next free request start is one row of
+# a SQLite file, reserved in an immediate (write-locking) transaction, so server workers and job
+# processes together stay within one rate
+class SharedRateBudget:
+    def __init__(self, path, interval, name='weather'):
+        self.path = path
+        self.interval = interval  # Seconds between request starts
+        self.name = name
+        self._local = threading.local()
+        self._connect().execute('CREATE TABLE IF NOT EXISTS rate_budget (name TEXT PRIMARY KEY, next_start REAL NOT NULL)')
+
+    # One autocommit connection per thread, so reserve controls its own transaction
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # Reserves the next request start (a time.time() value) and returns it
+    def reserve(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT next_start FROM rate_budget WHERE name = ?', (self.name,)).fetchone()
+            start = max(row[0] if row else 0.0, time.time())
+            conn.execute('INSERT OR REPLACE INTO rate_budget (name, next_start) VALUES (?, ?)', (self.name, start + self.interval))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return start
+
+# Visual Crossing timeline client: one pooled keep-alive session, strict timeouts, exponential
+# backoff with jitter that honors Retry-After, and long ranges fetched as concurrent windows.
+# Requests share a concurrency cap and, after a 429, a common pause, so parallel windows (of
+# one or several sites) back off together instead of hammering the rate limit. Their rate is
+# capped by a SharedRateBudget across all processes using the same budget file.
+class WeatherClient:
+    def __init__(self, base_url=WEATHER_API_BASE_URL, api_key=None, max_concurrency=WEATHER_MAX_CONCURRENCY,
+                 window_days=WEATHER_WINDOW_DAYS, timeout=WEATHER_TIMEOUT, max_retries=WEATHER_MAX_RETRIES,
+                 backoff_base=WEATHER_BACKOFF_BASE, backoff_max=WEATHER_BACKOFF_MAX, rate_limit=WEATHER_RATE_LIMIT,
+                 budget_path=WEATHER_DB_PATH):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.window_days = window_days
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self._session = None  # Created on first use, so constructing a client does not import requests
+        self._session_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='weather')
+        self._pause_lock = threading.Lock()
+        self._pause_until = 0.0
+        self._budget = SharedRateBudget(budget_path, 1 / rate_limit) if rate_limit > 0 else None
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+            return self._session
+
+    # Daily observations for an inclusive date range, as the list under the API's 'days' key.
+    # progress(done, total) is called as windows complete, in order.
+    def fetch_days(self, location, start_date, end_date, progress=None):
+        days, = self.fetch_many([(location, start_date, end_date)], progress)
+        if isinstance(days, Exception):
+            raise days
+        return days
+
+    # Daily observations for several (location, start_date, end_date) ranges at once, e.g. the
+    # missing ranges of every site. The windows of all ranges run concurrently under the shared
+    # limits. Returns one entry per range: its list of days, or the exception that failed it.
+    def fetch_many(self, ranges, progress=None):
+        windows = [(i, location, *window) for i, (location, start_date, end_date) in enumerate(ranges)
+                   for window in split_date_range(start_date, end_date, self.window_days)]
+
+        def fetch(window):
+            try:
+                return self._fetch_window(*window[1:])
+            except Exception as e:  # Reported for its range; the other ranges still complete
+                return e
+        outcomes = self._executor.map(fetch, windows) if len(windows) != 1 else [fetch(windows[0])]
+        results = [[] for _ in ranges]
+        for done, (window, days) in enumerate(zip(windows, outcomes), 1):
+            if isinstance(days, Exception):
+                results[window[0]] = days
+            elif not isinstance(results[window[0]], Exception):
+                results[window[0]].extend(days)
+            if progress:
+                progress(done, len(windows))
+        return results
+
+    def _fetch_window(self, location, start_date, end_date):
+        url = f'{self.base_url}/{requests.utils.quote(location)}/{start_date}/{end_date}'
+        params = {'key': self.api_key or os.environ.get('WEATHER_API_KEY', ''), 'unitGroup': 'metric', 'include': 'days'}
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pause()
+            self._wait_for_budget()
+            try:
+                with self._slots:
+                    started = time.perf_counter()
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                upstream_call('weather', time.perf_counter() - started, str(response.status_code))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                upstream_call('weather', time.perf_counter() - started, e.__class__.__name__)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = retry_after_seconds(response)
+                delay = self._backoff(attempt) if delay is None else min(delay, self.backoff_max)
+                if response.status_code == 429:
+                    self._pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json().get('days', [])
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _pause(self, seconds):
+        with self._pause_lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    # Reserves the next request start of the shared rate budget and sleeps until it
+    def _wait_for_budget(self):
+        if self._budget is not None:
+            time.sleep(max(self._budget.reserve() - time.time(), 0.0))
+
+    def _wait_for_pause(self):
+        remaining = self._pause_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
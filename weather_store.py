@@ -0,0 +1,161 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from metrics import cache_lookup, registry
+
+# Constants
+WEATHER_DB_PATH = os.environ.get('WEATHER_DB_PATH', os.path.join(tempfile.gettempdir(), 'data_tool_weather.sqlite3'))
+WEATHER_RECENT_TTL = 3600  # Seconds before today's (still changing) observations are fetched again
+WEATHER_EMPTY_TTL = 6 * 3600  # Seconds before days the API returned nothing for are asked for again
+WEATHER_MAX_AGE = float(os.environ.get('WEATHER_CACHE_MAX_AGE', str(90 * 86400)))  # Seconds a fetched day is kept; 0 for no limit
+WEATHER_MAX_BYTES = int(float(os.environ.get('WEATHER_CACHE_MAX_MB', '64')) * 2**20)  # Oldest fetched days are evicted beyond this
+WEATHER_EVICT_TO = 0.9  # Size eviction frees space down to this fraction of WEATHER_MAX_BYTES
+
+def _as_date(value):
+    return value if isinstance(value, date) else datetime.strptime(value, '%Y-%m-%d').date()
+
+# Persistent per-day weather store shared by all worker processes through one SQLite file.
+# Days are keyed by location, so a request for any range only fetches the days that are
+# missing (as few contiguous sub-ranges as possible) and merges them with stored ones.
+# Past days never change; today is refreshed after WEATHER_RECENT_TTL. Days of a fetched range
+# that the API did not return are stored as empty markers and asked for again only after
+# WEATHER_EMPTY_TTL. Days fetched more than max_age ago are dropped, and beyond max_bytes of
+# payloads the days fetched longest ago go first, so the file stops growing (SQLite reuses the
+# freed pages); days written by the current store are never evicted by it. Dropped days are
+# simply fetched again when a range needs them.
+class WeatherStore:
+    def __init__(self, path=WEATHER_DB_PATH, max_age=WEATHER_MAX_AGE, max_bytes=WEATHER_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS weather_days ('
+                         'location TEXT NOT NULL, day TEXT NOT NULL, payload TEXT NOT NULL, fetched_at REAL NOT NULL, '
+                         'PRIMARY KEY (location, day))')
+            conn.execute('CREATE INDEX IF NOT EXISTS weather_days_fetched_at ON weather_days (fetched_at)')
+
+    # One connection per thread; WAL lets readers in other processes proceed during writes
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get_days(self, location, start_date, end_date):
+        rows = self._connect().execute(
+            "SELECT payload FROM weather_days WHERE location = ? AND day BETWEEN ? AND ? AND payload != '' ORDER BY day",
+            (location, _as_date(start_date).isoformat(), _as_date(end_date).isoformat())).fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+    # Stores the days fetched for [start_date, end_date]; dates of the range missing from days get
+    # an empty marker. Rows stored at or after `now` (the start of the current store) stay put
+    # when the size limit is enforced, so a store larger than max_bytes keeps what it fetched.
+    def put_days(self, location, days, start_date=None, end_date=None, now=None):
+        stored_at = time.time()
+        now = now or stored_at
+        rows = {day['datetime']: json.dumps(day) for day in days}
+        if start_date is not None and end_date is not None:
+            day, end_date = _as_date(start_date), _as_date(end_date)
+            while day <= end_date:
+                rows.setdefault(day.isoformat(), '')
+                day += timedelta(days=1)
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO weather_days (location, day, payload, fetched_at) VALUES (?, ?, ?, ?)',
+                             [(location, day, payload, stored_at) for day, payload in rows.items()])
+            self._prune(conn, now)
+
+    # Drops days fetched more than max_age ago, then the longest-fetched ones beyond max_bytes,
+    # leaving the rows stored since `now`
+    def _prune(self, conn, now):
+        if self.max_age > 0:
+            self._record_evictions('age', conn.execute('DELETE FROM weather_days WHERE fetched_at < ?',
+                                                       (now - self.max_age,)).rowcount)
+        total = conn.execute('SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM weather_days').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess, evicted = total - self.max_bytes * WEATHER_EVICT_TO, []
+        for rowid, size in conn.execute('SELECT rowid, LENGTH(payload) FROM weather_days WHERE fetched_at < ? ORDER BY fetched_at',
+                                        (now,)):
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        conn.executemany('DELETE FROM weather_days WHERE rowid = ?', evicted)
+        self._record_evictions('size', len(evicted))
+
+    def _record_evictions(self, reason, count):
+        if count > 0:
+            registry.inc('data_tool_cache_evictions_total', count, cache='weather', reason=reason)
+
+    # Contiguous (start, end) date ranges within [start_date, end_date] that have to be fetched
+    def missing_ranges(self, location, start_date, end_date, today=None):
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        today = today or date.today()
+        now, fresh = time.time(), set()
+        for day, empty, fetched_at in self._connect().execute(
+                "SELECT day, payload = '', fetched_at FROM weather_days WHERE location = ? AND day BETWEEN ? AND ?",
+                (location, start_date.isoformat(), end_date.isoformat())):
+            # Past days are final; today and days the API had nothing for are asked for again later
+            ttl = WEATHER_RECENT_TTL if _as_date(day) >= today else WEATHER_EMPTY_TTL if empty else None
+            if ttl is None or fetched_at >= now - ttl:
+                fresh.add(day)
+        ranges, run_start, day = [], None, start_date
+        while day <= end_date:
+            if day.isoformat() in fresh:
+                if run_start is not None:
+                    ranges.append((run_start, day - timedelta(days=1)))
+                    run_start = None
+            elif run_start is None:
+                run_start = day
+            day += timedelta(days=1)
+        if run_start is not None:
+            ranges.append((run_start, end_date))
+        return ranges
+
+    # Stored locations, days and payload bytes, for /cache-stats
+    def stats(self):
+        locations, days, size = self._connect().execute(
+            "SELECT COUNT(DISTINCT location), COALESCE(SUM(payload != ''), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM weather_days").fetchone()
+        return {'backend': 'sqlite', 'path': self.path, 'locations': locations, 'days': days, 'bytes': size,
+                'max_bytes': self.max_bytes, 'max_age': self.max_age}
+
+    # fetch_range for several locations at once: fetch_many([(location, start, end), ...]) gets
+    # the missing days of all of them in one call (so they can be fetched concurrently) and
+    # returns a list of days or an exception per range. Returns {location: {'days': [...]}},
+    # with the exception instead for a location whose fetch failed.
+    def fetch_ranges(self, locations, start_date, end_date, fetch_many):
+        missing = [(location, missing_start.isoformat(), missing_end.isoformat()) for location in dict.fromkeys(locations)
+                   for missing_start, missing_end in self.missing_ranges(location, start_date, end_date)]
+        for location in dict.fromkeys(locations):
+            cache_lookup('weather', all(entry[0] != location for entry in missing))
+        failed = self._put_fetched(missing, fetch_many(missing)) if missing else {}
+        return {location: failed.get(location) or {'days': self.get_days(location, start_date, end_date)}
+                for location in locations}
+
+    # Stores the days fetched for each (location, start, end) range, so they are released before
+    # the ranges are read back; returns {location: exception} for the failed ones
+    def _put_fetched(self, ranges, outcomes):
+        failed, now = {}, time.time()
+        for (location, start_date, end_date), days in zip(ranges, outcomes):
+            if isinstance(days, Exception):
+                failed.setdefault(location, days)
+            else:
+                self.put_days(location, days, start_date, end_date, now)
+        return failed
+
+    # Returns {'days': [...]} for the range like the Visual Crossing API, calling
+    # fetch(location, start_date, end_date) -> list of day dicts only for missing days
+    def fetch_range(self, location, start_date, end_date, fetch):
+        missing = self.missing_ranges(location, start_date, end_date)
+        cache_lookup('weather', not missing)
+        now = time.time()
+        for missing_start, missing_end in missing:
+            self.put_days(location, fetch(location, missing_start.isoformat(), missing_end.isoformat()), missing_start, missing_end, now)
+        return {'days': self.get_days(location, start_date, end_date)}